@@ -0,0 +1,36 @@
+"""节点代理独立入口 - 不启动Web服务，只读取本机bot日志并把状态和配置变化上报到中心后端
+
+用法:
+    CENTRAL_URL=ws://central:8000/ws/agent CENTRAL_TOKEN=<令牌> NODE_NAME=host-b python -m app.agent
+中心的 .env 中设置 AGENT_TOKENS={"host-b": "<令牌>"}
+"""
+import asyncio
+
+from app.config import settings
+
+
+async def _main():
+    from app.services.config_service import config_service
+    from app.services.node_agent import node_agent
+    from app.services.restart_orchestrator import restart_orchestrator
+    from app.services.docker_service import docker_service
+
+    if not settings.central_url:
+        print("[Agent] 未设置CENTRAL_URL")
+        return
+    config_service.start_watcher()
+    node_agent.start(poll=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await node_agent.stop()
+        config_service.stop_watcher()
+        await restart_orchestrator.shutdown()
+        await docker_service.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,6 @@
 """应用配置管理"""
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -22,11 +22,130 @@ class Settings(BaseSettings):
     
     # 数据库
     database_url: str = "sqlite:///./app.db"
-    
+    db_pool_size: int = 5  # 异步连接池常驻连接数
+    db_max_overflow: int = 10  # 连接池允许的额外连接数
+    db_pool_timeout: int = 10  # 从连接池获取连接的超时时间（秒）
+    db_busy_timeout_ms: int = 5000  # SQLite写锁忙等待超时（毫秒）
+
     # 文件路径
     config_file_path: str = "./config.json"
     logs_directory: str = "./logs"
     
+    # WebSocket状态广播周期（秒）
+    ws_broadcast_interval: float = 10.0
+    ws_broadcast_min_interval: float = 1.0  # 配置或日志变化触发广播的最短间隔（秒），频繁写日志时合并为一次
+    ws_queue_size: int = 64  # 每个连接的发送队列上限，超出后丢弃积压并改发最新快照
+    ws_send_timeout: float = 5.0  # 单条消息发送超时（秒）
+    ws_heartbeat_interval: float = 20.0  # 心跳ping间隔（秒）
+    ws_heartbeat_timeout: float = 60.0  # 超过该时间未收到客户端消息则断开（秒）
+    ws_delta_log_size: int = 500  # 保留的最近增量条数（断线重连补发用）
+    
+    # Docker Engine API
+    docker_socket_path: str = "/var/run/docker.sock"
+    docker_api_version: str = "v1.41"
+    docker_api_timeout: float = 10.0
+    compose_project: Optional[str] = None  # compose项目名，留空则只按服务名查找
+    drop_service_name: str = "drop"
+    drop_restart_timeout: int = 10  # 重启时等待容器停止的秒数
+    add_account_timeout: int = 300  # 等待bot完成授权的最长时间（秒）
+    add_account_max_jobs: int = 3  # 同时进行的添加账号任务上限
+    add_account_output_lines: int = 200  # 每个任务保留的bot输出行数
+    add_account_job_retention: int = 3600  # 已结束任务保留时长（秒）
+    add_account_kill_grace: float = 5.0  # 任务结束后等待bot进程退出的时间（秒），超时后依次发送TERM、KILL
+    config_watch_interval: float = 1.0  # 检查config.json修改的间隔（秒）
+    restart_health_timeout: int = 300  # 重启后等待账号恢复写日志的最长时间（秒）
+    restart_health_poll_interval: float = 2.0
+    restart_report_history: int = 20  # 保留的重启报告数
+    restart_window_minutes: int = 0  # 定时重启的智能窗口（分钟）：在窗口内选择观看损失最小的时刻，0表示到点立即重启
+    restart_window_step: int = 60  # 候选重启时间的间隔（秒）
+    restart_window_poll_interval: float = 60.0  # 窗口内重新评估各账号进度的间隔（秒）
+    restart_window_stale_minutes: float = 15  # 日志超过该时间未更新的账号不计入损失
+    container_stats_enabled: bool = True  # 采样drop容器的CPU/内存/网络
+    container_stats_interval: int = 60  # 降采样周期（秒）
+    container_stats_retention_days: int = 30
+    
+    # 分片模式：账号分配到多个drop容器（compose服务 {drop_service_name}-0 ... -N-1）
+    shard_count: int = 0  # 0表示不分片（单个drop容器读取config.json）
+    shards_directory: str = "./shards"  # 分片 i 的配置为 shards/i/config.json，日志目录为 shards/i/logs
+    shard_max_accounts: int = 0  # 每个分片的账号上限（0表示不限制），新账号分配到账号最少的分片
+    
+    # 观看进度时间序列
+    progress_sample_interval: int = 300  # 每个账号写入数据库的最小间隔（秒），掉宝切换或状态变化时额外记录
+    progress_flush_interval: float = 60.0  # 批量写入间隔（秒）
+    progress_rate_window: int = 30  # 计算观看速率使用的时间窗口（分钟）
+    progress_stall_minutes: int = 10  # 状态为Watching但进度超过该分钟数未增长时标记为停滞
+    progress_retention_days: int = 14
+    
+    # 挂宝时间分析
+    analytics_max_gap_minutes: float = 15  # 日志超过该时间没有更新时不再计时（bot停止或容器重启）
+    analytics_flush_interval: float = 60.0  # 写入小时汇总的间隔（秒）
+    analytics_waste_minutes: float = 30  # 常用游戏在统计范围内非观看时间超过该值且没有观看进度时标记为浪费
+    analytics_retention_days: int = 90
+    
+    # 账号异常检测
+    watchdog_enabled: bool = True
+    watchdog_check_interval: float = 60.0  # 检查日志停止更新和执行处理的间隔（秒）
+    watchdog_error_window_minutes: int = 30  # 统计进入Error次数的时间窗口（分钟）
+    watchdog_error_threshold: int = 3  # 窗口内进入Error的次数达到该值视为错误循环
+    watchdog_error_minutes: int = 15  # 持续处于Error超过该分钟数同样视为错误循环
+    watchdog_seeking_hours: float = 3  # 超过该小时数一直Seeking/Idle没有观看任何活动
+    watchdog_stale_minutes: int = 30  # 启用账号的日志超过该分钟数未更新
+    watchdog_fleet_fraction: float = 0.5  # 同类异常的账号超过该比例时视为全局问题，不逐个禁用账号
+    watchdog_remediation: Dict[str, str] = {}  # 各异常类型的处理方式 none/disable/restart，例如 {"error_loop": "disable"}
+    watchdog_restart_min_interval: int = 3600  # 因异常重启容器的最小间隔（秒）
+    watchdog_event_history: int = 200  # 保留的最近事件数
+    
+    # Webhook通知（地址为config.json的WebhookURL和webhook_urls）
+    webhook_urls: List[str] = []  # 额外的webhook地址
+    webhook_events: List[str] = ["drop_claimed", "account_error", "account_stalled", "restart_done"]
+    webhook_digest_window: float = 30.0  # 最早一条通知等待该秒数后，与期间的其他通知合并为一条摘要发送
+    webhook_digest_max: int = 20  # 每条摘要最多包含的通知数
+    webhook_endpoint_concurrency: int = 2  # 每个地址同时进行的请求数
+    webhook_timeout: float = 10.0
+    webhook_max_attempts: int = 8  # 超过该次数仍失败的通知标记为failed
+    webhook_backoff_base: float = 5.0  # 重试间隔：base * 2^(次数-1) 秒，±20%随机
+    webhook_backoff_max: float = 1800.0
+    webhook_lock_ttl: int = 120  # 发送中的通知锁有效期（秒），进程崩溃后由其他worker重发
+    webhook_poll_interval: float = 5.0
+    webhook_retention_days: int = 7  # 已发送和失败通知的保留天数
+    
+    # 多主机：本机作为节点代理，通过一个WebSocket向中心后端上报状态和配置变化
+    central_url: Optional[str] = None  # 中心后端的代理地址，例如 ws://central:8000/ws/agent，设置后启用代理
+    central_token: Optional[str] = None  # 中心的AGENT_TOKENS中为本节点配置的令牌
+    node_name: Optional[str] = None  # 节点名，默认为主机名
+    agent_batch_interval: float = 1.0  # 合并状态变化后发送的间隔（秒）
+    agent_poll_interval: float = 10.0  # 独立运行（python -m app.agent）时读取日志的间隔（秒）
+    agent_buffer_size: int = 1000  # 未确认消息的缓冲上限，超出后重连时改发完整快照
+    agent_reconnect_max: float = 60.0  # 重连退避上限（秒）
+    # 中心：允许连接的节点及其令牌，例如 {"host-b": "随机字符串"}
+    agent_tokens: Dict[str, str] = {}
+    agent_command_timeout: float = 30.0  # 等待节点执行命令（重启等）的超时（秒）
+    
+    # 定时任务（cron表达式均按服务器本地时间）
+    scheduler_tick_interval: float = 30.0  # 调度循环最长检查间隔（秒）
+    scheduler_lock_ttl: int = 120  # 任务锁有效期（秒），执行期间每1/3周期续期
+    scheduler_catch_up_grace: int = 300  # 超过触发时间该秒数视为错过，按任务的catch_up策略处理
+    scheduler_restart_cron: str = "0 4 * * *"  # 首次启动时创建的drop重启任务
+    log_archive_max_bytes: int = 20 * 1024 * 1024  # 日志超过该大小时归档
+    log_archive_keep_bytes: int = 256 * 1024  # 归档后原文件保留的末尾内容
+    log_archive_retention_days: int = 30
+    
+    # 事件循环延迟监控（调试模式，默认关闭）
+    loop_monitor_enabled: bool = False
+    loop_monitor_interval: float = 0.05  # 采样间隔（秒）
+    loop_monitor_threshold: float = 0.1  # 超过该阻塞时长时记录调用栈（秒）
+    loop_monitor_max_events: int = 50  # 保留的阻塞事件数
+    
+    # 按需性能分析
+    profiler_max_duration: float = 120.0  # 单次分析时长上限（秒）
+    profiler_sample_interval: float = 0.01  # 默认采样间隔（秒）
+    
+    # 内存诊断报告中每个账号/分配位置返回的条数
+    memory_report_top_n: int = 20
+    
+    # Prometheus指标令牌（为空时/metrics无需认证）
+    metrics_token: Optional[str] = None
+    
     # CORS
     cors_origins: list[str] = ["http://localhost:8080", "http://localhost:3000"]
     
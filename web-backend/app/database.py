@@ -1,16 +1,63 @@
 """数据库配置"""
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import settings
 
+is_sqlite = settings.database_url.startswith("sqlite")
+
+
+def _to_async_url(url: str) -> str:
+    """将同步数据库URL转换为异步驱动URL（sqlite -> sqlite+aiosqlite）"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """每个新连接设置SQLite参数：WAL模式 + NORMAL同步 + 忙等待超时"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.db_busy_timeout_ms}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+# 同步引擎（建表和尚未迁移的代码使用）
 engine = create_engine(
     settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
+    connect_args={"check_same_thread": False} if is_sqlite else {}
 )
 
+# 异步引擎（路由使用，不阻塞事件循环）
+# aiosqlite默认使用NullPool（每次新建连接），这里显式使用连接池复用连接
+async_engine = create_async_engine(
+    _to_async_url(settings.database_url),
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=True,
+    connect_args={"timeout": settings.db_busy_timeout_ms / 1000} if is_sqlite else {}
+)
+
+if is_sqlite:
+    event.listen(engine, "connect", _set_sqlite_pragma)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragma)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False：提交后仍可访问对象属性，避免异步场景下的隐式懒加载
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
@@ -22,3 +69,8 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """获取异步数据库会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
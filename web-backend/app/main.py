@@ -1,16 +1,23 @@
 """FastAPI应用入口"""
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from pathlib import Path
 from app.config import settings
-from app.database import engine, Base
-from app.routers import auth, admin, user
-import asyncio
-import json
-
-# 创建数据库表
+from app.database import engine, async_engine, Base
+from app.routers import auth, admin, user, ws
+from app.utils.metrics import MetricsMiddleware, registry
+
+# 创建数据库表（导入模型以注册到Base）
+from app.models import (  # noqa: F401
+    admin as _admin_models,
+    container_stats as _container_stats_models,
+    farming_stat as _farming_stat_models,
+    notification as _notification_models,
+    progress_sample as _progress_sample_models,
+    scheduled_job as _scheduled_job_models
+)
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
@@ -25,10 +32,43 @@ app = FastAPI(
 async def startup_event():
     """应用启动时执行"""
     print("[App] 应用启动中...")
-    # 启动定时重启任务
+    # 启动定时任务调度（重启、日志归档、会话清理）
     from app.services.scheduler_service import scheduler_service
     scheduler_service.start()
     print("[App] 定时任务已启动")
+    # 观看进度采样（在广播开始计算状态之前注册监听器）
+    from app.services.progress_tracker import progress_tracker
+    progress_tracker.start()
+    # 挂宝时间分析（按小时汇总）
+    from app.services.farming_analytics import farming_analytics
+    farming_analytics.start()
+    # 账号异常检测
+    if settings.watchdog_enabled:
+        from app.services.account_watchdog import account_watchdog
+        account_watchdog.start()
+    # Webhook通知
+    from app.services.notifier import notifier
+    notifier.start()
+    # 启动状态广播任务和WebSocket心跳
+    from app.services.status_broadcaster import status_broadcaster
+    from app.services.connection_manager import manager
+    status_broadcaster.start()
+    manager.start()
+    # 多主机：本机作为节点代理向中心上报（状态由广播周期读取日志）
+    if settings.central_url:
+        from app.services.node_agent import node_agent
+        node_agent.start()
+    # 监视config.json的外部修改（C# bot添加账号等）
+    from app.services.config_service import config_service
+    config_service.start_watcher()
+    # drop容器资源采样
+    if settings.container_stats_enabled:
+        from app.services.docker_service import docker_service
+        docker_service.start_stats_sampler()
+    # 事件循环延迟监控（可选）
+    if settings.loop_monitor_enabled:
+        from app.services.loop_monitor import loop_monitor
+        loop_monitor.start()
 
 
 @app.on_event("shutdown")
@@ -37,8 +77,36 @@ async def shutdown_event():
     print("[App] 应用关闭中...")
     # 停止定时任务
     from app.services.scheduler_service import scheduler_service
-    scheduler_service.stop()
+    await scheduler_service.stop()
     print("[App] 定时任务已停止")
+    # 停止状态广播任务和WebSocket连接
+    from app.services.status_broadcaster import status_broadcaster
+    from app.services.connection_manager import manager
+    status_broadcaster.stop()
+    manager.stop()
+    from app.services.progress_tracker import progress_tracker
+    await progress_tracker.stop()
+    from app.services.farming_analytics import farming_analytics
+    await farming_analytics.stop()
+    from app.services.account_watchdog import account_watchdog
+    await account_watchdog.stop()
+    from app.services.notifier import notifier
+    await notifier.stop()
+    from app.services.node_agent import node_agent
+    await node_agent.stop()
+    from app.services.loop_monitor import loop_monitor
+    loop_monitor.stop()
+    from app.services.config_service import config_service
+    config_service.stop_watcher()
+    # 结束进行中的添加账号任务，关闭Docker API连接
+    from app.services.add_account_jobs import add_account_jobs
+    from app.services.docker_service import docker_service
+    await add_account_jobs.shutdown()
+    from app.services.restart_orchestrator import restart_orchestrator
+    await restart_orchestrator.shutdown()
+    await docker_service.close()
+    # 关闭数据库连接池
+    await async_engine.dispose()
 
 
 # 配置CORS
@@ -50,41 +118,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求耗时指标
+app.add_middleware(MetricsMiddleware)
+
 # 注册API路由
 app.include_router(auth.router, prefix="/api/auth", tags=["认证"])
 app.include_router(admin.router, prefix="/api/admin", tags=["管理员"])
 app.include_router(user.router, prefix="/api/user", tags=["用户"])
-
-
-# WebSocket连接管理
-class ConnectionManager:
-    """WebSocket连接管理器"""
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-    
-    async def broadcast(self, message: dict):
-        """广播消息给所有连接"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                disconnected.append(connection)
-        
-        # 移除断开的连接
-        for conn in disconnected:
-            self.disconnect(conn)
-
-
-manager = ConnectionManager()
+app.include_router(ws.router, tags=["WebSocket"])
 
 
 @app.get("/api")
@@ -99,41 +140,13 @@ async def health():
     return {"status": "healthy"}
 
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket端点，实时推送状态更新"""
-    await manager.connect(websocket)
-    
-    try:
-        from app.services.config_service import config_service
-        from app.services.bot_monitor import bot_monitor
-        
-        while True:
-            # 等待客户端消息（保持连接）
-            try:
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
-                # 可以处理客户端请求
-            except asyncio.TimeoutError:
-                # 超时，发送状态更新
-                users = config_service.get_users()
-                status_updates = {}
-                
-                for user_data in users:
-                    username = user_data.get("Login")
-                    status_info = bot_monitor.get_user_status(username)
-                    status_updates[username] = {
-                        "status": status_info.get("status"),
-                        "campaign": status_info.get("campaign"),
-                        "broadcaster": status_info.get("broadcaster"),
-                        "progress": status_info.get("progress")
-                    }
-                
-                await websocket.send_json({
-                    "type": "status_update",
-                    "data": status_updates
-                })
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Prometheus指标（配置了METRICS_TOKEN时需要Bearer认证）"""
+    if settings.metrics_token:
+        if request.headers.get("authorization") != f"Bearer {settings.metrics_token}":
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的指标令牌")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 # 静态文件服务（前端）
@@ -0,0 +1,22 @@
+"""容器资源采样模型"""
+from sqlalchemy import Column, Integer, String, Float, DateTime, BigInteger
+from app.database import Base
+
+
+class ContainerStat(Base):
+    """容器资源采样表（每行是一个采样周期内的降采样结果）"""
+    __tablename__ = "container_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    timestamp = Column(DateTime(timezone=True), index=True, nullable=False)  # 周期结束时间
+    container = Column(String, nullable=False)  # compose服务名
+    samples = Column(Integer, nullable=False)  # 本周期聚合的原始采样数
+    cpu_percent = Column(Float, nullable=False)  # 平均CPU使用率（100 = 一个核心）
+    cpu_percent_max = Column(Float, nullable=False)
+    memory_bytes = Column(BigInteger, nullable=False)  # 平均内存占用（不含页缓存）
+    memory_bytes_max = Column(BigInteger, nullable=False)
+    memory_limit_bytes = Column(BigInteger)
+    net_rx_rate = Column(Float, nullable=False)  # 平均接收速率（字节/秒）
+    net_tx_rate = Column(Float, nullable=False)  # 平均发送速率（字节/秒）
+    account_count = Column(Integer, nullable=False)  # 周期结束时config.json中的账号数
+    enabled_account_count = Column(Integer, nullable=False)
@@ -0,0 +1,21 @@
+"""挂宝时间统计模型"""
+from sqlalchemy import Column, Integer, String, DateTime, Float, UniqueConstraint
+from app.database import Base
+
+
+class FarmingStat(Base):
+    """每小时挂宝时间汇总表（每个账号、游戏、Campaign每小时一行）"""
+    __tablename__ = "farming_stats"
+    __table_args__ = (UniqueConstraint("hour", "login", "game", "campaign", name="uq_farming_stats_bucket"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    hour = Column(DateTime(timezone=True), index=True, nullable=False)  # 所属小时的开始时间（UTC）
+    login = Column(String, index=True, nullable=False)
+    game = Column(String, nullable=False, default="")  # 未知时为空字符串（唯一约束中NULL互不相等）
+    campaign = Column(String, nullable=False, default="")
+    seeking_seconds = Column(Float, nullable=False, default=0)
+    watching_seconds = Column(Float, nullable=False, default=0)
+    idle_seconds = Column(Float, nullable=False, default=0)
+    error_seconds = Column(Float, nullable=False, default=0)
+    unknown_seconds = Column(Float, nullable=False, default=0)
+    credited_minutes = Column(Float, nullable=False, default=0)  # 计入掉宝进度的观看分钟数
@@ -0,0 +1,24 @@
+"""Webhook通知发件箱模型"""
+from sqlalchemy import Column, Integer, String, DateTime, Text, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class NotificationOutbox(Base):
+    """待发送和已发送的通知（每个事件在每个webhook地址上一行，时间均为UTC）"""
+    __tablename__ = "notification_outbox"
+    __table_args__ = (UniqueConstraint("endpoint", "dedup_key", name="uq_notification_outbox_dedup"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    endpoint = Column(String, index=True, nullable=False)  # webhook地址
+    event_type = Column(String, nullable=False)  # drop_claimed / account_error / account_stalled / restart_done / test
+    payload = Column(Text, nullable=False)  # JSON格式的事件
+    dedup_key = Column(String)  # 同一事件只入队一次（为空时不去重）
+    status = Column(String, index=True, nullable=False, default="pending")  # pending / sent / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), index=True)
+    locked_by = Column(String)  # 正在发送的worker（主机名:进程ID）
+    locked_until = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    sent_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
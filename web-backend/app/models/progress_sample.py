@@ -0,0 +1,18 @@
+"""观看进度采样模型"""
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from app.database import Base
+
+
+class ProgressSample(Base):
+    """观看进度采样表（每个账号每个采样周期最多一行，掉宝切换或状态变化时额外记录）"""
+    __tablename__ = "progress_samples"
+    __table_args__ = (Index("ix_progress_samples_login_timestamp", "login", "timestamp"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    timestamp = Column(DateTime(timezone=True), index=True, nullable=False)  # 日志时间（UTC）
+    login = Column(String, nullable=False)
+    status = Column(String)
+    campaign = Column(String)
+    game = Column(String)
+    current = Column(Integer, nullable=False)  # 已观看分钟数
+    required = Column(Integer, nullable=False)  # 掉宝需要的分钟数
@@ -0,0 +1,28 @@
+"""定时任务模型"""
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class ScheduledJob(Base):
+    """定时任务表（时间字段均为服务器本地时间，与cron表达式一致）"""
+    __tablename__ = "scheduled_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    task = Column(String, nullable=False)  # 注册的任务类型，如 restart_drop
+    cron = Column(String, nullable=False)
+    enabled = Column(Boolean, default=True, nullable=False)
+    jitter_seconds = Column(Integer, default=0, nullable=False)  # 在触发时间后随机延迟0~N秒
+    catch_up = Column(String, default="skip", nullable=False)  # 错过触发时间时: skip / run_once
+    args = Column(Text)  # JSON格式的任务参数
+    next_run_at = Column(DateTime, index=True)  # 含抖动的下次触发时间
+    last_run_at = Column(DateTime)
+    last_status = Column(String)  # success / failed / skipped
+    last_result = Column(Text)
+    last_error = Column(Text)
+    last_duration = Column(Float)  # 秒
+    locked_by = Column(String)  # 正在执行的worker（主机名:进程ID）
+    locked_until = Column(DateTime)  # 锁过期时间，执行期间定期续期
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
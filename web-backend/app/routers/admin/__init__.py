@@ -1,8 +1,15 @@
 # 管理员路由模块
 from fastapi import APIRouter
-from app.routers.admin import users, system
+from app.routers.admin import users, system, debug, scheduler, analytics, watchdog, notifications, shards, nodes
 
 router = APIRouter()
 
 router.include_router(users.router)
 router.include_router(system.router)
+router.include_router(debug.router)
+router.include_router(scheduler.router)
+router.include_router(analytics.router)
+router.include_router(watchdog.router)
+router.include_router(notifications.router)
+router.include_router(shards.router)
+router.include_router(nodes.router)
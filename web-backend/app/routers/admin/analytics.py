@@ -0,0 +1,85 @@
+"""挂宝时间分析路由"""
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.routers.auth import get_current_admin
+from app.models.admin import Admin
+
+router = APIRouter(prefix="/analytics")
+
+HOURS_QUERY = Query(24, gt=0, le=24 * 90, description="统计范围（小时）")
+
+
+@router.get("/summary")
+async def get_analytics_summary(
+    hours: float = HOURS_QUERY,
+    group_by: Literal["account", "game", "campaign", "account_game"] = "account",
+    login: Optional[str] = Query(None, description="只统计该账号"),
+    game: Optional[str] = Query(None, description="只统计该游戏"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    按账号/游戏/Campaign汇总各状态时间（秒）、计入进度的观看分钟数和效率（每小时计入的分钟数）
+    """
+    from app.services.farming_analytics import farming_analytics
+
+    return {
+        "hours": hours,
+        "group_by": group_by,
+        "groups": await farming_analytics.summary(hours, group_by, login, game)
+    }
+
+
+@router.get("/hourly")
+async def get_analytics_hourly(
+    hours: float = HOURS_QUERY,
+    login: Optional[str] = Query(None, description="只统计该账号"),
+    game: Optional[str] = Query(None, description="只统计该游戏"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    按小时汇总的各状态时间和计入进度的观看分钟数
+    """
+    from app.services.farming_analytics import farming_analytics
+
+    return {
+        "hours": hours,
+        "series": await farming_analytics.hourly(hours, login, game)
+    }
+
+
+@router.get("/leaderboard")
+async def get_analytics_leaderboard(
+    hours: float = Query(24 * 7, gt=0, le=24 * 90, description="统计范围（小时）"),
+    group_by: Literal["account", "game", "campaign"] = "account",
+    # seeking_share越低越好，按升序排名
+    metric: Literal["minutes_per_hour", "credited_minutes", "watching_share", "seeking_share"] = "minutes_per_hour",
+    min_hours: float = Query(1, ge=0, description="统计时长不足该小时数的不参与排名"),
+    limit: int = Query(20, ge=1, le=200),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    挂宝效率排行榜
+    """
+    from app.services.farming_analytics import farming_analytics
+
+    return {
+        "hours": hours,
+        "group_by": group_by,
+        "metric": metric,
+        "entries": await farming_analytics.leaderboard(hours, group_by, metric, min_hours, limit)
+    }
+
+
+@router.get("/favourite-games")
+async def get_favourite_games_analysis(
+    hours: float = Query(24 * 7, gt=0, le=24 * 90, description="统计范围（小时）"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    各账号常用游戏（FavouriteGames）的时间和观看进度，标记浪费时间（wasted）或从未出现（never_seen）的设置
+    """
+    from app.services.farming_analytics import farming_analytics
+
+    return await farming_analytics.favourite_games(hours)
@@ -0,0 +1,211 @@
+"""调试诊断路由"""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import PlainTextResponse
+
+from app.routers.auth import get_current_admin
+from app.models.admin import Admin
+
+router = APIRouter(prefix="/debug")
+
+
+@router.get("/loop")
+async def get_loop_report(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取事件循环延迟报告（含阻塞事件循环的调用栈）
+    """
+    from app.services.loop_monitor import loop_monitor
+
+    return loop_monitor.get_report()
+
+
+@router.post("/loop/start")
+async def start_loop_monitor(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    启动事件循环延迟监控
+    """
+    from app.services.loop_monitor import loop_monitor
+
+    loop_monitor.start()
+    return {"message": "事件循环监控已启动", "running": loop_monitor.running}
+
+
+@router.post("/loop/stop")
+async def stop_loop_monitor(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    停止事件循环延迟监控
+    """
+    from app.services.loop_monitor import loop_monitor
+
+    loop_monitor.stop()
+    return {"message": "事件循环监控已停止", "running": loop_monitor.running}
+
+
+@router.post("/loop/reset")
+async def reset_loop_monitor(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    清空事件循环监控统计
+    """
+    from app.services.loop_monitor import loop_monitor
+
+    loop_monitor.reset()
+    return {"message": "事件循环监控统计已清空"}
+
+
+@router.get("/profile")
+async def get_profile_status(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取性能分析会话状态
+    """
+    from app.services.profiler import profiler_service
+
+    return profiler_service.get_status()
+
+
+@router.post("/profile/start")
+async def start_profile(
+    mode: str = Query("sample", description="分析模式: sample（采样，折叠栈）或 cprofile（pstats）"),
+    duration: Optional[float] = Query(None, gt=0, description="时长上限（秒），超过后自动停止"),
+    interval: Optional[float] = Query(None, gt=0, description="采样间隔（秒），仅sample模式"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    开始性能分析（同一时间只允许一个会话）
+    """
+    from app.services.profiler import profiler_service, ProfilerBusyError
+
+    try:
+        return profiler_service.start(mode, duration, interval)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post("/profile/stop")
+async def stop_profile(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    停止性能分析
+    """
+    from app.services.profiler import profiler_service
+
+    return profiler_service.stop()
+
+
+@router.get("/profile/collapsed")
+async def download_collapsed_stacks(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    下载最近一次采样分析的折叠栈（flamegraph.pl / speedscope）
+    """
+    from app.services.profiler import profiler_service
+
+    text = profiler_service.get_collapsed()
+    if text is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="没有可用的采样结果")
+    return PlainTextResponse(
+        text,
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed.txt"'}
+    )
+
+
+@router.get("/profile/pstats")
+async def download_pstats(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    下载最近一次cProfile分析的pstats文件
+    """
+    from app.services.profiler import profiler_service
+
+    data = profiler_service.get_pstats()
+    if data is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="没有可用的cProfile结果")
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="profile.pstats"'}
+    )
+
+
+@router.get("/memory")
+async def get_memory_report(
+    per_user: bool = Query(True, description="是否包含每个账号的占用"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取各缓存结构的条目数和估算字节数
+    """
+    from app.services.memory_inspector import memory_inspector
+
+    return memory_inspector.get_report(per_user)
+
+
+@router.post("/memory/evict")
+async def evict_stale_users(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    清理已不在config.json中的账号的监控状态
+    """
+    from app.services.memory_inspector import memory_inspector
+
+    evicted = memory_inspector.evict_stale()
+    return {"message": f"已清理 {len(evicted)} 个账号", "evicted": evicted}
+
+
+@router.post("/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: int = Query(1, ge=1, le=25, description="记录的调用栈深度"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    开启tracemalloc
+    """
+    from app.services.memory_inspector import memory_inspector
+
+    return memory_inspector.start_tracing(frames)
+
+
+@router.post("/memory/tracemalloc/snapshot")
+async def take_tracemalloc_snapshot(
+    top: Optional[int] = Query(None, ge=1, le=200, description="返回前N项"),
+    group_by: str = Query("lineno", description="分组方式: lineno / filename / traceback"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    拍摄tracemalloc快照，并与上一次快照比较
+    """
+    from app.services.memory_inspector import memory_inspector
+
+    try:
+        return memory_inspector.take_snapshot(top, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    关闭tracemalloc
+    """
+    from app.services.memory_inspector import memory_inspector
+
+    return memory_inspector.stop_tracing()
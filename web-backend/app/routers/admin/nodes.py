@@ -0,0 +1,87 @@
+"""远程节点路由（多主机：中心汇总各节点代理上报的账号）"""
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.config import settings
+from app.routers.auth import get_current_admin
+from app.models.admin import Admin
+
+router = APIRouter(prefix="/nodes")
+
+
+@router.get("")
+async def get_nodes(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    已连接过的远程节点（连接状态、最后应用的序号、账号数和状态统计），以及本机作为节点代理的状态
+    """
+    from app.services.remote_fleet import remote_fleet
+    from app.services.node_agent import node_agent
+
+    return {
+        "allowed_nodes": sorted(settings.agent_tokens),
+        "nodes": remote_fleet.get_nodes(),
+        "agent": node_agent.get_status()
+    }
+
+
+@router.get("/{node}")
+async def get_node(
+    node: str,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    节点详情：账号、全局配置和最近下发的命令
+    """
+    from app.services.remote_fleet import remote_fleet
+
+    info = remote_fleet.get_node(node)
+    if info is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="节点不存在"
+        )
+    return info
+
+
+@router.post("/{node}/restart")
+async def restart_node(
+    node: str,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    让节点重启它的drop容器（在节点上执行健康检查式重启），等待节点回复结果
+    """
+    from app.services.remote_fleet import remote_fleet, NodeOfflineError
+
+    try:
+        result = await remote_fleet.call(node, "restart", {"reason": f"central:{current_admin.username}"})
+    except NodeOfflineError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    return {"node": node, **result}
+
+
+@router.delete("/{node}")
+async def forget_node(
+    node: str,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    移除已断开的节点及其账号（节点重新连接后会再次出现）
+    """
+    from app.services.remote_fleet import remote_fleet
+
+    if remote_fleet.get_node(node) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="节点不存在"
+        )
+    if not remote_fleet.forget(node):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="节点仍在连接中"
+        )
+    return {"message": f"已移除节点 {node}"}
@@ -0,0 +1,78 @@
+"""Webhook通知路由"""
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from app.config import settings
+from app.routers.auth import get_current_admin
+from app.models.admin import Admin
+
+router = APIRouter(prefix="/notifications")
+
+
+@router.get("/endpoints")
+async def get_notification_endpoints(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    webhook地址及其发件箱统计（待发送、已发送、失败、发送中，最近一次成功/失败）
+    """
+    from app.services.notifier import notifier
+
+    return {
+        "events": settings.webhook_events,
+        "digest_window": settings.webhook_digest_window,
+        "endpoints": await notifier.get_endpoint_stats()
+    }
+
+
+@router.get("/outbox")
+async def get_notification_outbox(
+    status_filter: Optional[Literal["pending", "sent", "failed"]] = Query(None, alias="status"),
+    limit: int = Query(50, ge=1, le=500),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    最近的通知（最新的在前）
+    """
+    from app.services.notifier import notifier
+
+    return {"notifications": await notifier.list_outbox(status_filter, limit)}
+
+
+@router.post("/test")
+async def send_test_notification(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    向所有webhook地址发送一条测试通知（与其他通知一样经过合并和重试）
+    """
+    from app.services.notifier import notifier, TEST
+
+    endpoints = notifier.endpoints()
+    if not endpoints:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="未配置webhook地址（config.json的WebhookURL或WEBHOOK_URLS）"
+        )
+    notifier.notify(TEST, "测试通知", f"来自 {current_admin.username} 的测试通知")
+    return {"message": "测试通知已加入发送队列", "endpoints": len(endpoints)}
+
+
+@router.post("/outbox/{notification_id}/retry")
+async def retry_notification(
+    notification_id: int,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    重新发送失败的通知
+    """
+    from app.services.notifier import notifier
+
+    notification = await notifier.retry(notification_id)
+    if notification is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="通知不存在"
+        )
+    return notification
@@ -0,0 +1,211 @@
+"""定时任务管理路由"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db
+from app.routers.auth import get_current_admin
+from app.models.admin import Admin
+from app.models.scheduled_job import ScheduledJob
+
+router = APIRouter(prefix="/scheduler")
+
+
+class CreateJobRequest(BaseModel):
+    """创建定时任务请求"""
+    name: str = Field(..., min_length=1, max_length=64)
+    task: str
+    cron: str
+    enabled: bool = True
+    jitter_seconds: int = Field(0, ge=0, le=86400)
+    catch_up: str = "skip"
+    args: Optional[Dict[str, Any]] = None
+
+
+class UpdateJobRequest(BaseModel):
+    """更新定时任务请求（只修改提供的字段）"""
+    name: Optional[str] = Field(None, min_length=1, max_length=64)
+    cron: Optional[str] = None
+    enabled: Optional[bool] = None
+    jitter_seconds: Optional[int] = Field(None, ge=0, le=86400)
+    catch_up: Optional[str] = None
+    args: Optional[Dict[str, Any]] = None
+
+
+async def _get_job_or_404(db: AsyncSession, job_id: int) -> ScheduledJob:
+    job = await db.get(ScheduledJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+    return job
+
+
+@router.get("/tasks")
+async def list_task_types(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取可用的任务类型
+    """
+    from app.services.scheduler_service import scheduler_service
+
+    return {"tasks": scheduler_service.list_tasks()}
+
+
+@router.get("/jobs")
+async def list_jobs(
+    current_admin: Admin = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    获取定时任务列表
+    """
+    from app.services.scheduler_service import scheduler_service
+
+    jobs = (await db.scalars(select(ScheduledJob).order_by(ScheduledJob.id))).all()
+    return {"jobs": [scheduler_service.serialize_job(job) for job in jobs]}
+
+
+@router.post("/jobs", status_code=status.HTTP_201_CREATED)
+async def create_job(
+    request: CreateJobRequest,
+    current_admin: Admin = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    创建定时任务
+    """
+    from app.services.scheduler_service import scheduler_service
+
+    try:
+        scheduler_service.validate_job(request.task, request.cron, request.catch_up, request.jitter_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    job = ScheduledJob(
+        name=request.name,
+        task=request.task,
+        cron=request.cron.strip(),
+        enabled=request.enabled,
+        jitter_seconds=request.jitter_seconds,
+        catch_up=request.catch_up,
+        args=json.dumps(request.args) if request.args else None,
+        next_run_at=scheduler_service.compute_next_run(request.cron, request.jitter_seconds, datetime.now())
+    )
+    db.add(job)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="任务名已存在")
+
+    scheduler_service.wake()
+    return scheduler_service.serialize_job(job)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: int,
+    current_admin: Admin = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    获取定时任务详情
+    """
+    from app.services.scheduler_service import scheduler_service
+
+    return scheduler_service.serialize_job(await _get_job_or_404(db, job_id))
+
+
+@router.patch("/jobs/{job_id}")
+async def update_job(
+    job_id: int,
+    request: UpdateJobRequest,
+    current_admin: Admin = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    更新定时任务（修改cron、抖动或重新启用后重新计算下次触发时间）
+    """
+    from app.services.scheduler_service import scheduler_service
+
+    job = await _get_job_or_404(db, job_id)
+    changes = request.model_dump(exclude_unset=True)
+
+    cron = (changes.get("cron") or job.cron).strip()
+    catch_up = changes.get("catch_up") or job.catch_up
+    jitter_seconds = changes["jitter_seconds"] if changes.get("jitter_seconds") is not None else job.jitter_seconds
+    try:
+        scheduler_service.validate_job(job.task, cron, catch_up, jitter_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    reschedule = (
+        cron != job.cron
+        or jitter_seconds != job.jitter_seconds
+        or (changes.get("enabled") is True and not job.enabled)
+    )
+    if changes.get("name"):
+        job.name = changes["name"]
+    if changes.get("enabled") is not None:
+        job.enabled = changes["enabled"]
+    if "args" in changes:
+        job.args = json.dumps(changes["args"]) if changes["args"] else None
+    job.cron = cron
+    job.catch_up = catch_up
+    job.jitter_seconds = jitter_seconds
+    if reschedule:
+        job.next_run_at = scheduler_service.compute_next_run(cron, jitter_seconds, datetime.now())
+
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="任务名已存在")
+
+    scheduler_service.wake()
+    return scheduler_service.serialize_job(job)
+
+
+@router.delete("/jobs/{job_id}")
+async def delete_job(
+    job_id: int,
+    current_admin: Admin = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    删除定时任务（正在执行的不会被中断）
+    注意：默认任务被删除后，服务重启时会重新创建，如需停用请禁用任务
+    """
+    from app.services.scheduler_service import scheduler_service
+
+    job = await _get_job_or_404(db, job_id)
+    await db.delete(job)
+    await db.commit()
+
+    scheduler_service.wake()
+    return {"message": f"任务 {job.name} 已删除"}
+
+
+@router.post("/jobs/{job_id}/run")
+async def run_job(
+    job_id: int,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    立即执行一次定时任务（不影响下次触发时间）
+    """
+    from app.services.scheduler_service import scheduler_service, JobLockedError
+
+    try:
+        job = await scheduler_service.run_now(job_id)
+    except JobLockedError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+    return {"message": f"任务 {job.name} 已开始执行", "job_id": job.id}
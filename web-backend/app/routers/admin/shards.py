@@ -0,0 +1,174 @@
+"""分片管理路由（账号分配到多个drop容器）"""
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from app.config import settings
+from app.routers.auth import get_current_admin
+from app.models.admin import Admin
+
+router = APIRouter(prefix="/shards")
+
+
+def _require_sharding():
+    from app.services.config_service import config_service
+
+    if not config_service.sharded:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="未启用分片模式（SHARD_COUNT=0）"
+        )
+
+
+def _check_shard(shard: int):
+    if not 0 <= shard < settings.shard_count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"分片 {shard} 不存在（共 {settings.shard_count} 个分片）"
+        )
+
+
+def _start_rolling(reason: str, shards: Optional[List[int]] = None):
+    from app.services.restart_orchestrator import restart_orchestrator, RestartInProgressError
+
+    try:
+        restart_orchestrator.start_rolling(reason, shards)
+    except RestartInProgressError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+
+
+@router.get("")
+async def get_shards(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    各分片的容器状态、账号和账号状态统计
+    """
+    from app.services.bot_monitor import bot_monitor
+    from app.services.config_service import config_service
+    from app.services.docker_service import docker_service
+
+    _require_sharding()
+    users = {user.get("Login"): user for user in config_service.get_users()}
+    accounts = config_service.get_shard_accounts()
+    containers = {item["shard"]: item for item in await docker_service.list_drop_containers()}
+    shards = []
+    for shard, logins in accounts.items():
+        statuses = {}
+        for login in logins:
+            summary = bot_monitor.get_cached_summary(login) or {}
+            key = summary.get("status") or "Unknown"
+            statuses[key] = statuses.get(key, 0) + 1
+        shards.append({
+            **containers.get(shard, {"shard": shard, "service": docker_service.service_name(shard)}),
+            "config_path": str(config_service.shard_config_path(shard)),
+            "logs_directory": str(config_service.shard_logs_dir(shard)),
+            "account_count": len(logins),
+            "enabled_account_count": sum(1 for login in logins if users[login].get("Enabled", True)),
+            "statuses": statuses,
+            "accounts": logins
+        })
+    return {
+        "shard_count": settings.shard_count,
+        "max_accounts": settings.shard_max_accounts,
+        "next_shard": config_service.next_shard(),
+        "shards": shards
+    }
+
+
+@router.post("/sync")
+async def sync_shards(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    按config.json重新生成各分片的配置文件（通常在配置变化时自动完成）
+    """
+    from app.services.config_service import config_service
+
+    _require_sharding()
+    return {"changed": config_service.sync_shards()}
+
+
+@router.post("/rebalance")
+async def rebalance_shards(
+    restart: bool = Query(False, description="完成后逐个重启受影响的分片"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    在分片间移动账号使启用账号数均衡（账号需要在所属分片的容器重启后才会切换）
+    """
+    from app.services.config_service import config_service
+
+    _require_sharding()
+    result = config_service.rebalance_shards()
+    if restart and result["shards"]:
+        _start_rolling("rebalance", result["shards"])
+    return {**result, "restarting": restart and bool(result["shards"])}
+
+
+@router.put("/accounts/{login}")
+async def move_account(
+    login: str,
+    shard: int = Query(..., ge=0),
+    restart: bool = Query(False, description="完成后逐个重启原分片和目标分片"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    把账号移动到指定分片
+    """
+    from app.services.config_service import config_service
+
+    _require_sharding()
+    _check_shard(shard)
+    previous = config_service.get_user_shard(login)
+    if not config_service.move_user_to_shard(login, shard):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="账号不存在"
+        )
+    affected = sorted({shard} | ({previous} if previous is not None else set()))
+    if restart and previous != shard:
+        _start_rolling(f"move:{login}", affected)
+    return {"login": login, "from": previous, "to": shard, "restarting": restart and previous != shard}
+
+
+@router.post("/restart")
+async def rolling_restart(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    滚动重启：逐个分片重启，上一个分片的账号恢复后再重启下一个（结果见重启报告）
+    """
+    _require_sharding()
+    _start_rolling("manual")
+    return {"message": f"开始滚动重启 {settings.shard_count} 个分片"}
+
+
+@router.post("/{shard}/restart")
+async def restart_shard(
+    shard: int,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    只重启一个分片的容器，并在后台确认该分片的账号恢复
+    """
+    from app.services.restart_orchestrator import restart_orchestrator, RestartInProgressError
+
+    _require_sharding()
+    _check_shard(shard)
+    try:
+        result, report = await restart_orchestrator.start("manual", shard=shard)
+    except RestartInProgressError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"重启分片失败: {str(e)}"
+        )
+    return {**result, "shard": shard, "report_id": report["id"]}
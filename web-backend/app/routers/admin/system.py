@@ -1,11 +1,12 @@
 """系统管理路由"""
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_async_db
 from app.routers.auth import get_current_admin
 from app.models.admin import Admin
 from app.utils.password import verify_password, get_password_hash
@@ -47,10 +48,10 @@ class ChangePasswordRequest(BaseModel):
 @router.get("/admins", response_model=AdminListResponse)
 async def get_admins(
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取管理员列表"""
-    admins = db.query(Admin).all()
+    admins = (await db.scalars(select(Admin))).all()
 
     return AdminListResponse(
         admins=[
@@ -70,11 +71,11 @@ async def get_admins(
 async def create_admin(
     request: CreateAdminRequest,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建新管理员"""
     # 检查用户名是否已存在
-    existing_admin = db.query(Admin).filter(Admin.username == request.username).first()
+    existing_admin = await db.scalar(select(Admin).where(Admin.username == request.username))
     if existing_admin:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -87,8 +88,8 @@ async def create_admin(
         password_hash=get_password_hash(request.password)
     )
     db.add(new_admin)
-    db.commit()
-    db.refresh(new_admin)
+    await db.commit()
+    await db.refresh(new_admin)
 
     return {
         "message": "管理员创建成功",
@@ -107,7 +108,7 @@ async def update_admin(
     admin_id: int,
     request: UpdateAdminRequest,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新管理员信息"""
     # 不允许禁用自己
@@ -117,7 +118,7 @@ async def update_admin(
             detail="不能禁用自己的账户"
         )
 
-    admin = db.query(Admin).filter(Admin.id == admin_id).first()
+    admin = await db.scalar(select(Admin).where(Admin.id == admin_id))
     if not admin:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -127,8 +128,8 @@ async def update_admin(
     if request.is_active is not None:
         admin.is_active = request.is_active
 
-    db.commit()
-    db.refresh(admin)
+    await db.commit()
+    await db.refresh(admin)
 
     return {
         "message": "管理员信息更新成功",
@@ -146,7 +147,7 @@ async def update_admin(
 async def delete_admin(
     admin_id: int,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除管理员"""
     # 不允许删除自己
@@ -156,15 +157,15 @@ async def delete_admin(
             detail="不能删除自己的账户"
         )
 
-    admin = db.query(Admin).filter(Admin.id == admin_id).first()
+    admin = await db.scalar(select(Admin).where(Admin.id == admin_id))
     if not admin:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="管理员不存在"
         )
 
-    db.delete(admin)
-    db.commit()
+    await db.delete(admin)
+    await db.commit()
 
     return {"message": "管理员删除成功"}
 
@@ -173,7 +174,7 @@ async def delete_admin(
 async def change_password(
     request: ChangePasswordRequest,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """修改当前管理员密码"""
     # 验证旧密码
@@ -185,7 +186,7 @@ async def change_password(
 
     # 更新密码
     current_admin.password_hash = get_password_hash(request.new_password)
-    db.commit()
+    await db.commit()
 
     return {"message": "密码修改成功"}
 
@@ -193,17 +194,23 @@ async def change_password(
 @router.post("/bot/restart")
 async def restart_bot_container(
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    重启drop容器（C# bot）
+    重启drop容器（C# bot），并在后台确认各账号恢复
     """
-    from app.services.docker_service import docker_service
+    from app.services.restart_orchestrator import restart_orchestrator, RestartInProgressError
 
     try:
-        result = await docker_service.restart_drop_container()
+        # 重启后在后台检查每个账号是否恢复，结果见重启报告
+        result, report = await restart_orchestrator.start("manual")
         print(f"[API] 重启容器结果: {result}")
-        return result
+        return {**result, "report_id": report["id"]}
+    except RestartInProgressError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except Exception as e:
         print(f"[API] 重启容器异常: {str(e)}")
         raise HTTPException(
@@ -212,10 +219,57 @@ async def restart_bot_container(
         )
 
 
+@router.get("/bot/restart/reports")
+async def list_restart_reports(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取最近的重启报告（停机时长、未恢复账号告警）
+    """
+    from app.services.restart_orchestrator import restart_orchestrator
+
+    return {
+        "running": restart_orchestrator.running,
+        "reports": restart_orchestrator.list_reports()
+    }
+
+
+@router.get("/bot/restart/reports/{report_id}")
+async def get_restart_report(
+    report_id: str,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取重启报告详情（每个账号重启前状态、恢复时间和停机时长）
+    """
+    from app.services.restart_orchestrator import restart_orchestrator
+
+    report = restart_orchestrator.get_report(report_id)
+    if not report:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="重启报告不存在"
+        )
+    return report
+
+
+@router.get("/bot/restart/window")
+async def preview_restart_window(
+    minutes: float = Query(60, gt=0, le=24 * 60, description="窗口长度（分钟）"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    预览智能重启窗口：现在开始窗口时各时刻重启的预计观看损失，以及最近的窗口决策
+    """
+    from app.services.restart_window import restart_window_planner
+
+    return restart_window_planner.preview(minutes)
+
+
 @router.get("/bot/next-restart")
 async def get_next_restart_time(
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取下一次定时重启时间
@@ -233,3 +287,47 @@ async def get_next_restart_time(
             "next_restart_time": None,
             "formatted_time": "未设置"
         }
+
+
+@router.get("/bot/resources")
+async def get_bot_resource_usage(
+    hours: float = Query(24, gt=0, le=24 * 90, description="时间范围（小时）"),
+    step: Optional[int] = Query(None, ge=60, description="再次降采样的周期（秒）"),
+    shard: Optional[int] = Query(None, ge=0, description="分片模式下的分片序号"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取drop容器的CPU、内存、网络采样序列（每个点附带当时的账号数）
+    分片模式下未指定分片时返回每个分片容器的序列
+    """
+    from app.services.docker_service import docker_service
+    from app.services.config_service import config_service
+
+    users = config_service.get_users()
+    result = {
+        "container": docker_service.service_name(shard),
+        "interval": docker_service.stats_interval,
+        "account_count": len(users),
+        "enabled_account_count": sum(1 for user in users if user.get("Enabled", True))
+    }
+    if config_service.sharded and shard is None:
+        result["container"] = None
+        result["shards"] = {
+            service: await docker_service.get_stats_series(hours, step, service)
+            for service in docker_service.service_names()
+        }
+        return result
+    result["series"] = await docker_service.get_stats_series(hours, step, docker_service.service_name(shard))
+    return result
+
+
+@router.get("/ws/connections")
+async def get_ws_connections(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取WebSocket连接统计（队列深度、丢弃数、发送延迟）
+    """
+    from app.services.connection_manager import manager
+
+    return manager.get_stats()
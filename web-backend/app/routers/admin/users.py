@@ -1,14 +1,19 @@
 """管理员用户管理路由"""
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 
-from app.database import get_db
+from app.database import get_async_db
 from app.routers.auth import get_current_admin
 from app.models.admin import Admin
 from app.services.config_service import config_service
 from app.services.bot_monitor import bot_monitor
+from app.services.fleet_stats import fleet_stats
+from app.services.progress_tracker import progress_tracker
+from app.services.remote_fleet import NodeOfflineError
+from app.services.user_index import user_index
+from app.utils.response_cache import response_cache
 
 router = APIRouter()
 
@@ -19,12 +24,16 @@ class UserResponse(BaseModel):
     Id: str
     Enabled: bool
     FavouriteGames: List[str]
+    Node: Optional[str] = None
     status: dict = {}
+    progress_stats: Optional[dict] = None
 
 
 class UserListResponse(BaseModel):
     """用户列表响应"""
     users: List[UserResponse]
+    total: int = 0
+    next_cursor: Optional[str] = None
 
 
 class UpdateUserEnabledRequest(BaseModel):
@@ -34,104 +43,87 @@ class UpdateUserEnabledRequest(BaseModel):
 
 @router.get("/stats")
 async def get_system_stats(
+    request: Request,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取系统统计信息"""
-    users_data = config_service.get_users()
-
-    # 统计信息
-    total_users = len(users_data)
-    enabled_users = sum(1 for u in users_data if u.get("Enabled", True))
-    disabled_users = total_users - enabled_users
-
-    # 获取状态统计
-    status_counts = {
-        "Idle": 0,
-        "Seeking": 0,
-        "Watching": 0,
-        "Error": 0,
-        "Unknown": 0
-    }
-
-    total_progress = 0
-    total_required = 0
-    active_campaigns = set()
-    active_games = set()
-
-    for user in users_data:
-        if not user.get("Enabled", True):
-            continue
-
-        username = user.get("Login")
-        status_info = bot_monitor.get_user_status(username)
-
-        # 状态统计
-        status = status_info.get("status", "Unknown")
-        if status in status_counts:
-            status_counts[status] += 1
-        else:
-            status_counts["Unknown"] += 1
-
-        # 进度统计
-        progress = status_info.get("progress")
-        if progress:
-            total_progress += progress.get("current", 0)
-            total_required += progress.get("required", 0)
-
-        # Campaign和游戏统计
-        campaign_info = status_info.get("campaign")
-        if campaign_info:
-            if campaign_info.get("campaign"):
-                active_campaigns.add(campaign_info.get("campaign"))
-            if campaign_info.get("game"):
-                active_games.add(campaign_info.get("game"))
-
-    return {
-        "total_users": total_users,
-        "enabled_users": enabled_users,
-        "disabled_users": disabled_users,
-        "status_counts": status_counts,
-        "total_progress": total_progress,
-        "total_required": total_required,
-        "progress_percentage": (total_progress / total_required * 100) if total_required > 0 else 0,
-        "active_campaigns_count": len(active_campaigns),
-        "active_games_count": len(active_games),
-        "active_campaigns": list(active_campaigns),
-        "active_games": list(active_games)
-    }
+    """获取系统统计信息（增量维护的聚合数据，O(1)，支持ETag）"""
+    fleet_stats.sync_config()
+    stalled = progress_tracker.stalled_logins()
+    version = (config_service.generation, bot_monitor.generation, stalled)
+    return response_cache.respond(
+        request, ("admin_stats",), version,
+        lambda: {**fleet_stats.get_stats(), "stalled_users": list(stalled)}
+    )
 
 
 @router.get("/users", response_model=UserListResponse)
 async def get_users(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="每页数量，不传则返回全部"),
+    cursor: Optional[str] = Query(None, description="上一页返回的next_cursor"),
+    sort: Literal["login", "status", "progress", "last_update"] = "login",
+    order: Literal["asc", "desc"] = "asc",
+    enabled: Optional[bool] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    game: Optional[str] = None,
+    campaign: Optional[str] = None,
+    include_logs: bool = Query(False, description="是否包含recent_logs"),
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取用户列表"""
-    users_data = config_service.get_users()
-
-    # 获取每个用户的状态
-    result = []
-    for user in users_data:
-        username = user.get("Login")
-        status_info = bot_monitor.get_user_status(username)
-
-        result.append(UserResponse(
-            Login=user.get("Login"),
-            Id=user.get("Id"),
-            Enabled=user.get("Enabled", True),
-            FavouriteGames=user.get("FavouriteGames", []),
-            status=status_info
-        ))
+    """获取用户列表（支持分页、排序和筛选，默认不包含recent_logs，支持ETag）"""
+    def build():
+        try:
+            page = user_index.query(
+                limit=limit,
+                cursor=cursor,
+                sort=sort,
+                order=order,
+                enabled=enabled,
+                status=status_filter,
+                game=game,
+                campaign=campaign
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+        result = []
+        for row in page["users"]:
+            status_info = row["status"]
+            if include_logs:
+                status_info = bot_monitor.get_user_status(row["Login"])
+
+            result.append(UserResponse(
+                Login=row["Login"],
+                Id=row["Id"],
+                Enabled=row["Enabled"],
+                FavouriteGames=row["FavouriteGames"],
+                Node=row["Node"],
+                status=status_info or {},
+                progress_stats=progress_tracker.get_progress(row["Login"])
+            ))
+
+        return UserListResponse(
+            users=result,
+            total=page["total"],
+            next_cursor=page["next_cursor"]
+        )
 
-    return UserListResponse(users=result)
+    user_index.sync_config()
+    key = ("admin_users", limit, cursor, sort, order, enabled, status_filter, game, campaign, include_logs)
+    version = (user_index.version, bot_monitor.generation, progress_tracker.stalled_logins())
+    return response_cache.respond(request, key, version, build)
 
 
 @router.get("/users/{user_id}/detail")
 async def get_user_detail(
     user_id: str,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取用户详细信息"""
     user = config_service.get_user_by_id(user_id)
@@ -149,22 +141,60 @@ async def get_user_detail(
             "Login": user.get("Login"),
             "Id": user.get("Id"),
             "Enabled": user.get("Enabled", True),
-            "FavouriteGames": user.get("FavouriteGames", [])
+            "FavouriteGames": user.get("FavouriteGames", []),
+            "Node": user.get("Node")
         },
         "status": status_info.get("status"),
         "last_update": status_info.get("last_update"),
         "campaign": status_info.get("campaign"),
         "broadcaster": status_info.get("broadcaster"),
         "progress": status_info.get("progress"),
+        "progress_stats": progress_tracker.get_progress(username),
+        "shard": config_service.get_user_shard(username),
         "recent_logs": status_info.get("recent_logs", [])
     }
 
 
+@router.get("/users/{user_id}/progress")
+async def get_user_progress_history(
+    user_id: str,
+    hours: float = Query(24, gt=0, le=24 * 14, description="时间范围（小时）"),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """获取用户的观看进度历史、速率和预计完成时间"""
+    user = config_service.get_user_by_id(user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+
+    username = user.get("Login")
+    return {
+        "username": username,
+        "progress_stats": progress_tracker.get_progress(username),
+        "series": await progress_tracker.get_series(username, hours)
+    }
+
+
+@router.get("/users/progress/stalled")
+async def get_stalled_users(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """获取停滞账号（状态为Watching但进度超过PROGRESS_STALL_MINUTES分钟未增长）"""
+    stalled = progress_tracker.get_stalled()
+    return {
+        "stall_minutes": progress_tracker.stall_minutes,
+        "count": len(stalled),
+        "users": stalled
+    }
+
+
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: str,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除用户"""
     user = config_service.get_user_by_id(user_id)
@@ -174,7 +204,14 @@ async def delete_user(
             detail="用户不存在"
         )
 
-    if config_service.delete_user(user_id):
+    try:
+        deleted = config_service.delete_user(user_id)
+    except NodeOfflineError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    if deleted:
         return {"message": "用户已删除"}
     else:
         raise HTTPException(
@@ -188,7 +225,7 @@ async def update_user_enabled(
     user_id: str,
     request: UpdateUserEnabledRequest,
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """启用/禁用用户"""
     user = config_service.get_user_by_id(user_id)
@@ -198,7 +235,14 @@ async def update_user_enabled(
             detail="用户不存在"
         )
 
-    if config_service.update_user_enabled(user_id, request.enabled):
+    try:
+        updated = config_service.update_user_enabled(user_id, request.enabled)
+    except NodeOfflineError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    if updated:
         return {"message": f"用户已{'启用' if request.enabled else '禁用'}"}
     else:
         raise HTTPException(
@@ -210,19 +254,25 @@ async def update_user_enabled(
 @router.post("/users/add/initiate")
 async def initiate_add_user_via_bot(
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     启动添加用户流程：调用C# bot的--add-account命令
     Bot会处理完整的OAuth流程并自动添加到config.json
     """
     from app.services.docker_service import docker_service
+    from app.services.add_account_jobs import JobLimitError
 
     try:
         # 调用docker_service执行add_account命令，并直接返回结果
         result = await docker_service.execute_add_account()
         print(f"[API] docker_service返回结果: {result}")
         return result
+    except JobLimitError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
     except Exception as e:
         print(f"[API] 调用添加用户命令异常: {str(e)}")
         import traceback
@@ -233,16 +283,72 @@ async def initiate_add_user_via_bot(
         )
 
 
+@router.get("/users/add/jobs")
+async def list_add_account_jobs(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取添加账号任务列表（进行中和最近结束的）
+    """
+    from app.services.add_account_jobs import add_account_jobs
+
+    return {
+        "jobs": add_account_jobs.list_jobs(),
+        "active": add_account_jobs.active_count(),
+        "limit": add_account_jobs.max_jobs
+    }
+
+
+@router.get("/users/add/jobs/{job_id}")
+async def get_add_account_job(
+    job_id: str,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    获取添加账号任务状态和bot输出
+    """
+    from app.services.add_account_jobs import add_account_jobs
+
+    job = add_account_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return job.to_dict(include_output=True)
+
+
+@router.delete("/users/add/jobs/{job_id}")
+async def cancel_add_account_job(
+    job_id: str,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    取消添加账号任务
+    """
+    from app.services.add_account_jobs import add_account_jobs
+
+    job = add_account_jobs.cancel_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return {"message": "任务已取消", "job_id": job.id}
+
+
 @router.get("/users/check/{username}")
 async def check_user_added(
     username: str,
-    current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    wait: int = Query(0, ge=0, le=120, description="长轮询：最多等待的秒数，用户出现后立即返回"),
+    current_admin: Admin = Depends(get_current_admin)
 ):
     """
     检查用户是否已被C# bot添加到config.json
+
+    带wait参数时为长轮询：配置变化通知到达后立即返回，无需反复请求。
     """
-    user = config_service.get_user_by_login(username)
+    user = await config_service.wait_for_user(username, wait)
     if user:
         return {
             "added": True,
@@ -259,17 +365,23 @@ async def check_user_added(
 @router.post("/bot/restart")
 async def restart_bot_container(
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    重启drop容器（C# bot）
+    重启drop容器（C# bot），并在后台确认各账号恢复
     """
-    from app.services.docker_service import docker_service
+    from app.services.restart_orchestrator import restart_orchestrator, RestartInProgressError
 
     try:
-        result = await docker_service.restart_drop_container()
+        # 重启后在后台检查每个账号是否恢复，结果见重启报告
+        result, report = await restart_orchestrator.start("manual")
         print(f"[API] 重启容器结果: {result}")
-        return result
+        return {**result, "report_id": report["id"]}
+    except RestartInProgressError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except Exception as e:
         print(f"[API] 重启容器异常: {str(e)}")
         raise HTTPException(
@@ -281,7 +393,7 @@ async def restart_bot_container(
 @router.get("/bot/next-restart")
 async def get_next_restart_time(
     current_admin: Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取下一次定时重启时间
@@ -0,0 +1,52 @@
+"""账号异常检测路由"""
+from fastapi import APIRouter, Depends, Query
+
+from app.config import settings
+from app.routers.auth import get_current_admin
+from app.models.admin import Admin
+
+router = APIRouter(prefix="/watchdog")
+
+
+@router.get("/incidents")
+async def get_watchdog_incidents(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    进行中的账号异常（错误循环、长时间找不到活动、日志停止更新），含证据和处理结果
+    """
+    from app.services.account_watchdog import account_watchdog
+
+    incidents = account_watchdog.get_incidents()
+    return {
+        "enabled": settings.watchdog_enabled,
+        "remediation": settings.watchdog_remediation,
+        "count": len(incidents),
+        "incidents": incidents
+    }
+
+
+@router.get("/events")
+async def get_watchdog_events(
+    limit: int = Query(50, ge=1, le=500),
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    最近的异常事件（incident_opened / incident_resolved / remediation），最新的在前
+    """
+    from app.services.account_watchdog import account_watchdog
+
+    return {"events": account_watchdog.get_events(limit)}
+
+
+@router.post("/check")
+async def run_watchdog_check(
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """
+    立即检查所有启用账号并执行配置的处理方式
+    """
+    from app.services.account_watchdog import account_watchdog
+
+    incidents = await account_watchdog.check()
+    return {"count": len(incidents), "incidents": incidents}
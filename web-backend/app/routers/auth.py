@@ -1,13 +1,14 @@
 """认证路由"""
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Optional
 from pydantic import BaseModel
 import logging
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models.admin import Admin, Session as SessionModel
 from app.utils.jwt import create_access_token, verify_token
 from app.utils.password import verify_password, get_password_hash
@@ -31,7 +32,7 @@ class TokenResponse(BaseModel):
     token_type: str = "bearer"
 
 
-async def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """获取当前管理员"""
     print(f"[Auth] get_current_admin: 验证管理员token，token={token[:30]}...")
     logger.info(f"[Auth] get_current_admin: 验证管理员token，token={token[:30]}...")
@@ -58,12 +59,12 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = D
         )
 
     # 验证会话
-    session = db.query(SessionModel).filter(
+    session = await db.scalar(select(SessionModel).where(
         SessionModel.token == token,
         SessionModel.user_id == user_id,
         SessionModel.user_type == "admin",
         SessionModel.expires_at > datetime.utcnow()
-    ).first()
+    ))
 
     if not session:
         logger.error(f"[Auth] ❌ 会话不存在或已过期: user_id={user_id}")
@@ -72,7 +73,7 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = D
             detail="会话已过期"
         )
 
-    admin = db.query(Admin).filter(Admin.id == user_id).first()
+    admin = await db.scalar(select(Admin).where(Admin.id == user_id))
     if not admin or not admin.is_active:
         logger.error(f"[Auth] ❌ 管理员账户不存在或已禁用: user_id={user_id}")
         raise HTTPException(
@@ -84,7 +85,7 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = D
     return admin
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """获取当前普通用户（Twitch登录）"""
     logger.info(f"[Auth] get_current_user: 验证用户token，token={token[:30]}...")
     payload = verify_token(token)
@@ -108,12 +109,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         )
 
     # 验证会话
-    session = db.query(SessionModel).filter(
+    session = await db.scalar(select(SessionModel).where(
         SessionModel.token == token,
         SessionModel.user_id == username,
         SessionModel.user_type == "user",
         SessionModel.expires_at > datetime.utcnow()
-    ).first()
+    ))
 
     if not session:
         logger.error(f"[Auth] ❌ 会话不存在或已过期: username={username}")
@@ -136,10 +137,45 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     return {"username": username, "user_data": user}
 
 
+async def authenticate_token(token: str, db: AsyncSession) -> Optional[dict]:
+    """
+    验证token及会话（不依赖HTTP请求，供WebSocket等使用）
+    成功返回 {"type": "admin"|"user", "username": ...}，失败返回None
+    """
+    payload = verify_token(token) if token else None
+    if payload is None:
+        return None
+
+    user_id = payload.get("sub")
+    user_type = payload.get("type")
+    if user_type not in ("admin", "user"):
+        return None
+
+    session = await db.scalar(select(SessionModel).where(
+        SessionModel.token == token,
+        SessionModel.user_id == user_id,
+        SessionModel.user_type == user_type,
+        SessionModel.expires_at > datetime.utcnow()
+    ))
+    if not session:
+        return None
+
+    if user_type == "admin":
+        admin = await db.scalar(select(Admin).where(Admin.id == user_id))
+        if not admin or not admin.is_active:
+            return None
+        return {"type": "admin", "username": admin.username}
+
+    from app.services.config_service import config_service
+    if not config_service.get_user_by_login(user_id):
+        return None
+    return {"type": "user", "username": user_id}
+
+
 @router.post("/admin/login", response_model=TokenResponse)
 async def admin_login(
     login_data: AdminLoginRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """管理员登录"""
     # 检查是否是默认管理员
@@ -160,19 +196,19 @@ async def admin_login(
                 )
             
             # 创建管理员记录
-            admin = db.query(Admin).filter(Admin.username == login_data.username).first()
+            admin = await db.scalar(select(Admin).where(Admin.username == login_data.username))
             if not admin:
                 admin = Admin(
                     username=login_data.username,
                     password_hash=get_password_hash(login_data.password)
                 )
                 db.add(admin)
-                db.commit()
-                db.refresh(admin)
+                await db.commit()
+                await db.refresh(admin)
         
-        admin = db.query(Admin).filter(Admin.username == login_data.username).first()
+        admin = await db.scalar(select(Admin).where(Admin.username == login_data.username))
     else:
-        admin = db.query(Admin).filter(Admin.username == login_data.username).first()
+        admin = await db.scalar(select(Admin).where(Admin.username == login_data.username))
         if not admin:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -200,7 +236,7 @@ async def admin_login(
         expires_at=expires_at
     )
     db.add(session)
-    db.commit()
+    await db.commit()
     
     return TokenResponse(access_token=access_token)
 
@@ -208,18 +244,18 @@ async def admin_login(
 @router.post("/logout")
 async def logout(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """登出"""
     # 删除会话
-    db.query(SessionModel).filter(SessionModel.token == token).delete()
-    db.commit()
+    await db.execute(delete(SessionModel).where(SessionModel.token == token))
+    await db.commit()
     
     return {"message": "已成功登出"}
 
 
 @router.get("/me")
-async def get_me(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_me(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """获取当前用户信息（支持管理员和普通用户）"""
     print(f"[Auth] /api/auth/me: 验证token，token={token[:30]}...")
 
@@ -237,12 +273,12 @@ async def get_me(token: str = Depends(oauth2_scheme), db: Session = Depends(get_
     print(f"[Auth] Token payload: user_id={user_id}, type={user_type}")
 
     # 验证会话
-    session = db.query(SessionModel).filter(
+    session = await db.scalar(select(SessionModel).where(
         SessionModel.token == token,
         SessionModel.user_id == user_id,
         SessionModel.user_type == user_type,
         SessionModel.expires_at > datetime.utcnow()
-    ).first()
+    ))
 
     if not session:
         print(f"[Auth] ❌ 会话不存在或已过期: user_id={user_id}")
@@ -253,7 +289,7 @@ async def get_me(token: str = Depends(oauth2_scheme), db: Session = Depends(get_
 
     if user_type == "admin":
         # 管理员
-        admin = db.query(Admin).filter(Admin.id == user_id).first()
+        admin = await db.scalar(select(Admin).where(Admin.id == user_id))
         if not admin or not admin.is_active:
             print(f"[Auth] ❌ 管理员账户不存在或已禁用: user_id={user_id}")
             raise HTTPException(
@@ -312,7 +348,7 @@ async def initiate_user_twitch_login():
 
 
 @router.post("/user/twitch/login")
-async def user_twitch_login(device_code: str, db: Session = Depends(get_db)):
+async def user_twitch_login(device_code: str, db: AsyncSession = Depends(get_async_db)):
     """用户通过Twitch OAuth登录"""
     logger.info(f"[Auth] 用户Twitch登录: device_code={device_code[:20]}...")
     from app.utils.twitch_auth import twitch_auth
@@ -381,7 +417,7 @@ async def user_twitch_login(device_code: str, db: Session = Depends(get_db)):
             expires_at=expires_at
         )
         db.add(session)
-        db.commit()
+        await db.commit()
         logger.info(f"[Auth] ✅ 会话保存成功，过期时间: {expires_at}")
 
         logger.info(f"[Auth] ✅ 用户{username}登录成功！")
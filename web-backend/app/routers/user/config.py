@@ -1,10 +1,12 @@
 """用户配置路由"""
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
 from typing import List
 
 from app.services.config_service import config_service
+from app.services.remote_fleet import NodeOfflineError
 from app.routers.auth import get_current_user
+from app.utils.response_cache import response_cache
 
 router = APIRouter()
 
@@ -21,14 +23,18 @@ class UpdateUserConfigRequest(BaseModel):
 
 
 @router.get("/config")
-async def get_user_config(current_user: dict = Depends(get_current_user)):
-    """获取用户配置"""
+async def get_user_config(request: Request, current_user: dict = Depends(get_current_user)):
+    """获取用户配置（配置未变化时复用已序列化的响应，支持ETag）"""
     user_data = current_user["user_data"]
 
-    return UserConfigResponse(
-        Enabled=user_data.get("Enabled", True),
-        FavouriteGames=user_data.get("FavouriteGames", [])
-    )
+    def build():
+        return UserConfigResponse(
+            Enabled=user_data.get("Enabled", True),
+            FavouriteGames=user_data.get("FavouriteGames", [])
+        )
+
+    key = ("user_config", current_user["username"])
+    return response_cache.respond(request, key, config_service.generation, build)
 
 
 @router.put("/config")
@@ -40,7 +46,14 @@ async def update_user_config(
     user_data = current_user["user_data"]
     user_id = user_data.get("Id")
 
-    if config_service.update_user_favourite_games(user_id, request.FavouriteGames):
+    try:
+        updated = config_service.update_user_favourite_games(user_id, request.FavouriteGames)
+    except NodeOfflineError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    if updated:
         return {"message": "配置已更新"}
     else:
         raise HTTPException(
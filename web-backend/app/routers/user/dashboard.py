@@ -1,10 +1,13 @@
 """用户仪表盘路由"""
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from pydantic import BaseModel
 from typing import Optional
 
 from app.services.bot_monitor import bot_monitor
+from app.services.config_service import config_service
+from app.services.progress_tracker import progress_tracker
 from app.routers.auth import get_current_user
+from app.utils.response_cache import response_cache
 
 router = APIRouter()
 
@@ -19,35 +22,63 @@ class DashboardResponse(BaseModel):
     progress: Optional[dict]
     enabled: bool
     favourite_games: list
+    progress_stats: Optional[dict] = None  # 观看速率、预计完成时间、是否停滞
 
 
 @router.get("/dashboard")
-async def get_dashboard(current_user: dict = Depends(get_current_user)):
+async def get_dashboard(request: Request, current_user: dict = Depends(get_current_user)):
     """
     获取用户仪表盘数据
     需要用户通过Twitch OAuth登录
+    状态未变化时复用已序列化的响应，支持ETag
     """
     username = current_user["username"]
     user_data = current_user["user_data"]
-    status_info = bot_monitor.get_user_status(username)
-
-    print(f"[Dashboard] 用户{username}的状态信息:")
-    print(f"  status: {status_info.get('status')}")
-    print(f"  campaign: {status_info.get('campaign')}")
-    print(f"  broadcaster: {status_info.get('broadcaster')}")
-    print(f"  progress: {status_info.get('progress')}")
-
-    response = DashboardResponse(
-        username=username,
-        status=status_info.get("status", "Unknown"),
-        last_update=status_info.get("last_update"),
-        campaign=status_info.get("campaign"),
-        broadcaster=status_info.get("broadcaster"),
-        progress=status_info.get("progress"),
-        enabled=user_data.get("Enabled", True),
-        favourite_games=user_data.get("FavouriteGames", [])
-    )
-
-    print(f"[Dashboard] 返回的响应: campaign={response.campaign}")
-    return response
 
+    status_info = bot_monitor.get_cached_summary(username)
+    if status_info is None:
+        status_info = bot_monitor.get_user_status(username)
+    progress_stats = progress_tracker.get_progress(username)
+
+    def build():
+        print(f"[Dashboard] 用户{username}的状态信息:")
+        print(f"  status: {status_info.get('status')}")
+        print(f"  campaign: {status_info.get('campaign')}")
+        print(f"  broadcaster: {status_info.get('broadcaster')}")
+        print(f"  progress: {status_info.get('progress')}")
+
+        response = DashboardResponse(
+            username=username,
+            status=status_info.get("status") or "Unknown",
+            last_update=status_info.get("last_update"),
+            campaign=status_info.get("campaign"),
+            broadcaster=status_info.get("broadcaster"),
+            progress=status_info.get("progress"),
+            enabled=user_data.get("Enabled", True),
+            favourite_games=user_data.get("FavouriteGames", []),
+            progress_stats=progress_stats
+        )
+
+        print(f"[Dashboard] 返回的响应: campaign={response.campaign}")
+        return response
+
+    # 停滞状态随时间变化，按分钟加入版本
+    stalled = int(progress_stats["stalled_minutes"]) if progress_stats and progress_stats["stalled"] else -1
+    version = (config_service.generation, bot_monitor.get_user_version(username), stalled)
+    return response_cache.respond(request, ("user_dashboard", username), version, build)
+
+
+@router.get("/progress/history")
+async def get_progress_history(
+    hours: float = Query(24, gt=0, le=24 * 14, description="时间范围（小时）"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    获取观看进度历史（降采样后的时间序列）以及当前速率和预计完成时间
+    """
+    username = current_user["username"]
+    return {
+        "username": username,
+        "progress_stats": progress_tracker.get_progress(username),
+        "series": await progress_tracker.get_series(username, hours)
+    }
@@ -2,8 +2,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import List, Optional
-from pathlib import Path
-from app.config import settings
 from app.routers.auth import get_current_user
 
 router = APIRouter()
@@ -34,7 +32,7 @@ async def get_user_logs(
     from app.services.bot_monitor import bot_monitor
 
     username = current_user["username"]
-    log_file = Path(settings.logs_directory) / f"{username}.txt"
+    log_file = bot_monitor.log_path(username)
 
     if not log_file.exists():
         return LogsResponse(logs=[], total=0, page=page, page_size=page_size)
@@ -0,0 +1,113 @@
+"""WebSocket路由 - 认证连接与按主题订阅状态"""
+import json
+from typing import Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+
+from app.database import AsyncSessionLocal
+from app.routers.auth import authenticate_token
+from app.services.connection_manager import manager
+from app.services.status_broadcaster import status_broadcaster
+
+router = APIRouter()
+
+
+def _send_subscribed(websocket: WebSocket, accepted: list, rejected: list, last_seq: Optional[int] = None):
+    """回复订阅结果；新订阅的主题发送完整快照，带last_seq时只补发错过的增量"""
+    manager.send(websocket, {
+        "type": "subscribed",
+        "topics": sorted(manager.get_subscriptions(websocket)),
+        "rejected": rejected,
+        "seq": status_broadcaster.seq
+    })
+    for topic in accepted:
+        message = status_broadcaster.get_resume_message(topic, last_seq)
+        if message is not None:
+            manager.send(websocket, message)
+
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: str = "", last_seq: Optional[int] = None):
+    """
+    WebSocket端点，实时推送状态更新（由广播器统一推送变化）
+
+    连接: /ws?token=<JWT>[&last_seq=<N>]
+      重连时带上最后收到的seq，只补发错过的增量；落后太多则发送完整快照
+    客户端消息:
+      {"action": "subscribe", "topics": ["fleet", "user:<login>"], "last_seq": N}
+      {"action": "unsubscribe", "topics": [...]}
+      {"action": "pong"}  （回复服务端的 {"type": "ping"} 心跳）
+    普通用户只能订阅自己的 user:<login> 主题，管理员可订阅 fleet 和任意用户主题
+    """
+    async with AsyncSessionLocal() as db:
+        principal = await authenticate_token(token, db)
+
+    if principal is None:
+        print("[WebSocket] ❌ 认证失败，拒绝连接")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await manager.connect(websocket, principal)
+
+    try:
+        # 默认订阅，并发送当前完整快照
+        accepted, rejected = manager.subscribe(websocket, manager.default_topics(websocket))
+        _send_subscribed(websocket, accepted, rejected, last_seq)
+
+        while True:
+            data = await websocket.receive_text()
+            manager.touch(websocket)
+            try:
+                message = json.loads(data)
+            except ValueError:
+                manager.send(websocket, {"type": "error", "message": "无效的JSON消息"})
+                continue
+            if not isinstance(message, dict):
+                manager.send(websocket, {"type": "error", "message": "无效的消息格式"})
+                continue
+
+            action = message.get("action")
+            topics = message.get("topics") or []
+            if not isinstance(topics, list):
+                topics = [topics]
+            topics = [str(topic) for topic in topics]
+
+            if action == "subscribe":
+                accepted, rejected = manager.subscribe(websocket, topics)
+                resume_seq = message.get("last_seq")
+                _send_subscribed(websocket, accepted, rejected, resume_seq if isinstance(resume_seq, int) else None)
+            elif action == "unsubscribe":
+                manager.unsubscribe(websocket, topics)
+                _send_subscribed(websocket, [], [])
+            elif action == "pong":
+                continue
+            elif action == "ping":
+                manager.send(websocket, {"type": "pong"})
+            else:
+                manager.send(websocket, {"type": "error", "message": f"未知的操作: {action}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket)
+
+
+@router.websocket("/ws/agent")
+async def agent_endpoint(websocket: WebSocket):
+    """
+    节点代理连接（中心模式），每个远程节点一个持久连接
+
+    请求头: Authorization: Bearer <AGENT_TOKENS中该节点的令牌>, X-Node-Name: <节点名>
+    节点先发送 {"type": "hello", "session", "seq"}，中心回复 {"type": "welcome", "resume_from"}，
+    之后节点发送 snapshot / delta（带序号），中心逐条回复 ack，需要时回复 resync 或下发 command
+    """
+    from app.services.remote_fleet import remote_fleet
+
+    node = websocket.headers.get("x-node-name", "")
+    authorization = websocket.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else ""
+    if not remote_fleet.authenticate(node, token):
+        print(f"[WebSocket] ❌ 节点 {node or '(未知)'} 认证失败，拒绝连接")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await remote_fleet.serve(websocket, node)
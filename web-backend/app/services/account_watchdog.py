@@ -0,0 +1,346 @@
+"""账号异常检测 - 发现错误循环、长时间找不到活动和日志停止更新的账号，发出事件并按配置处理"""
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.bot_monitor import bot_monitor
+
+# 异常类型
+ERROR_LOOP = "error_loop"  # 反复进入Error或长时间处于Error
+SEEKING_NO_CAMPAIGN = "seeking_no_campaign"  # 长时间Seeking/Idle，没有观看任何活动
+LOG_STALLED = "log_stalled"  # 启用的账号日志停止更新
+KINDS = (ERROR_LOOP, SEEKING_NO_CAMPAIGN, LOG_STALLED)
+
+# 处理方式
+REMEDIATIONS = ("none", "disable", "restart")
+
+
+class AccountWatchdog:
+    """
+    账号异常检测
+
+    通过BotStatusMonitor的状态变化监听器跟踪每个账号的状态转换（使用日志时间），
+    日志停止更新无法从状态变化中发现，由后台循环按当前时间定期检查。
+    检测到异常时打开一个异常记录（incident）并发出incident_opened事件，条件消失后发出incident_resolved事件。
+    处理方式按异常类型配置（WATCHDOG_REMEDIATION），在后台循环中执行：
+    - disable：通过ConfigService禁用该账号，只影响出问题的账号
+    - restart：重启drop容器（影响所有账号，分片模式下只影响同一分片的账号，远程节点的账号由该节点重启），
+      两次重启至少间隔WATCHDOG_RESTART_MIN_INTERVAL秒
+    同一类异常同时出现在超过WATCHDOG_FLEET_FRACTION比例的启用账号上时视为全局问题（例如Twitch故障），
+    不逐个禁用账号。
+    """
+
+    def __init__(self):
+        self._state: Dict[str, Dict] = {}
+        # 启用的账号（每次检查时从配置更新），只检测这些账号
+        self._enabled: Set[str] = set()
+        # 进行中的异常 {(账号, 类型): incident}
+        self._incidents: Dict[Tuple[str, str], Dict] = {}
+        self.events: Deque[Dict] = deque(maxlen=settings.watchdog_event_history)
+        # 事件监听器 callback(event)
+        self._listeners: List[Callable[[Dict], None]] = []
+        # 上次因异常重启的时间 {节点: monotonic}，本机为None
+        self._last_restart: Dict[Optional[str], float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        bot_monitor.add_listener(self.on_status_change)
+        for username in bot_monitor.tracked_usernames():
+            summary = bot_monitor.get_cached_summary(username)
+            if summary:
+                self.on_status_change(username, None, summary)
+
+    def add_listener(self, callback: Callable[[Dict], None]):
+        """注册异常事件监听器"""
+        self._listeners.append(callback)
+
+    @staticmethod
+    def _parse_time(value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.astimezone()
+
+    def _emit(self, event_type: str, incident: Dict, **extra):
+        event = {
+            "id": uuid.uuid4().hex[:12],
+            "type": event_type,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "incident_id": incident["id"],
+            "login": incident["login"],
+            "kind": incident["kind"],
+            "evidence": incident["evidence"],
+            **extra
+        }
+        self.events.append(event)
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"[Watchdog] 事件监听器异常 {incident['login']}: {e}")
+
+    def on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        """状态变化监听：记录状态转换，重新评估错误循环和找不到活动"""
+        at = self._parse_time(new.get("last_update"))
+        if at is None:
+            return
+        status = new.get("status")
+        state = self._state.get(username)
+        if state is None:
+            state = self._state[username] = {
+                "status": None,
+                "status_since": at,
+                "error_entries": deque(),  # 进入Error的时间
+                "watching_at": at,  # 最后一次Watching的时间（首次观察时从观察时间开始计算）
+                "games_checked": set(),
+                "last_update": at
+            }
+        if status != state["status"]:
+            state["status"] = status
+            state["status_since"] = at
+            if status == "Error":
+                state["error_entries"].append(at)
+        window = timedelta(minutes=settings.watchdog_error_window_minutes)
+        while state["error_entries"] and at - state["error_entries"][0] > window:
+            state["error_entries"].popleft()
+
+        if status == "Watching":
+            state["watching_at"] = at
+            state["games_checked"].clear()
+        elif status == "Seeking" and new.get("campaign"):
+            state["games_checked"].add(new["campaign"].get("game"))
+        state["last_update"] = at
+
+        if username in self._enabled:
+            self._evaluate(username, datetime.now(timezone.utc))
+
+    def _detect(self, login: str, state: Dict, now: datetime) -> Dict[str, Optional[Dict]]:
+        """各类型异常的证据，没有异常时为None"""
+        detected: Dict[str, Optional[Dict]] = dict.fromkeys(KINDS)
+        at = state["last_update"]
+
+        errors = len(state["error_entries"])
+        in_error = (at - state["status_since"]).total_seconds() / 60 if state["status"] == "Error" else 0
+        if errors >= settings.watchdog_error_threshold or in_error >= settings.watchdog_error_minutes:
+            detected[ERROR_LOOP] = {
+                "error_entries": errors,
+                "window_minutes": settings.watchdog_error_window_minutes,
+                "error_minutes": round(in_error, 1),
+                "recent_errors": [
+                    message for message in bot_monitor.get_recent_messages(login, 200)
+                    if "[ERR]" in message or "Error" in message
+                ][-5:]
+            }
+
+        if state["status"] in ("Seeking", "Idle"):
+            hours = (at - state["watching_at"]).total_seconds() / 3600
+            if hours >= settings.watchdog_seeking_hours:
+                detected[SEEKING_NO_CAMPAIGN] = {
+                    "status": state["status"],
+                    "since": state["watching_at"].isoformat(),
+                    "hours": round(hours, 2),
+                    "games_checked": sorted(game for game in state["games_checked"] if game)
+                }
+
+        stale_minutes = (now - at).total_seconds() / 60
+        if stale_minutes >= settings.watchdog_stale_minutes:
+            detected[LOG_STALLED] = {
+                "last_update": at.isoformat(),
+                "minutes_since_update": round(stale_minutes, 1),
+                "last_status": state["status"]
+            }
+        return detected
+
+    def _evaluate(self, login: str, now: datetime, restarting: bool = False):
+        """比较检测结果和进行中的异常，打开或关闭异常记录"""
+        state = self._state.get(login)
+        if state is None:
+            return
+        for kind, evidence in self._detect(login, state, now).items():
+            key = (login, kind)
+            incident = self._incidents.get(key)
+            if kind == LOG_STALLED and restarting:
+                # 重启期间日志本来就会中断，保持原状
+                continue
+            if evidence is not None and incident is None:
+                incident = self._incidents[key] = {
+                    "id": uuid.uuid4().hex[:12],
+                    "login": login,
+                    "kind": kind,
+                    "opened_at": now.isoformat(),
+                    "updated_at": now.isoformat(),
+                    "evidence": evidence,
+                    "remediation": None
+                }
+                print(f"[Watchdog] ⚠️ {login} 检测到异常 {kind}: {evidence}")
+                self._emit("incident_opened", incident)
+            elif evidence is not None:
+                incident["evidence"] = evidence
+                incident["updated_at"] = now.isoformat()
+            elif incident is not None:
+                del self._incidents[key]
+                print(f"[Watchdog] ✅ {login} 异常已恢复 {kind}")
+                self._emit("incident_resolved", incident, resolved_at=now.isoformat())
+
+    def _resolve(self, login: str, reason: str):
+        now = datetime.now(timezone.utc).isoformat()
+        for key in [key for key in self._incidents if key[0] == login]:
+            incident = self._incidents.pop(key)
+            self._emit("incident_resolved", incident, resolved_at=now, reason=reason)
+
+    async def _remediate(self, enabled: Dict[str, Dict]):
+        """对尚未处理的异常执行配置的处理方式"""
+        from app.services.config_service import config_service
+        from app.services.remote_fleet import remote_fleet, NodeOfflineError
+        from app.services.restart_orchestrator import restart_orchestrator, RestartInProgressError
+
+        for incident in list(self._incidents.values()):
+            if incident["remediation"] is not None:
+                continue
+            action = settings.watchdog_remediation.get(incident["kind"], "none")
+            if action not in REMEDIATIONS:
+                action = "none"
+            affected = sum(1 for login, kind in self._incidents if kind == incident["kind"] and login in enabled)
+            fleet_wide = len(enabled) > 1 and affected / len(enabled) > settings.watchdog_fleet_fraction
+            result = {"action": action, "at": datetime.now(timezone.utc).isoformat(), "status": "skipped"}
+
+            if action == "none":
+                result["message"] = "未配置处理方式"
+            elif action == "disable":
+                if fleet_wide:
+                    # 全局问题时禁用账号无济于事，留给管理员处理
+                    result["message"] = f"{affected}/{len(enabled)} 个账号出现同类异常，视为全局问题，不禁用账号"
+                else:
+                    try:
+                        if config_service.update_user_enabled(enabled[incident["login"]].get("Id"), False):
+                            result.update(status="done", message="已禁用账号")
+                        else:
+                            result.update(status="failed", message="写入配置失败")
+                    except NodeOfflineError as e:
+                        result.update(status="failed", message=str(e))
+            else:
+                # 远程节点的账号由所属节点重启它的drop容器，重启间隔按节点分别计算
+                node = config_service.get_user_node(incident["login"])
+                last_restart = self._last_restart.get(node)
+                since_last = time.monotonic() - last_restart if last_restart is not None else None
+                if node is None and restart_orchestrator.running:
+                    # 等待进行中的重启结束后再判断
+                    continue
+                if since_last is not None and since_last < settings.watchdog_restart_min_interval:
+                    result["message"] = f"距上次重启仅 {since_last:.0f} 秒，跳过"
+                elif node is not None:
+                    self._last_restart[node] = time.monotonic()
+                    command_id = remote_fleet.send_command(
+                        node, "restart", {"reason": f"watchdog:{incident['kind']}:{incident['login']}"}
+                    )
+                    if command_id is not None:
+                        result.update(status="done", message=f"已让节点 {node} 重启drop容器", command_id=command_id)
+                    else:
+                        result.update(status="failed", message=f"节点 {node} 未连接")
+                else:
+                    self._last_restart[node] = time.monotonic()
+                    try:
+                        # 分片模式下只重启该账号所在的分片
+                        restart_result, report = await restart_orchestrator.start(
+                            f"watchdog:{incident['kind']}:{incident['login']}",
+                            shard=config_service.get_user_shard(incident["login"])
+                        )
+                        result.update(status="done" if restart_result.get("status") == "success" else "failed",
+                                      message=restart_result.get("message"), report_id=report["id"])
+                    except RestartInProgressError:
+                        continue
+                    except Exception as e:
+                        result.update(status="failed", message=str(e))
+
+            incident["remediation"] = result
+            print(f"[Watchdog] {incident['login']} {incident['kind']} 处理: {action} -> {result['status']}"
+                  f"（{result.get('message')}）")
+            self._emit("remediation", incident, remediation=result)
+
+    async def check(self) -> List[Dict]:
+        """检查所有启用账号（含日志停止更新），执行处理，返回进行中的异常"""
+        from app.services.config_service import config_service
+        from app.services.restart_orchestrator import restart_orchestrator
+
+        enabled = {
+            user["Login"]: user for user in config_service.get_users()
+            if user.get("Login") and user.get("Enabled", True)
+        }
+        self._enabled = set(enabled)
+        for login in {login for login, _ in self._incidents} - self._enabled:
+            # 账号被禁用或删除：不再检测，关闭其异常
+            self._resolve(login, "disabled")
+        # 重启后的恢复等待期间不判断日志停止更新
+        restarting = restart_orchestrator.running
+        now = datetime.now(timezone.utc)
+        for login in enabled:
+            self._evaluate(login, now, restarting)
+        await self._remediate(enabled)
+        return self.get_incidents()
+
+    def evict_users(self, active_usernames) -> List[str]:
+        """清理已不在配置中的账号"""
+        stale = [login for login in self._state if login not in active_usernames]
+        for login in stale:
+            del self._state[login]
+            self._resolve(login, "removed")
+        return stale
+
+    def get_incidents(self) -> List[Dict]:
+        """进行中的异常（最早的在前）"""
+        return sorted(self._incidents.values(), key=lambda incident: incident["opened_at"])
+
+    def get_events(self, limit: int = 50) -> List[Dict]:
+        """最近的事件（最新的在前）"""
+        return list(reversed(self.events))[:limit]
+
+    def wake(self):
+        """立即执行一次检查"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"[Watchdog] 检查失败: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.watchdog_check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _publish_event(self, event: Dict):
+        """把事件推送给订阅全体状态的管理员WebSocket连接"""
+        from app.services.connection_manager import manager, FLEET_TOPIC
+
+        if manager.has_subscribers(FLEET_TOPIC):
+            manager.publish(FLEET_TOPIC, json.dumps({"type": "watchdog_event", "topic": FLEET_TOPIC, "event": event},
+                                                    ensure_ascii=False))
+
+    def start(self):
+        """启动后台检查任务"""
+        if self._task is None:
+            print(f"[Watchdog] 启动账号异常检测，检查周期: {settings.watchdog_check_interval}秒，"
+                  f"处理方式: {settings.watchdog_remediation or '无'}")
+            self.add_listener(self._publish_event)
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+account_watchdog = AccountWatchdog()
@@ -0,0 +1,338 @@
+"""添加账号任务管理 - 并发执行多个 --add-account 会话"""
+import asyncio
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Set
+
+from app.config import settings
+from app.utils.docker_client import ExecStream
+
+# 通过sh启动bot并先输出容器内的PID（exec inspect返回的Pid属于宿主机PID命名空间，不能在容器内kill）
+PID_MARKER = "__PID__="
+ADD_ACCOUNT_CMD = [
+    "sh", "-c", f'echo "{PID_MARKER}$$"; exec "$0" "$@"',
+    "dotnet", "TwitchDropsBot.Console.dll", "--add-account"
+]
+
+# 任务状态
+STARTING = "starting"          # 正在启动，尚未得到授权链接
+WAITING_AUTH = "waiting_auth"  # 已得到授权链接，等待用户授权
+COMPLETED = "completed"        # 新账号已出现在config.json中
+FAILED = "failed"              # bot退出但未添加账号，或启动失败
+TIMEOUT = "timeout"            # 超过时限未完成授权
+CANCELLED = "cancelled"        # 管理员取消
+
+ACTIVE_STATES = (STARTING, WAITING_AUTH)
+
+
+class JobLimitError(Exception):
+    """同时进行的任务数已达上限"""
+    pass
+
+
+def parse_auth_info(line: str) -> Optional[Dict[str, str]]:
+    """
+    从bot输出中提取授权链接和代码
+    例如：https://www.twitch.tv/activate?device-code=BGVRDDZK and enter the code: BGVRDDZK
+    """
+    if 'twitch.tv/activate' not in line.lower():
+        return None
+    url_match = re.search(r'(https://[^\s]+)', line)
+    if not url_match:
+        return None
+    url = url_match.group(1)
+    # 尝试从URL提取代码（device-code或user_code参数）
+    code_match = re.search(r'(?:device-code|user_code)=([A-Z0-9\-]+)', url, re.IGNORECASE)
+    # 如果URL中没找到，尝试从消息中提取 "enter the code: XXXX"
+    if not code_match:
+        code_match = re.search(r'enter the code[:\s]+([A-Z0-9\-]+)', line, re.IGNORECASE)
+    if not code_match:
+        return None
+    return {"verification_uri": url, "user_code": code_match.group(1)}
+
+
+class AddAccountJob:
+    """单个添加账号会话"""
+
+    def __init__(self, known_logins: Set[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = STARTING
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.verification_uri: Optional[str] = None
+        self.user_code: Optional[str] = None
+        self.added_login: Optional[str] = None
+        self.error: Optional[str] = None
+        self.exit_code: Optional[int] = None
+        self.exec_id: Optional[str] = None
+        self.container_id: Optional[str] = None
+        # bot进程在容器内的PID
+        self.pid: Optional[int] = None
+        # 分片模式下执行命令的分片（新账号写入该分片的配置文件后加入主配置）
+        self.shard: Optional[int] = None
+        self.output: deque = deque(maxlen=settings.add_account_output_lines)
+        # 启动时config.json中已有的账号，用于识别新添加的账号
+        self.known_logins = known_logins
+        self.stream: Optional[ExecStream] = None
+        self.task: Optional[asyncio.Task] = None
+        # 得到授权链接或任务结束时置位
+        self.ready = asyncio.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATES
+
+    def finish(self, status: str, error: Optional[str] = None):
+        """结束任务（只有第一次调用生效）"""
+        if self.finished_at is not None:
+            return
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.ready.set()
+
+    def to_dict(self, include_output: bool = False) -> Dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "verification_uri": self.verification_uri,
+            "user_code": self.user_code,
+            "added_login": self.added_login,
+            "exit_code": self.exit_code,
+            "pid": self.pid,
+            "shard": self.shard,
+            "error": self.error
+        }
+        if include_output:
+            data["output"] = list(self.output)
+        return data
+
+
+class AddAccountJobManager:
+    """
+    添加账号任务管理器
+
+    每个任务在drop容器中执行一次 --add-account，独立保存输出和状态。
+    通过配置变化事件识别新账号：任务启动后出现在config.json中的新账号归属于
+    输出中提到该账号的任务，否则归属于最早开始等待授权的任务。
+    """
+
+    def __init__(self):
+        self.max_jobs = settings.add_account_max_jobs
+        self.timeout = settings.add_account_timeout
+        self.retention = settings.add_account_job_retention
+        self._jobs: "OrderedDict[str, AddAccountJob]" = OrderedDict()
+        self._listening = False
+
+    def _ensure_listener(self):
+        if not self._listening:
+            from app.services.config_service import config_service
+            config_service.add_listener(self.on_config_change)
+            self._listening = True
+
+    @staticmethod
+    def _logins(config: Dict) -> Set[str]:
+        return {user.get("Login") for user in config.get("Users", []) if user.get("Login")}
+
+    def _cleanup(self):
+        """删除超过保留时长的已结束任务"""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.retention]:
+            del self._jobs[job_id]
+
+    def active_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.active)
+
+    async def start_job(self, wait: float = 30) -> AddAccountJob:
+        """启动新任务，等待得到授权链接（最多wait秒）后返回"""
+        from app.services.config_service import config_service
+
+        self._cleanup()
+        if self.active_count() >= self.max_jobs:
+            raise JobLimitError(f"同时进行的添加账号任务已达上限（{self.max_jobs}）")
+        self._ensure_listener()
+
+        job = AddAccountJob(self._logins(config_service.get_config()))
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        print(f"[AddAccount] 启动任务 {job.id}")
+
+        try:
+            await asyncio.wait_for(job.ready.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            print(f"[AddAccount] 任务 {job.id} 未能在{wait}秒内得到授权链接")
+        return job
+
+    async def _run(self, job: AddAccountJob):
+        """任务主体：执行命令、读取输出，直到bot退出、超时或被取消"""
+        from app.services.config_service import config_service
+        from app.services.docker_service import docker_service
+
+        client = docker_service.client
+        try:
+            if config_service.sharded:
+                job.shard = config_service.next_shard()
+            container = await docker_service.get_drop_container(job.shard)
+            job.container_id = container["Id"]
+            job.exec_id = await client.exec_create(job.container_id, ADD_ACCOUNT_CMD, stdin=True)
+            job.stream = await client.exec_start(job.exec_id)
+
+            # 自动发送 'Y' 确认（bot可能会询问是否继续）
+            try:
+                await job.stream.write(b'Y\n')
+            except Exception as e:
+                print(f"[AddAccount] {job.id} 发送确认失败（可能不需要）: {e}")
+
+            await asyncio.wait_for(self._pump(job), timeout=self.timeout)
+            # bot写入config.json后立即退出：先重新检查配置（分片模式下包括分片配置），
+            # 不等待下一次配置监视，新账号由on_config_change归属到任务
+            config_service._check_for_changes()
+            if job.active:
+                job.finish(FAILED, "bot已退出，未检测到新账号")
+        except asyncio.TimeoutError:
+            job.finish(TIMEOUT, f"{self.timeout}秒内未完成授权")
+        except asyncio.CancelledError:
+            job.finish(CANCELLED)
+        except Exception as e:
+            print(f"[AddAccount] ❌ 任务 {job.id} 异常: {e}")
+            job.finish(FAILED, str(e))
+        finally:
+            if job.stream is not None:
+                await job.stream.close()
+                job.stream = None
+            await self._reap(job)
+            print(f"[AddAccount] 任务 {job.id} 结束: {job.status}（退出码 {job.exit_code}）")
+
+    async def _wait_exit(self, exec_id: str, timeout: float) -> Dict:
+        """等待exec进程退出（最多timeout秒），返回最后一次exec inspect的结果"""
+        from app.services.docker_service import docker_service
+
+        deadline = time.monotonic() + timeout
+        while True:
+            info = await docker_service.client.exec_inspect(exec_id)
+            if not info.get("Running") or time.monotonic() >= deadline:
+                return info
+            await asyncio.sleep(0.2)
+
+    async def _kill(self, job: AddAccountJob, signal: str):
+        """在容器中另起一个exec向bot进程发送信号"""
+        from app.services.docker_service import docker_service
+
+        client = docker_service.client
+        exec_id = await client.exec_create(job.container_id, ["kill", f"-{signal}", str(job.pid)])
+        stream = await client.exec_start(exec_id)
+        try:
+            async for line in stream.lines():
+                if line.strip():
+                    print(f"[AddAccount] {job.id} kill输出: {line.strip()}")
+        finally:
+            await stream.close()
+
+    async def _reap(self, job: AddAccountJob):
+        """
+        确认bot进程已退出：关闭附加流后bot通常随stdin关闭退出，
+        ADD_ACCOUNT_KILL_GRACE秒后仍在运行则发送TERM，再等待同样时间后发送KILL，最后记录退出码
+        """
+        if job.exec_id is None:
+            return
+        grace = settings.add_account_kill_grace
+        try:
+            info = await self._wait_exit(job.exec_id, grace)
+            for signal in ("TERM", "KILL"):
+                if not info.get("Running"):
+                    break
+                if job.pid is None:
+                    print(f"[AddAccount] ⚠️ 任务 {job.id} 的bot进程仍在运行，但未获得进程PID，无法结束")
+                    break
+                print(f"[AddAccount] 任务 {job.id} 的bot进程（PID {job.pid}）仍在运行，发送{signal}")
+                await self._kill(job, signal)
+                info = await self._wait_exit(job.exec_id, grace)
+            if info.get("Running"):
+                print(f"[AddAccount] ❌ 任务 {job.id} 的bot进程未能结束")
+            job.exit_code = info.get("ExitCode")
+        except Exception as e:
+            print(f"[AddAccount] ⚠️ 任务 {job.id} 检查bot进程失败: {e}")
+
+    async def _pump(self, job: AddAccountJob):
+        """读取bot输出，提取授权信息"""
+        async for line in job.stream.lines():
+            line = line.strip()
+            if not line:
+                continue
+            if job.pid is None and line.startswith(PID_MARKER):
+                try:
+                    job.pid = int(line[len(PID_MARKER):])
+                except ValueError:
+                    pass
+                continue
+            job.output.append(line)
+            print(f"[AddAccount] {job.id} Bot输出: {line}")
+            if job.status == STARTING:
+                auth_info = parse_auth_info(line)
+                if auth_info:
+                    job.verification_uri = auth_info["verification_uri"]
+                    job.user_code = auth_info["user_code"]
+                    job.status = WAITING_AUTH
+                    job.ready.set()
+                    print(f"[AddAccount] ✅ {job.id} 提取到授权信息: {auth_info}")
+
+    def on_config_change(self, config: Dict):
+        """配置变化时检查是否有新账号，并归属到等待授权的任务"""
+        waiting = [job for job in self._jobs.values() if job.status == WAITING_AUTH]
+        if not waiting:
+            return
+        logins = self._logins(config)
+        for job in waiting:
+            new_logins = sorted(logins - job.known_logins)
+            if not new_logins:
+                continue
+            # 优先选择输出中提到的账号
+            output = "\n".join(job.output).lower()
+            mentioned = [login for login in new_logins if login.lower() in output]
+            login = (mentioned or new_logins)[0]
+            job.added_login = login
+            job.finish(COMPLETED)
+            print(f"[AddAccount] ✅ 任务 {job.id} 检测到新账号: {login}")
+            # 其他任务不再认领这个账号
+            for other in waiting:
+                other.known_logins.add(login)
+            # 给bot留出时间自行退出，之后关闭连接（已在回收进程时不再取消）
+            if job.task is not None:
+                asyncio.get_running_loop().call_later(10, self._cancel_attached, job)
+
+    @staticmethod
+    def _cancel_attached(job: AddAccountJob):
+        if job.stream is not None and job.task is not None:
+            job.task.cancel()
+
+    def get_job(self, job_id: str) -> Optional[AddAccountJob]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        self._cleanup()
+        return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def cancel_job(self, job_id: str) -> Optional[AddAccountJob]:
+        """取消任务（关闭附加流并确认bot进程退出，见_reap）"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.active and job.task is not None:
+            job.task.cancel()
+        return job
+
+    async def shutdown(self):
+        """取消所有进行中的任务"""
+        tasks = [job.task for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+add_account_jobs = AddAccountJobManager()
@@ -1,10 +1,12 @@
 """Bot状态监控服务"""
 import re
 import os
+import time
 from pathlib import Path
-from typing import Dict, Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple
 from datetime import datetime
 from app.config import settings
+from app.utils.metrics import registry, log_bytes_read, log_lines_parsed, log_parse_seconds
 
 
 class BotStatusMonitor:
@@ -17,8 +19,128 @@ class BotStatusMonitor:
         self._file_positions: Dict[str, Tuple[int, int, int]] = {}
         # 记录每个用户的完整消息历史（用于状态判断）
         self._message_history: Dict[str, List[str]] = {}
+        # 每个用户上一次的状态摘要（用于检测状态变化）
+        self._summaries: Dict[str, Dict] = {}
+        # 状态变化监听器 callback(username, old_summary, new_summary)
+        self._listeners: List[Callable[[str, Optional[Dict], Dict], None]] = []
+        # 状态代数：任一用户状态变化时递增
+        self.generation = 0
+        # 每个用户的状态版本 {username: version}
+        self._versions: Dict[str, int] = {}
+        # 远程节点上报的账号状态（中心模式） {username: status_info}，这些账号不读取本地日志
+        self._remote: Dict[str, Dict] = {}
         print("[BotMonitor] 初始化完成，启用增量读取模式")
+
+    def add_listener(self, callback: Callable[[str, Optional[Dict], Dict], None]):
+        """注册状态变化监听器"""
+        self._listeners.append(callback)
+
+    @staticmethod
+    def summarize(status_info: Dict) -> Dict:
+        """状态摘要（不含日志内容）"""
+        return {
+            "status": status_info.get("status"),
+            "last_update": status_info.get("last_update"),
+            "campaign": status_info.get("campaign"),
+            "broadcaster": status_info.get("broadcaster"),
+            "progress": status_info.get("progress")
+        }
+
+    def _publish(self, username: str, status_info: Dict):
+        """比较新旧状态摘要，有变化时通知监听器"""
+        summary = self.summarize(status_info)
+        old = self._summaries.get(username)
+        if old == summary:
+            return
+        self._summaries[username] = summary
+        self.generation += 1
+        # 使用全局代数作为版本，账号被清理后重新加入也不会出现重复版本
+        self._versions[username] = self.generation
+        for callback in self._listeners:
+            try:
+                callback(username, old, summary)
+            except Exception as e:
+                print(f"[BotMonitor] 状态监听器异常 {username}: {e}")
+
+    def get_user_version(self, username: str) -> int:
+        """用户状态版本（该用户状态摘要最后一次变化时的状态代数）"""
+        return self._versions.get(username, 0)
+
+    def get_cached_summary(self, username: str) -> Optional[Dict]:
+        """获取最近一次的状态摘要（不读取日志文件）"""
+        return self._summaries.get(username)
+
+    def get_recent_messages(self, username: str, limit: int = 20) -> List[str]:
+        """最近的日志消息（已读取的历史，不读取日志文件）"""
+        return self._message_history.get(username, [])[-limit:]
+
+    def update_remote(self, username: str, summary: Dict):
+        """远程节点上报的状态摘要（与本地日志解析的状态一样通知监听器）"""
+        status_info = {**self.summarize(summary), "recent_logs": []}
+        self._remote[username] = status_info
+        self._publish(username, status_info)
+
+    def remove_remote(self, usernames) -> None:
+        """移除远程账号的状态（账号已从节点删除或节点被移除）"""
+        for username in usernames:
+            self._remote.pop(username, None)
+
+    def tracked_usernames(self) -> List[str]:
+        """持有缓存状态的所有账号"""
+        tracked = set(self._status_cache) | set(self._file_positions) | set(self._message_history)
+        tracked |= set(self._summaries) | set(self._versions) | set(self._remote)
+        return sorted(tracked)
+
+    def evict_users(self, active_usernames) -> List[str]:
+        """清理已不在配置中的账号的缓存状态，返回被清理的账号"""
+        active = set(active_usernames)
+        stale = [username for username in self.tracked_usernames() if username not in active]
+        for username in stale:
+            self._status_cache.pop(username, None)
+            self._file_positions.pop(username, None)
+            self._message_history.pop(username, None)
+            self._summaries.pop(username, None)
+            self._versions.pop(username, None)
+            self._remote.pop(username, None)
+        if stale:
+            self.generation += 1
+            print(f"[BotMonitor] 清理 {len(stale)} 个已删除账号的缓存状态: {', '.join(stale)}")
+        return stale
     
+    def log_directories(self) -> List[Path]:
+        """所有日志目录（分片模式下为各分片的日志目录，之后是默认日志目录）"""
+        from app.services.config_service import config_service
+
+        if not config_service.sharded:
+            return [self.logs_dir]
+        return [config_service.shard_logs_dir(shard) for shard in range(settings.shard_count)] + [self.logs_dir]
+
+    def log_path(self, username: str) -> Path:
+        """
+        账号的日志文件
+
+        分片模式下优先使用账号所在分片的日志目录；该目录还没有日志时（刚移动到新分片）
+        使用其他目录中最近修改的日志文件，直到新分片开始写日志。
+        """
+        from app.services.config_service import config_service
+
+        if not config_service.sharded:
+            return self.logs_dir / f"{username}.txt"
+        shard = config_service.get_user_shard(username)
+        preferred = config_service.shard_logs_dir(shard) / f"{username}.txt" if shard is not None else None
+        if preferred is not None and preferred.exists():
+            return preferred
+        newest, newest_mtime = None, -1.0
+        for directory in self.log_directories():
+            candidate = directory / f"{username}.txt"
+            try:
+                mtime = candidate.stat().st_mtime
+            except OSError:
+                continue
+            if mtime > newest_mtime:
+                newest, newest_mtime = candidate, mtime
+        return newest or preferred or self.logs_dir / f"{username}.txt"
+
     def _parse_log_line(self, line: str) -> Optional[Dict]:
         """解析单行日志"""
         # 日志格式: YYYY-MM-DD HH:mm:ss.fff +TZ [LEVEL] [username] : message
@@ -155,6 +277,7 @@ class BotStatusMonitor:
                     # 全量读取（首次或文件变化）
                     print(f"[BotMonitor] {username}: 全量读取日志文件")
                     lines = f.readlines()
+                    log_bytes_read.inc(current_size)
                     # 记录新位置
                     self._file_positions[username] = (current_size, current_size, current_inode)
                     return lines
@@ -162,6 +285,7 @@ class BotStatusMonitor:
                     # 增量读取（只读新增内容）
                     f.seek(last_pos)
                     new_lines = f.readlines()
+                    log_bytes_read.inc(current_size - last_pos)
                     print(f"[BotMonitor] {username}: 增量读取 {len(new_lines)} 行新日志")
                     # 更新位置
                     self._file_positions[username] = (current_size, current_size, current_inode)
@@ -176,10 +300,12 @@ class BotStatusMonitor:
 
     def get_user_status(self, username: str) -> Dict:
         """获取用户状态（支持增量更新）"""
-        log_file = self.logs_dir / f"{username}.txt"
+        if username in self._remote:
+            return self._remote[username]
+        log_file = self.log_path(username)
 
         if not log_file.exists():
-            return {
+            result = {
                 "status": "Unknown",
                 "last_update": None,
                 "campaign": None,
@@ -187,6 +313,8 @@ class BotStatusMonitor:
                 "progress": None,
                 "recent_logs": []
             }
+            self._publish(username, result)
+            return result
 
         try:
             # 增量读取新日志
@@ -201,12 +329,16 @@ class BotStatusMonitor:
             new_messages = []
             last_timestamp = None
 
+            parse_started = time.perf_counter()
             for line in new_lines:
                 parsed = self._parse_log_line(line.strip())
                 if parsed:
                     parsed_logs.append(parsed)
                     new_messages.append(parsed["message"])
                     last_timestamp = parsed.get("timestamp")
+            if new_lines:
+                log_lines_parsed.inc(len(new_lines))
+                log_parse_seconds.inc(time.perf_counter() - parse_started)
 
             # 更新消息历史（保留最近1000条）
             if new_messages:
@@ -227,11 +359,16 @@ class BotStatusMonitor:
             # 获取最后更新时间
             if not last_timestamp and parsed_logs:
                 last_timestamp = parsed_logs[-1].get("timestamp")
+            if last_timestamp:
+                last_update = last_timestamp.isoformat()
+            else:
+                # 没有新日志时沿用上一次的时间
+                last_update = self._status_cache.get(username, {}).get("last_update")
 
             # 更新缓存
             result = {
                 "status": status,
-                "last_update": last_timestamp.isoformat() if last_timestamp else None,
+                "last_update": last_update,
                 "campaign": campaign_info,
                 "broadcaster": broadcaster,
                 "progress": progress,
@@ -239,6 +376,7 @@ class BotStatusMonitor:
             }
 
             self._status_cache[username] = result
+            self._publish(username, result)
             return result
 
         except Exception as e:
@@ -267,3 +405,39 @@ class BotStatusMonitor:
 
 bot_monitor = BotStatusMonitor()
 
+
+def _collect_status_counts() -> Dict[Tuple[str, ...], float]:
+    """每种状态的账号数"""
+    counts: Dict[Tuple[str, ...], float] = {}
+    for summary in bot_monitor._summaries.values():
+        key = (summary.get("status") or "Unknown",)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _collect_watched_minutes() -> Dict[Tuple[str, ...], float]:
+    """每个账号当前Drop已观看分钟数"""
+    return {
+        (username,): summary["progress"].get("current", 0)
+        for username, summary in bot_monitor._summaries.items()
+        if summary.get("progress")
+    }
+
+
+def _collect_seconds_since_log() -> Dict[Tuple[str, ...], float]:
+    """每个账号距最后一条日志的秒数"""
+    result: Dict[Tuple[str, ...], float] = {}
+    for username, summary in bot_monitor._summaries.items():
+        last_update = summary.get("last_update")
+        if not last_update:
+            continue
+        timestamp = datetime.fromisoformat(last_update)
+        now = datetime.now(timestamp.tzinfo) if timestamp.tzinfo else datetime.now()
+        result[(username,)] = max((now - timestamp).total_seconds(), 0)
+    return result
+
+
+registry.gauge("twitch_bot_accounts", "各状态的账号数", ("status",), _collect_status_counts)
+registry.gauge("twitch_bot_watched_minutes", "账号当前Drop已观看分钟数", ("account",), _collect_watched_minutes)
+registry.gauge("twitch_bot_seconds_since_last_log", "账号距最后一条日志的秒数", ("account",), _collect_seconds_since_log)
+
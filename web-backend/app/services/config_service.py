@@ -1,10 +1,15 @@
 """config.json管理服务"""
+import asyncio
 import json
 import fcntl
 import os
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 from app.config import settings
+from app.utils.metrics import config_read_duration, config_write_duration
+
+# 由主配置（Web后台）管理的账号字段；分片模式下其他字段（凭据等）以分片中bot写入的为准
+MASTER_USER_FIELDS = ("Login", "Id", "Enabled", "FavouriteGames")
 
 
 class ConfigService:
@@ -14,8 +19,144 @@ class ConfigService:
         self.config_path = Path(settings.config_file_path)
         self._cache: Optional[Dict[str, Any]] = None
         self._last_modified: float = 0
+        # 配置代数：配置内容重新加载或写入时递增
+        self.generation = 0
+        # 配置变化监听器 callback(config)，配置重新加载或写入后调用
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._watch_task: Optional[asyncio.Task] = None
+        self._observer = None
+        # 等待账号出现的调用者 {login: [future]}，共用同一个配置监视
+        self._user_waiters: Dict[str, List[asyncio.Future]] = {}
+        # 分片模式：账号分配 {login: shard}（缓存shards/assignments.json）及其修改时间
+        self._assignments: Optional[Dict[str, int]] = None
+        self._assignments_modified: float = 0
+        # 各分片配置文件最后一次读取或写入时的修改时间 {shard: mtime}
+        self._shard_mtimes: Dict[int, float] = {}
+        # 最近一次生成分片配置时内容有变化的分片
+        self._last_shard_sync: List[int] = []
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """注册配置变化监听器（回调在事件循环中同步执行，不应修改传入的配置）"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """移除配置变化监听器"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self):
+        """通知监听器配置已变化"""
+        if self.sharded:
+            try:
+                self.sync_shards()
+            except Exception as e:
+                print(f"[ConfigService] 生成分片配置失败: {e}")
+        if self._user_waiters:
+            self._resolve_user_waiters()
+        for callback in list(self._listeners):
+            try:
+                callback(self._cache)
+            except Exception as e:
+                print(f"[ConfigService] 配置监听器异常: {e}")
+
+    def _check_for_changes(self):
+        """检查配置文件是否被外部修改（修改时get_config会重新加载并触发监听器）"""
+        try:
+            self.get_config()
+        except Exception as e:
+            print(f"[ConfigService] 检查配置文件失败: {e}")
+        if self.sharded:
+            try:
+                self._import_shard_users()
+            except Exception as e:
+                print(f"[ConfigService] 检查分片配置失败: {e}")
+
+    async def _watch(self):
+        """定期检查config.json的修改时间（文件系统事件不可用或丢失时的兜底）"""
+        while True:
+            await asyncio.sleep(settings.config_watch_interval)
+            self._check_for_changes()
+
+    def _start_observer(self, loop: asyncio.AbstractEventLoop):
+        """使用watchdog监听config.json所在目录的文件事件，外部修改后立即重新加载"""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("[ConfigService] 未安装watchdog，仅使用定期检查")
+            return
+
+        config_path = str(self.config_path.resolve())
+        check = self._check_for_changes
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = (getattr(event, "src_path", None), getattr(event, "dest_path", None))
+                if config_path in paths:
+                    loop.call_soon_threadsafe(check)
+
+        try:
+            observer = Observer()
+            observer.schedule(_Handler(), str(self.config_path.resolve().parent), recursive=False)
+            observer.daemon = True
+            observer.start()
+            self._observer = observer
+        except Exception as e:
+            print(f"[ConfigService] 启动文件事件监听失败，仅使用定期检查: {e}")
+
+    def start_watcher(self):
+        """启动配置文件监视（文件系统事件 + 定期检查）"""
+        if self._watch_task is None:
+            print(f"[ConfigService] 启动配置文件监视，检查间隔: {settings.config_watch_interval}秒")
+            self._start_observer(asyncio.get_running_loop())
+            self._watch_task = asyncio.create_task(self._watch())
+
+    def stop_watcher(self):
+        """停止配置文件监视"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def _resolve_user_waiters(self):
+        """唤醒等待的账号已出现在配置中的调用者"""
+        users = {user.get("Login"): user for user in (self._cache or {}).get("Users", []) if user.get("Login")}
+        for login in [login for login in self._user_waiters if login in users]:
+            for future in self._user_waiters.pop(login):
+                if not future.done():
+                    future.set_result(users[login])
+
+    async def wait_for_user(self, login: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        等待账号出现在config.json中，返回账号配置；超时返回None
+
+        所有等待者共用同一个配置监视，不各自轮询文件。
+        """
+        user = self.get_user_by_login(login)
+        if user or timeout <= 0:
+            return user
+
+        future = asyncio.get_running_loop().create_future()
+        self._user_waiters.setdefault(login, []).append(future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._user_waiters.get(login)
+            if waiters is not None and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._user_waiters[login]
     
     def _read_config(self) -> Dict[str, Any]:
+        """读取配置文件（记录耗时指标）"""
+        with config_read_duration.time():
+            return self._read_config_locked()
+
+    def _read_config_locked(self) -> Dict[str, Any]:
         """读取配置文件（带文件锁）"""
         if not self.config_path.exists():
             return self._get_default_config()
@@ -40,6 +181,11 @@ class ConfigService:
             return self._get_default_config()
     
     def _write_config(self, data: Dict[str, Any]) -> bool:
+        """写入配置文件（记录耗时指标）"""
+        with config_write_duration.time():
+            return self._write_config_locked(data)
+
+    def _write_config_locked(self, data: Dict[str, Any]) -> bool:
         """写入配置文件（带文件锁）"""
         try:
             # 确保目录存在
@@ -64,6 +210,8 @@ class ConfigService:
 
                     self._cache = data
                     self._last_modified = os.path.getmtime(self.config_path)
+                    self.generation += 1
+                    self._notify()
                     return True
                 except (IOError, OSError) as e:
                     if attempt < max_retries - 1:
@@ -105,15 +253,39 @@ class ConfigService:
             if current_modified != self._last_modified or self._cache is None:
                 self._cache = self._read_config()
                 self._last_modified = current_modified
-        else:
+                self.generation += 1
+                self._notify()
+        elif self._cache is None or self._last_modified != 0:
             self._cache = self._get_default_config()
+            self._last_modified = 0
+            self.generation += 1
+            self._notify()
         
         return self._cache.copy()
     
-    def get_users(self) -> List[Dict[str, Any]]:
-        """获取用户列表"""
+    def get_local_users(self) -> List[Dict[str, Any]]:
+        """本机config.json中的用户列表"""
         config = self.get_config()
         return config.get("Users", [])
+
+    def get_users(self) -> List[Dict[str, Any]]:
+        """获取用户列表（中心模式下包括远程节点上报的账号，带Node字段）"""
+        from app.services.remote_fleet import remote_fleet
+
+        users = self.get_local_users()
+        if not remote_fleet.has_users():
+            return users
+        local = {user.get("Login") for user in users}
+        return users + [user for user in remote_fleet.get_users() if user["Login"] not in local]
+
+    def get_user_node(self, login: str) -> Optional[str]:
+        """账号所在的远程节点（本机账号返回None）"""
+        user = self.get_user_by_login(login)
+        return user.get("Node") if user else None
+
+    def notify_remote_users_changed(self):
+        """远程节点的账号列表变化：递增配置代数，用户索引和统计随之重建"""
+        self.generation += 1
     
     def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """根据ID获取用户"""
@@ -159,8 +331,22 @@ class ConfigService:
         
         return self._write_config(config)
     
+    def _forward_to_node(self, user_id: str, action: str, args: Dict[str, Any]) -> Optional[bool]:
+        """远程账号的修改发送到其节点执行（节点随后上报配置变化）；本机账号返回None，节点未连接时抛出NodeOfflineError"""
+        from app.services.remote_fleet import remote_fleet, NodeOfflineError
+
+        user = self.get_user_by_id(user_id)
+        if not user or not user.get("Node"):
+            return None
+        if remote_fleet.send_command(user["Node"], action, {"id": user_id, **args}) is None:
+            raise NodeOfflineError(f"账号所在的节点 {user['Node']} 未连接")
+        return True
+
     def delete_user(self, user_id: str) -> bool:
         """删除用户"""
+        forwarded = self._forward_to_node(user_id, "delete_user", {})
+        if forwarded is not None:
+            return forwarded
         config = self.get_config()
         users = config.get("Users", [])
         users = [u for u in users if u.get("Id") != user_id]
@@ -170,6 +356,9 @@ class ConfigService:
     
     def update_user_enabled(self, user_id: str, enabled: bool) -> bool:
         """更新用户启用状态"""
+        forwarded = self._forward_to_node(user_id, "set_enabled", {"enabled": enabled})
+        if forwarded is not None:
+            return forwarded
         config = self.get_config()
         users = config.get("Users", [])
         
@@ -182,6 +371,9 @@ class ConfigService:
     
     def update_user_favourite_games(self, user_id: str, favourite_games: List[str]) -> bool:
         """更新用户优先游戏列表"""
+        forwarded = self._forward_to_node(user_id, "set_favourite_games", {"favourite_games": favourite_games})
+        if forwarded is not None:
+            return forwarded
         config = self.get_config()
         users = config.get("Users", [])
         
@@ -211,5 +403,270 @@ class ConfigService:
         return self._write_config(config)
 
 
+    # ---- 分片 ----
+
+    @property
+    def sharded(self) -> bool:
+        """是否启用分片模式（config.json为主账号列表，每个分片容器读取自己的配置文件）"""
+        return settings.shard_count > 0
+
+    @staticmethod
+    def shard_config_path(shard: int) -> Path:
+        return Path(settings.shards_directory) / str(shard) / "config.json"
+
+    @staticmethod
+    def shard_logs_dir(shard: int) -> Path:
+        return Path(settings.shards_directory) / str(shard) / "logs"
+
+    def _load_assignments(self) -> Dict[str, int]:
+        """读取账号分配（文件修改后重新加载）"""
+        path = Path(settings.shards_directory) / "assignments.json"
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            modified = 0
+        if self._assignments is None or modified != self._assignments_modified:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._assignments = {login: int(shard) for login, shard in json.load(f).items()}
+            except (OSError, ValueError, AttributeError):
+                self._assignments = {}
+            self._assignments_modified = modified
+        return self._assignments
+
+    def _save_assignments(self, assignments: Dict[str, int]):
+        path = Path(settings.shards_directory) / "assignments.json"
+        if assignments == self._load_assignments() and path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(assignments.items())), f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._assignments = dict(assignments)
+        self._assignments_modified = os.path.getmtime(path)
+
+    def get_shard_assignments(self) -> Dict[str, int]:
+        """账号到分片的分配 {login: shard}"""
+        return dict(self._load_assignments())
+
+    def get_user_shard(self, login: str) -> Optional[int]:
+        """账号所在的分片（未启用分片或账号未分配时返回None）"""
+        if not self.sharded:
+            return None
+        return self._load_assignments().get(login)
+
+    def get_shard_accounts(self) -> Dict[int, List[str]]:
+        """每个分片的账号 {shard: [login]}"""
+        result: Dict[int, List[str]] = {shard: [] for shard in range(settings.shard_count)}
+        assignments = self._load_assignments()
+        for user in self.get_local_users():
+            shard = assignments.get(user.get("Login"))
+            if shard in result:
+                result[shard].append(user["Login"])
+        return result
+
+    @staticmethod
+    def _shard_loads(users: List[Dict[str, Any]], assignments: Dict[str, int]) -> Dict[int, int]:
+        """每个分片的启用账号数"""
+        loads = {shard: 0 for shard in range(settings.shard_count)}
+        for user in users:
+            shard = assignments.get(user.get("Login"))
+            if shard in loads and user.get("Enabled", True):
+                loads[shard] += 1
+        return loads
+
+    def _pick_shard(self, users: List[Dict[str, Any]], assignments: Dict[str, int]) -> int:
+        """新账号分配到启用账号最少的分片（所有分片都达到上限时仍分配到最少的分片）"""
+        loads = self._shard_loads(users, assignments)
+        shard = min(loads, key=lambda index: (loads[index], index))
+        if settings.shard_max_accounts and loads[shard] >= settings.shard_max_accounts:
+            print(f"[ConfigService] ⚠️ 所有分片都已达到账号上限（{settings.shard_max_accounts}），分配到分片 {shard}")
+        return shard
+
+    def next_shard(self) -> int:
+        """新账号（--add-account）应在哪个分片的容器中添加"""
+        return self._pick_shard(self.get_local_users(), self._load_assignments())
+
+    def _write_shard_file(self, shard: int, data: Dict[str, Any]) -> bool:
+        """写入分片配置文件（内容未变化时不改写，避免bot重新加载）"""
+        path = self.shard_config_path(shard)
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                unchanged = f.read() == text
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.shard_logs_dir(shard).mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        self._shard_mtimes[shard] = os.path.getmtime(path)
+        return not unchanged
+
+    def sync_shards(self) -> List[int]:
+        """
+        按主配置（config.json）生成各分片的配置文件，返回内容有变化的分片
+
+        未分配的账号分配到启用账号最少的分片，已删除账号的分配被移除，
+        分片数减少后超出范围的账号重新分配。全局设置复制到每个分片。
+        生成前先合并各分片bot对配置文件的修改，避免被主配置覆盖。
+        """
+        if self._import_shard_users():
+            # 合并后写入主配置时已经重新生成了分片配置
+            return self._last_shard_sync
+        config = self._cache if self._cache is not None else self.get_config()
+        users = config.get("Users", [])
+        logins = {user.get("Login") for user in users if user.get("Login")}
+        assignments = {
+            login: shard for login, shard in self._load_assignments().items()
+            if login in logins and 0 <= shard < settings.shard_count
+        }
+        for user in users:
+            login = user.get("Login")
+            if login and login not in assignments:
+                assignments[login] = self._pick_shard(users, assignments)
+        self._save_assignments(assignments)
+
+        changed = []
+        for shard in range(settings.shard_count):
+            shard_config = {
+                **config,
+                "Users": [user for user in users if assignments.get(user.get("Login")) == shard]
+            }
+            if self._write_shard_file(shard, shard_config):
+                changed.append(shard)
+        if changed:
+            print(f"[ConfigService] 已更新分片配置: {', '.join(str(shard) for shard in changed)}")
+        self._last_shard_sync = changed
+        return changed
+
+    @staticmethod
+    def _merge_shard_user(master: Dict[str, Any], shard_user: Dict[str, Any]) -> Dict[str, Any]:
+        """MASTER_USER_FIELDS取主配置的值，其他字段取分片配置的值"""
+        merged = {key: value for key, value in master.items()
+                  if key in MASTER_USER_FIELDS or key in shard_user}
+        for key, value in shard_user.items():
+            if key not in MASTER_USER_FIELDS:
+                merged[key] = value
+        return merged
+
+    def _import_shard_users(self) -> bool:
+        """
+        合并分片容器中的bot对自己配置文件的修改，返回是否写入了主配置：
+        - 新账号（--add-account）加入主配置并分配到该分片
+        - 分配到该分片的已有账号，MASTER_USER_FIELDS以外的字段（刷新的凭据、UniqueId等）写回主配置
+        """
+        config = None
+        changed = False
+        for shard in range(settings.shard_count):
+            path = self.shard_config_path(shard)
+            try:
+                modified = os.path.getmtime(path)
+            except OSError:
+                continue
+            if self._shard_mtimes.get(shard) == modified:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    shard_users = json.load(f).get("Users", [])
+            except (OSError, ValueError):
+                # 可能正在写入，下次检查时重试
+                continue
+            self._shard_mtimes[shard] = modified
+
+            if config is None:
+                config = self.get_config()
+                config["Users"] = list(config.get("Users", []))
+            indexes = {user.get("Login"): index for index, user in enumerate(config["Users"])}
+            assignments = dict(self._load_assignments())
+            new_users = []
+            for user in shard_users:
+                login = user.get("Login")
+                if not login:
+                    continue
+                if login not in indexes:
+                    new_users.append(user)
+                elif assignments.get(login) == shard:
+                    # 账号移动到其他分片后，原分片中的旧副本不再写回
+                    master = config["Users"][indexes[login]]
+                    merged = self._merge_shard_user(master, user)
+                    if merged != master:
+                        config["Users"][indexes[login]] = merged
+                        changed = True
+                        print(f"[ConfigService] 分片 {shard} 更新了账号 {login} 的配置，写回主配置")
+            if not new_users:
+                continue
+            for user in new_users:
+                assignments[user["Login"]] = shard
+                indexes[user["Login"]] = len(config["Users"])
+                config["Users"].append(user)
+                print(f"[ConfigService] 分片 {shard} 添加了新账号 {user['Login']}，加入主配置")
+            self._save_assignments(assignments)
+            changed = True
+
+        return self._write_config(config) if changed else False
+
+    def move_user_to_shard(self, login: str, shard: int) -> bool:
+        """把账号移动到指定分片（需要重启原分片和目标分片的容器后生效）"""
+        if not self.sharded or not 0 <= shard < settings.shard_count or not self.get_user_by_login(login):
+            return False
+        assignments = dict(self._load_assignments())
+        assignments[login] = shard
+        self._save_assignments(assignments)
+        self.sync_shards()
+        return True
+
+    def rebalance_shards(self) -> Dict[str, Any]:
+        """
+        在分片间移动账号，使各分片的启用账号数相差不超过1
+
+        每次从启用账号最多的分片移动一个账号到最少的分片，优先移动当前没有在观看的账号
+        （移动后两个分片都需要重启）。返回移动记录和受影响的分片。
+        """
+        from app.services.bot_monitor import bot_monitor
+
+        self.sync_shards()
+        users = self.get_local_users()
+        assignments = dict(self._load_assignments())
+        members: Dict[int, List[str]] = {shard: [] for shard in range(settings.shard_count)}
+        for user in users:
+            login = user.get("Login")
+            if login in assignments and user.get("Enabled", True):
+                members[assignments[login]].append(login)
+
+        def cost(login: str):
+            # 正在观看的账号移动后损失进度，排在最后
+            summary = bot_monitor.get_cached_summary(login) or {}
+            return (summary.get("status") == "Watching", login)
+
+        moves = []
+        while members:
+            heaviest = max(members, key=lambda shard: (len(members[shard]), -shard))
+            lightest = min(members, key=lambda shard: (len(members[shard]), shard))
+            if len(members[heaviest]) - len(members[lightest]) <= 1:
+                break
+            login = min(members[heaviest], key=cost)
+            members[heaviest].remove(login)
+            members[lightest].append(login)
+            assignments[login] = lightest
+            moves.append({"login": login, "from": heaviest, "to": lightest})
+
+        if moves:
+            self._save_assignments(assignments)
+            self.sync_shards()
+            print(f"[ConfigService] 重新平衡分片，移动 {len(moves)} 个账号")
+        return {
+            "moves": moves,
+            "shards": sorted({move["from"] for move in moves} | {move["to"] for move in moves}),
+            "loads": {shard: len(logins) for shard, logins in members.items()}
+        }
+
+
 config_service = ConfigService()
 
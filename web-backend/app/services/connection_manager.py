@@ -0,0 +1,276 @@
+"""WebSocket连接管理"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import WebSocket
+from app.config import settings
+from app.utils.metrics import registry, ws_send_duration
+
+# 全体账号状态主题（仅管理员可订阅）
+FLEET_TOPIC = "fleet"
+# 单个账号状态主题前缀，例如 "user:pureol"
+USER_TOPIC_PREFIX = "user:"
+
+
+def user_topic(username: str) -> str:
+    """单个账号的主题名"""
+    return f"{USER_TOPIC_PREFIX}{username}"
+
+
+class ClientConnection:
+    """单个WebSocket连接：有界发送队列、写任务和统计信息"""
+
+    def __init__(self, websocket: WebSocket, principal: dict, max_queue: int):
+        self.websocket = websocket
+        self.principal = principal
+        self.topics: Set[str] = set()
+        self.max_queue = max_queue
+        # 待发送的已序列化消息
+        self.queue: deque = deque()
+        # 队列溢出后置位：丢弃积压的增量，改为发送最新快照
+        self.needs_resync = False
+        self.wakeup = asyncio.Event()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.connected_at = time.time()
+        self.last_seen = time.monotonic()
+        self.sent = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.last_send_latency: Optional[float] = None
+
+    def enqueue(self, text: str):
+        """放入发送队列；队列已满时丢弃积压消息并标记需要重新同步"""
+        if len(self.queue) >= self.max_queue:
+            self.dropped += len(self.queue)
+            self.queue.clear()
+            self.needs_resync = True
+        else:
+            self.queue.append(text)
+        self.wakeup.set()
+
+    def to_dict(self) -> dict:
+        """连接统计信息"""
+        return {
+            "type": self.principal.get("type"),
+            "username": self.principal.get("username"),
+            "topics": sorted(self.topics),
+            "queue_depth": len(self.queue),
+            "max_queue": self.max_queue,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+            "needs_resync": self.needs_resync,
+            "last_send_ms": round(self.last_send_latency * 1000, 2) if self.last_send_latency is not None else None,
+            "connected_at": self.connected_at,
+            "idle_seconds": round(time.monotonic() - self.last_seen, 1)
+        }
+
+
+class ConnectionManager:
+    """WebSocket连接管理器（支持按主题订阅，每个连接独立的发送队列）"""
+    def __init__(self):
+        self.queue_size = settings.ws_queue_size
+        self.send_timeout = settings.ws_send_timeout
+        self.heartbeat_interval = settings.ws_heartbeat_interval
+        self.heartbeat_timeout = settings.ws_heartbeat_timeout
+        self._clients: Dict[WebSocket, ClientConnection] = {}
+        # 主题的订阅者 {topic: {websocket}}
+        self._topics: Dict[str, Set[WebSocket]] = {}
+        # 主题快照提供者（由广播器注册），慢连接重新同步时使用
+        self.snapshot_provider: Optional[Callable[[str], str]] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self._clients)
+
+    async def connect(self, websocket: WebSocket, principal: dict):
+        await websocket.accept()
+        client = ClientConnection(websocket, principal, self.queue_size)
+        self._clients[websocket] = client
+        client.writer_task = asyncio.create_task(self._writer(client))
+
+    def disconnect(self, websocket: WebSocket):
+        client = self._clients.pop(websocket, None)
+        if client is None:
+            return
+        for topic in client.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self._topics[topic]
+        if client.writer_task and client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+
+    def touch(self, websocket: WebSocket):
+        """记录收到客户端消息（用于心跳判断）"""
+        client = self._clients.get(websocket)
+        if client:
+            client.last_seen = time.monotonic()
+
+    @staticmethod
+    def can_subscribe(principal: dict, topic: str) -> bool:
+        """检查认证主体是否有权订阅主题：管理员可订阅全部，普通用户只能订阅自己"""
+        if principal.get("type") == "admin":
+            return topic == FLEET_TOPIC or topic.startswith(USER_TOPIC_PREFIX)
+        return topic == user_topic(principal.get("username", ""))
+
+    def default_topics(self, websocket: WebSocket) -> List[str]:
+        """连接建立后的默认订阅：管理员订阅全体，普通用户订阅自己"""
+        client = self._clients.get(websocket)
+        principal = client.principal if client else {}
+        if principal.get("type") == "admin":
+            return [FLEET_TOPIC]
+        return [user_topic(principal.get("username", ""))]
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """订阅主题，返回 (新订阅成功的主题, 被拒绝的主题)"""
+        client = self._clients.get(websocket)
+        if client is None:
+            return [], list(topics)
+
+        accepted, rejected = [], []
+        for topic in topics:
+            if not self.can_subscribe(client.principal, topic):
+                rejected.append(topic)
+                continue
+            if topic not in client.topics:
+                client.topics.add(topic)
+                self._topics.setdefault(topic, set()).add(websocket)
+                accepted.append(topic)
+        return accepted, rejected
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """取消订阅主题，返回实际取消的主题"""
+        client = self._clients.get(websocket)
+        if client is None:
+            return []
+        removed = []
+        for topic in topics:
+            if topic in client.topics:
+                client.topics.discard(topic)
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(websocket)
+                    if not subscribers:
+                        del self._topics[topic]
+                removed.append(topic)
+        return removed
+
+    def get_subscriptions(self, websocket: WebSocket) -> Set[str]:
+        """连接当前订阅的主题"""
+        client = self._clients.get(websocket)
+        return set(client.topics) if client else set()
+
+    def has_subscribers(self, topic: str) -> bool:
+        """主题是否有订阅者"""
+        return bool(self._topics.get(topic))
+
+    def send(self, websocket: WebSocket, message: dict):
+        """向单个连接发送消息（经由该连接的发送队列，保证顺序）"""
+        client = self._clients.get(websocket)
+        if client:
+            client.enqueue(json.dumps(message, ensure_ascii=False))
+
+    def publish(self, topic: str, text: str):
+        """向主题的所有订阅者投递同一份已序列化的消息（不等待发送完成）"""
+        for websocket in self._topics.get(topic, ()):
+            client = self._clients.get(websocket)
+            if client:
+                client.enqueue(text)
+
+    def broadcast(self, message: dict):
+        """广播消息给所有连接"""
+        text = json.dumps(message, ensure_ascii=False)
+        for client in self._clients.values():
+            client.enqueue(text)
+
+    async def _writer(self, client: ClientConnection):
+        """连接的写任务：按顺序发送队列中的消息，单次发送有超时限制"""
+        websocket = client.websocket
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                while True:
+                    if client.needs_resync:
+                        # 慢连接：丢弃积压的增量，只发送订阅主题的最新快照
+                        client.needs_resync = False
+                        client.resyncs += 1
+                        provider = self.snapshot_provider
+                        texts = [provider(topic) for topic in sorted(client.topics)] if provider else []
+                    elif client.queue:
+                        texts = [client.queue.popleft()]
+                    else:
+                        break
+
+                    for text in texts:
+                        started = time.perf_counter()
+                        await asyncio.wait_for(websocket.send_text(text), timeout=self.send_timeout)
+                        client.last_send_latency = time.perf_counter() - started
+                        ws_send_duration.observe(client.last_send_latency)
+                        client.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print(f"[WebSocket] ⚠️ 发送超时，断开连接: {client.principal.get('username')}")
+            await self._close(websocket)
+        except Exception as e:
+            print(f"[WebSocket] ⚠️ 发送失败，断开连接: {client.principal.get('username')}: {e}")
+            await self._close(websocket)
+
+    async def _close(self, websocket: WebSocket, code: int = 1001):
+        """断开并关闭连接"""
+        self.disconnect(websocket)
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        """心跳：定期发送ping，关闭长时间无响应的连接"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            ping = json.dumps({"type": "ping", "ts": time.time()})
+            for websocket, client in list(self._clients.items()):
+                if now - client.last_seen > self.heartbeat_timeout:
+                    print(f"[WebSocket] ⚠️ 心跳超时，断开连接: {client.principal.get('username')}")
+                    await self._close(websocket)
+                else:
+                    client.enqueue(ping)
+
+    def get_stats(self) -> dict:
+        """所有连接的队列深度和丢弃统计"""
+        connections = [client.to_dict() for client in self._clients.values()]
+        return {
+            "connections": connections,
+            "total": len(connections),
+            "total_dropped": sum(c["dropped"] for c in connections),
+            "topics": {topic: len(subscribers) for topic, subscribers in self._topics.items()}
+        }
+
+    def start(self):
+        """启动心跳任务"""
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def stop(self):
+        """停止心跳任务并取消所有写任务"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for websocket in list(self._clients):
+            self.disconnect(websocket)
+
+
+manager = ConnectionManager()
+
+registry.gauge(
+    "twitch_web_ws_connections",
+    "当前WebSocket连接数",
+    collector=lambda: {(): len(manager._clients)}
+)
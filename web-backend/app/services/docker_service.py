@@ -1,136 +1,140 @@
 """Docker命令调用服务 - 用于调用C# bot命令"""
 import asyncio
-import subprocess
-import re
-from typing import Dict, Optional
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import delete, select
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.container_stats import ContainerStat
+from app.utils.docker_client import DockerAPIError, DockerClient
+
+
+def parse_container_stats(stats: Dict) -> Dict:
+    """从Docker stats提取CPU使用率、内存占用和累计网络流量"""
+    cpu_stats = stats.get("cpu_stats", {})
+    precpu_stats = stats.get("precpu_stats", {})
+    cpu_delta = cpu_stats.get("cpu_usage", {}).get("total_usage", 0) - precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
+    system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get("system_cpu_usage", 0)
+    online_cpus = cpu_stats.get("online_cpus") or len(cpu_stats.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+    cpu_percent = cpu_delta / system_delta * online_cpus * 100 if cpu_delta > 0 and system_delta > 0 else 0.0
+
+    memory_stats = stats.get("memory_stats", {})
+    memory_detail = memory_stats.get("stats", {})
+    # 与docker stats一致：扣除页缓存（cgroup v2为inactive_file，v1为cache）
+    cache = memory_detail.get("inactive_file", memory_detail.get("cache", 0))
+    memory = max(memory_stats.get("usage", 0) - cache, 0)
+
+    networks = stats.get("networks") or {}
+    return {
+        "cpu_percent": cpu_percent,
+        "memory_bytes": memory,
+        "memory_limit_bytes": memory_stats.get("limit"),
+        "rx_bytes": sum(net.get("rx_bytes", 0) for net in networks.values()),
+        "tx_bytes": sum(net.get("tx_bytes", 0) for net in networks.values())
+    }
 
 
 class DockerService:
-    """Docker服务：通过docker compose调用C# bot命令"""
+    """Docker服务：通过Docker Engine API（unix socket）调用C# bot命令"""
 
     def __init__(self):
-        self.container_name = "drop"
-        self._add_account_process = None
-        self._add_account_output = []
+        self.container_name = settings.drop_service_name
+        self.stats_interval = settings.container_stats_interval
+        # 每个drop容器一个采样任务 {服务名: task}
+        self._stats_tasks: Dict[str, asyncio.Task] = {}
+        self._last_stats_prune = 0.0
+        self.client = DockerClient(
+            settings.docker_socket_path,
+            api_version=settings.docker_api_version,
+            timeout=settings.docker_api_timeout
+        )
+
+    def service_name(self, shard: Optional[int] = None) -> str:
+        """drop容器的compose服务名（分片模式下分片 i 为 drop-i）"""
+        from app.services.config_service import config_service
 
-    async def execute_add_account(self) -> Dict[str, str]:
-        """
-        调用C# bot的 --add-account 命令并捕获输出
-        提取Twitch OAuth的授权链接和代码
-        """
-        try:
-            print("[DockerService] 执行 add_account 命令...")
-
-            # 构建命令（使用docker-compose调用C# bot）
-            cmd = [
-                "/usr/local/bin/docker-compose",
-                "-f", "/root/twitch/compose.yml",
-                "exec", "-T", "drop",
-                "dotnet", "TwitchDropsBot.Console.dll", "--add-account"
-            ]
-
-            print(f"[DockerService] 执行命令: {' '.join(cmd)}")
-
-            # 启动进程并捕获输出
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT,
-                stdin=asyncio.subprocess.PIPE
-            )
+        if shard is None or not config_service.sharded:
+            return self.container_name
+        return f"{self.container_name}-{shard}"
 
-            self._add_account_process = process
-            self._add_account_output = []
+    def service_names(self) -> List[str]:
+        """所有drop容器的compose服务名"""
+        from app.services.config_service import config_service
 
-            # 自动发送 'Y' 确认（bot可能会询问是否继续）
+        if not config_service.sharded:
+            return [self.container_name]
+        return [self.service_name(shard) for shard in range(settings.shard_count)]
+
+    async def get_drop_container(self, shard: Optional[int] = None) -> Dict:
+        """按compose标签查找drop容器（分片模式下为指定分片的容器）"""
+        service = self.service_name(shard)
+        container = await self.client.find_compose_container(service, settings.compose_project)
+        if container is None:
+            raise Exception(f"未找到compose服务 {service} 的容器")
+        return container
+
+    async def inspect_drop_container(self, shard: Optional[int] = None) -> Dict:
+        """获取drop容器详细信息（状态、启动时间、重启次数）"""
+        container = await self.get_drop_container(shard)
+        return await self.client.inspect_container(container["Id"])
+
+    async def list_drop_containers(self) -> List[Dict]:
+        """所有drop容器的状态（分片模式下每个分片一项）"""
+        from app.services.config_service import config_service
+
+        shards = list(range(settings.shard_count)) if config_service.sharded else [None]
+        result = []
+        for shard in shards:
+            item = {"shard": shard, "service": self.service_name(shard), "container_id": None,
+                    "state": "missing", "status": None}
             try:
-                process.stdin.write(b'Y\n')
-                await process.stdin.drain()
-                print("[DockerService] 已自动发送确认 'Y'")
+                container = await self.client.find_compose_container(item["service"], settings.compose_project)
             except Exception as e:
-                print(f"[DockerService] 发送确认失败（可能不需要）: {e}")
-
-            # 读取输出直到获取到授权信息（最多等待30秒）
-            auth_info = None
-            start_time = asyncio.get_event_loop().time()
-            timeout = 30
-
-            while True:
-                if asyncio.get_event_loop().time() - start_time > timeout:
-                    print("[DockerService] 等待超时")
-                    break
-
-                try:
-                    line = await asyncio.wait_for(
-                        process.stdout.readline(),
-                        timeout=5.0
-                    )
-                    if not line:
-                        break
-
-                    line_str = line.decode('utf-8', errors='ignore').strip()
-                    self._add_account_output.append(line_str)
-                    print(f"[DockerService] Bot输出: {line_str}")
-
-                    # 提取授权信息
-                    # 查找类似：https://www.twitch.tv/activate?device-code=BGVRDDZK and enter the code: BGVRDDZK
-                    if 'twitch.tv/activate' in line_str.lower():
-                        url_match = re.search(r'(https://[^\s]+)', line_str)
-                        if url_match:
-                            url = url_match.group(1)
-                            # 尝试从URL提取代码（device-code或user_code参数）
-                            code_match = re.search(r'(?:device-code|user_code)=([A-Z0-9\-]+)', url, re.IGNORECASE)
-                            code = None
-                            if code_match:
-                                code = code_match.group(1)
-
-                            # 如果URL中没找到，尝试从消息中提取 "enter the code: XXXX"
-                            if not code:
-                                code_match = re.search(r'enter the code[:\s]+([A-Z0-9\-]+)', line_str, re.IGNORECASE)
-                                if code_match:
-                                    code = code_match.group(1)
-
-                            if code:
-                                auth_info = {
-                                    "verification_uri": url,
-                                    "user_code": code
-                                }
-                                print(f"[DockerService] ✅ 提取到授权信息: {auth_info}")
-                                break
-
-                    # 或者查找分开的URL和代码
-                    if 'please go to:' in line_str.lower() or 'visit:' in line_str.lower():
-                        # 继续读取下一行获取URL
-                        continue
-
-                except asyncio.TimeoutError:
-                    continue
-
-            if auth_info:
-                return {
-                    "status": "success",
-                    "verification_uri": auth_info["verification_uri"],
-                    "user_code": auth_info["user_code"],
-                    "message": "请访问链接并输入代码完成授权"
-                }
-            else:
-                # 如果没有提取到授权信息，返回收集到的输出
-                output_text = "\n".join(self._add_account_output[-10:])  # 最后10行
-                print(f"[DockerService] ⚠️ 未能提取授权信息，Bot输出:\n{output_text}")
-                return {
-                    "status": "initiated",
-                    "message": "命令已执行，请查看Docker日志获取授权信息",
-                    "bot_output": output_text
-                }
+                item.update(state="error", status=str(e))
+                container = None
+            if container is not None:
+                item.update(container_id=container["Id"][:12], state=container.get("State"),
+                            status=container.get("Status"))
+            result.append(item)
+        return result
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            raise Exception(f"调用add_account命令失败: {str(e)}")
+    async def execute_add_account(self) -> Dict[str, str]:
+        """
+        调用C# bot的 --add-account 命令并捕获输出
+        提取Twitch OAuth的授权链接和代码（每次调用是一个独立的任务，见add_account_jobs）
+        """
+        from app.services.add_account_jobs import add_account_jobs, STARTING, WAITING_AUTH
+
+        print("[DockerService] 执行 add_account 命令...")
+        job = await add_account_jobs.start_job()
+
+        if job.status == WAITING_AUTH:
+            return {
+                "status": "success",
+                "job_id": job.id,
+                "verification_uri": job.verification_uri,
+                "user_code": job.user_code,
+                "message": "请访问链接并输入代码完成授权"
+            }
+
+        # 如果没有提取到授权信息，返回收集到的输出
+        output_text = "\n".join(list(job.output)[-10:])  # 最后10行
+        if job.status == STARTING:
+            add_account_jobs.cancel_job(job.id)
+        if job.error and not job.output:
+            raise Exception(f"调用add_account命令失败: {job.error}")
+        print(f"[DockerService] ⚠️ 未能提取授权信息，Bot输出:\n{output_text}")
+        return {
+            "status": "initiated",
+            "job_id": job.id,
+            "message": "命令已执行，请查看Docker日志获取授权信息",
+            "bot_output": output_text
+        }
 
     async def check_user_added(self, username: str, max_wait: int = 300) -> Optional[Dict]:
         """
-        监控config.json，检查用户是否已被C# bot添加
+        等待C# bot把用户写入config.json（由配置变化通知唤醒，不轮询）
 
         参数:
             username: Twitch用户名
@@ -138,44 +142,46 @@ class DockerService:
         """
         from app.services.config_service import config_service
 
-        wait_time = 0
-        while wait_time < max_wait:
-            user = config_service.get_user_by_login(username)
-            if user:
-                return user
-
-            await asyncio.sleep(5)  # 每5秒检查一次
-            wait_time += 5
+        return await config_service.wait_for_user(username, max_wait)
 
-        return None
-
-    async def restart_drop_container(self) -> Dict[str, str]:
+    async def restart_drop_container(self, shard: Optional[int] = None) -> Dict[str, str]:
         """
         重启drop容器（C# bot）
+        分片模式下shard为空时同时重启所有分片的容器
         """
-        try:
-            print("[DockerService] 准备重启drop容器...")
+        from app.services.config_service import config_service
 
-            # 构建重启命令
-            cmd = [
-                "/usr/local/bin/docker-compose",
-                "-f", "/root/twitch/compose.yml",
-                "restart", "drop"
-            ]
+        if config_service.sharded and shard is None:
+            results = await asyncio.gather(
+                *(self.restart_drop_container(index) for index in range(settings.shard_count)),
+                return_exceptions=True
+            )
+            lines = []
+            for index, result in enumerate(results):
+                if isinstance(result, Exception):
+                    result = {"status": "error", "message": str(result)}
+                    results[index] = result
+                lines.append(f"{self.service_name(index)}: {result.get('output') or result.get('message')}")
+            failed = [self.service_name(index) for index, result in enumerate(results) if result["status"] != "success"]
+            return {
+                "status": "error" if failed else "success",
+                "message": f"重启失败: {', '.join(failed)}" if failed else f"{len(results)} 个drop容器已重启",
+                "output": "\n".join(lines)
+            }
 
-            print(f"[DockerService] 执行命令: {' '.join(cmd)}")
+        try:
+            print("[DockerService] 准备重启drop容器...")
+            container = await self.get_drop_container(shard)
+            container_id = container["Id"]
 
-            # 执行重启命令
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-            )
+            print(f"[DockerService] 重启容器 {container_id[:12]} ({', '.join(container.get('Names', []))})")
+            await self.client.restart_container(container_id, timeout=settings.drop_restart_timeout)
 
-            stdout, _ = await process.communicate()
-            output = stdout.decode('utf-8', errors='ignore').strip()
+            info = await self.client.inspect_container(container_id)
+            state = info.get("State", {})
+            output = f"状态: {state.get('Status')}, 启动时间: {state.get('StartedAt')}, 重启次数: {info.get('RestartCount')}"
 
-            if process.returncode == 0:
+            if state.get("Running"):
                 print(f"[DockerService] ✅ drop容器重启成功")
                 return {
                     "status": "success",
@@ -183,18 +189,165 @@ class DockerService:
                     "output": output
                 }
             else:
-                print(f"[DockerService] ❌ drop容器重启失败: {output}")
+                print(f"[DockerService] ❌ drop容器重启后未运行: {output}")
                 return {
                     "status": "error",
                     "message": f"重启失败: {output}",
                     "output": output
                 }
 
+        except DockerAPIError as e:
+            print(f"[DockerService] ❌ drop容器重启失败: {e}")
+            return {
+                "status": "error",
+                "message": f"重启失败: {e.message}",
+                "output": e.message
+            }
         except Exception as e:
             print(f"[DockerService] ❌ 重启容器异常: {str(e)}")
             import traceback
             traceback.print_exc()
             raise Exception(f"重启容器失败: {str(e)}")
 
+    # ---- 容器资源采样 ----
+
+    async def _stats_loop(self, service: str):
+        """
+        订阅drop容器的stats流（约每秒一条），按采样周期降采样后写入数据库
+        容器重启或连接断开后自动重新订阅
+        """
+        failures = 0
+        while True:
+            try:
+                container = await self.client.find_compose_container(service, settings.compose_project)
+                if container is None:
+                    raise Exception(f"未找到compose服务 {service} 的容器")
+                await self._consume_stats(container["Id"], service)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                if failures == 1:
+                    print(f"[DockerService] ⚠️ 读取容器 {service} 资源统计失败（将定期重试）: {e}")
+            await asyncio.sleep(min(self.stats_interval, 60))
+
+    async def _consume_stats(self, container_id: str, service: str):
+        bucket: List[Dict] = []
+        bucket_started = time.monotonic()
+        first_net: Optional[Dict] = None
+        async for raw in self.client.stats_stream(container_id):
+            if not raw.get("read") or raw.get("read", "").startswith("0001-"):
+                continue
+            sample = parse_container_stats(raw)
+            sample["at"] = time.monotonic()
+            if first_net is None:
+                first_net = sample
+            bucket.append(sample)
+            if sample["at"] - bucket_started >= self.stats_interval:
+                await self._save_stats_bucket(bucket, first_net, service)
+                # 下一个周期的网络速率从本周期最后一条开始计算
+                first_net = sample
+                bucket = []
+                bucket_started = sample["at"]
+
+    async def _save_stats_bucket(self, bucket: List[Dict], first_net: Dict, service: str):
+        """把一个周期的原始采样聚合为一行（账号数为该容器负责的账号）"""
+        from app.services.config_service import config_service
+
+        last = bucket[-1]
+        elapsed = max(last["at"] - first_net["at"], 1e-6)
+        users = config_service.get_local_users()
+        if config_service.sharded:
+            shard = self.service_names().index(service)
+            assignments = config_service.get_shard_assignments()
+            users = [user for user in users if assignments.get(user.get("Login")) == shard]
+        row = ContainerStat(
+            timestamp=datetime.now(timezone.utc),
+            container=service,
+            samples=len(bucket),
+            cpu_percent=sum(s["cpu_percent"] for s in bucket) / len(bucket),
+            cpu_percent_max=max(s["cpu_percent"] for s in bucket),
+            memory_bytes=int(sum(s["memory_bytes"] for s in bucket) / len(bucket)),
+            memory_bytes_max=max(s["memory_bytes"] for s in bucket),
+            memory_limit_bytes=last["memory_limit_bytes"],
+            # 计数器在容器重启后归零，此时速率记为0
+            net_rx_rate=max(last["rx_bytes"] - first_net["rx_bytes"], 0) / elapsed,
+            net_tx_rate=max(last["tx_bytes"] - first_net["tx_bytes"], 0) / elapsed,
+            account_count=len(users),
+            enabled_account_count=sum(1 for user in users if user.get("Enabled", True))
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(row)
+            # 每小时清理一次超过保留期的数据
+            if time.monotonic() - self._last_stats_prune > 3600:
+                cutoff = datetime.now(timezone.utc) - timedelta(days=settings.container_stats_retention_days)
+                await db.execute(delete(ContainerStat).where(ContainerStat.timestamp < cutoff))
+                self._last_stats_prune = time.monotonic()
+            await db.commit()
+
+    async def get_stats_series(self, hours: float, step: Optional[int] = None,
+                               container: Optional[str] = None) -> List[Dict]:
+        """
+        获取资源采样序列
+        step: 再次降采样的周期（秒），为空时返回原始周期的数据
+        container: compose服务名，默认为drop（分片模式下为 drop-i）
+        """
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(
+                select(ContainerStat)
+                .where(ContainerStat.timestamp >= since, ContainerStat.container == (container or self.container_name))
+                .order_by(ContainerStat.timestamp)
+            )).all()
+
+        groups: Dict[int, List[ContainerStat]] = {}
+        for row in rows:
+            # SQLite不保存时区，写入时统一为UTC
+            if row.timestamp.tzinfo is None:
+                row.timestamp = row.timestamp.replace(tzinfo=timezone.utc)
+            key = int(row.timestamp.timestamp() // step) if step else row.id
+            groups.setdefault(key, []).append(row)
+
+        series = []
+        for group in groups.values():
+            weight = sum(row.samples for row in group) or 1
+            series.append({
+                "timestamp": group[-1].timestamp.isoformat(),
+                "cpu_percent": round(sum(row.cpu_percent * row.samples for row in group) / weight, 2),
+                "cpu_percent_max": round(max(row.cpu_percent_max for row in group), 2),
+                "memory_bytes": int(sum(row.memory_bytes * row.samples for row in group) / weight),
+                "memory_bytes_max": max(row.memory_bytes_max for row in group),
+                "memory_limit_bytes": group[-1].memory_limit_bytes,
+                "net_rx_rate": round(sum(row.net_rx_rate * row.samples for row in group) / weight, 1),
+                "net_tx_rate": round(sum(row.net_tx_rate * row.samples for row in group) / weight, 1),
+                "account_count": group[-1].account_count,
+                "enabled_account_count": group[-1].enabled_account_count
+            })
+        return series
+
+    def start_stats_sampler(self):
+        """启动容器资源采样任务（每个drop容器一个）"""
+        if not self._stats_tasks:
+            services = self.service_names()
+            print(f"[DockerService] 启动容器资源采样（{', '.join(services)}），周期: {self.stats_interval}秒")
+            for service in services:
+                self._stats_tasks[service] = asyncio.create_task(self._stats_loop(service))
+
+    def stop_stats_sampler(self):
+        """停止容器资源采样任务"""
+        for task in self._stats_tasks.values():
+            task.cancel()
+        self._stats_tasks = {}
+
+    async def close(self):
+        """停止采样并关闭Docker API连接"""
+        tasks = list(self._stats_tasks.values())
+        self.stop_stats_sampler()
+        if tasks:
+            # 等待stats流退出后再关闭连接池
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.close()
+
 
 docker_service = DockerService()
@@ -0,0 +1,410 @@
+"""挂宝时间分析 - 按账号、游戏、Campaign统计Seeking/Watching/Idle/Error时间和计入进度的观看分钟数"""
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.farming_stat import FarmingStat
+from app.services.bot_monitor import bot_monitor
+
+# 状态 -> 统计列
+STATUS_COLUMNS = {
+    "Seeking": "seeking_seconds",
+    "Watching": "watching_seconds",
+    "Idle": "idle_seconds",
+    "Error": "error_seconds",
+}
+SECONDS_COLUMNS = ("seeking_seconds", "watching_seconds", "idle_seconds", "error_seconds", "unknown_seconds")
+VALUE_COLUMNS = SECONDS_COLUMNS + ("credited_minutes",)
+
+# "Current drop campaign: {campaign} ({game}), watching ..."
+WATCHING_PATTERN = re.compile(r'Current drop campaign: (.+?) \((.+?)\)')
+# "Checking {Game} ({Campaign} - #1/7)..."
+CHECKING_PATTERN = re.compile(r'Checking (.+?) \((.+?)\)\.\.\.')
+# Seeking时查找Checking行的最近日志条数
+CHECKING_SEARCH_LINES = 200
+
+# 分组方式 -> 分组列
+GROUP_COLUMNS = {
+    "account": ("login",),
+    "game": ("game",),
+    "campaign": ("game", "campaign"),
+    "account_game": ("login", "game"),
+}
+
+BucketKey = Tuple[datetime, str, str, str]  # (小时, 账号, 游戏, Campaign)
+
+
+def _utc_naive(value: datetime) -> datetime:
+    """统一为不带时区的UTC时间（小时桶的键和数据库中的值）"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _hour_of(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class FarmingAnalytics:
+    """
+    挂宝时间分析
+
+    通过BotStatusMonitor的状态变化监听器接收解析后的日志状态，不重新扫描日志：
+    - 两次状态变化之间的时间计入前一个状态（以及当时的游戏和Campaign），跨小时时按小时拆分
+    - 日志超过analytics_max_gap_minutes没有更新时停止计时（bot停止、容器重启期间不计入任何状态）
+    - Watching时同一掉宝进度的增加计为credited_minutes；切换掉宝时新掉宝的进度最多按经过的时间计入
+    Idle/Unknown不属于任何游戏，游戏和Campaign记为空字符串。
+    小时汇总在内存中累加，定期累加写入farming_stats表。时间均使用日志中的时间戳（存储为UTC）。
+    """
+
+    def __init__(self):
+        self.max_gap = timedelta(minutes=settings.analytics_max_gap_minutes)
+        # 每个账号当前未结束的计时区间
+        self._open: Dict[str, Dict] = {}
+        # 尚未写入数据库的小时汇总 {BucketKey: {列: 值}}
+        self._buckets: Dict[BucketKey, Dict[str, float]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = datetime.min
+        bot_monitor.add_listener(self.on_status_change)
+        for username in bot_monitor.tracked_usernames():
+            summary = bot_monitor.get_cached_summary(username)
+            if summary:
+                self.on_status_change(username, None, summary)
+
+    @staticmethod
+    def _parse_time(value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        return _utc_naive(parsed if parsed.tzinfo else parsed.astimezone())
+
+    @staticmethod
+    def _checking_campaign(login: str) -> Optional[Tuple[str, str]]:
+        """bot正在检查的Campaign：最近一条Checking行（之后没有新的观看行），没有时返回None"""
+        for msg in reversed(bot_monitor.get_recent_messages(login, CHECKING_SEARCH_LINES)):
+            if WATCHING_PATTERN.search(msg):
+                return None
+            match = CHECKING_PATTERN.search(msg)
+            if match:
+                # 去掉检查序号后缀 " - #1/7"
+                return match.group(1), re.sub(r'\s+-\s+#\d+/\d+$', '', match.group(2))
+        return None
+
+    def _attribution(self, login: str, summary: Dict) -> Tuple[Optional[str], str, str]:
+        """计时归属的 (状态, 游戏, Campaign)：Seeking时间计入正在检查的Campaign，而不是上一个观看的"""
+        status = summary.get("status")
+        if status in ("Idle", "Unknown", None):
+            return status, "", ""
+        if status == "Seeking":
+            checking = self._checking_campaign(login)
+            if checking is not None:
+                return status, checking[0], checking[1]
+        campaign_info = summary.get("campaign") or {}
+        return status, campaign_info.get("game") or "", campaign_info.get("campaign") or ""
+
+    def _bucket(self, hour: datetime, login: str, game: str, campaign: str) -> Dict[str, float]:
+        key = (hour, login, game, campaign)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = dict.fromkeys(VALUE_COLUMNS, 0.0)
+        return bucket
+
+    def _accrue(self, login: str, interval: Dict, end: datetime):
+        """把计时区间从since到end的时间计入小时汇总（不超过最后一条日志之后max_gap），并推进since"""
+        end = min(end, interval["last_seen"] + self.max_gap)
+        start = interval["since"]
+        if end <= start:
+            return
+        column = STATUS_COLUMNS.get(interval["status"], "unknown_seconds")
+        while start < end:
+            hour = _hour_of(start)
+            chunk_end = min(end, hour + timedelta(hours=1))
+            bucket = self._bucket(hour, login, interval["game"], interval["campaign"])
+            bucket[column] += (chunk_end - start).total_seconds()
+            start = chunk_end
+        interval["since"] = end
+
+    def _credit(self, login: str, interval: Optional[Dict], summary: Dict, at: datetime) -> Optional[Dict]:
+        """计算本次状态中新增的观看进度，返回新的进度记录"""
+        progress = summary.get("progress")
+        previous = interval.get("progress") if interval else None
+        if summary.get("status") != "Watching" or not progress:
+            # Seeking时的进度仍是上一个掉宝的，不更新进度记录
+            return previous
+        campaign_info = summary.get("campaign") or {}
+        record = {
+            "key": (campaign_info.get("game"), campaign_info.get("campaign"), progress["required"]),
+            "current": progress["current"],
+            "at": at
+        }
+        if previous is None:
+            # 首次观察到的进度是之前累积的，不计入
+            return record
+        if record["key"] == previous["key"] and record["current"] >= previous["current"]:
+            credited = record["current"] - previous["current"]
+        else:
+            # 切换掉宝（或同一掉宝重新开始）：新进度最多按经过的时间计入，
+            # 避免在新掉宝的第一条进度日志之前把上一个掉宝的进度算作新掉宝的
+            elapsed = max((at - previous["at"]).total_seconds() / 60, 0)
+            credited = min(record["current"], elapsed)
+        if credited > 0:
+            _, game, campaign = self._attribution(login, summary)
+            self._bucket(_hour_of(at), login, game, campaign)["credited_minutes"] += credited
+        return record
+
+    def on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        """状态变化监听：结束上一个计时区间，开始新的计时区间"""
+        at = self._parse_time(new.get("last_update"))
+        if at is None:
+            return
+        interval = self._open.get(username)
+        since = at
+        if interval is not None:
+            if at < interval["last_seen"]:
+                # 日志时间回退（日志被截断重写等），重新开始计时
+                interval = None
+            else:
+                self._accrue(username, interval, at)
+                # 定期写入时已计入到的时间不再重复计入
+                since = max(at, interval["since"])
+        progress = self._credit(username, interval, new, at)
+        status, game, campaign = self._attribution(username, new)
+        self._open[username] = {
+            "status": status,
+            "game": game,
+            "campaign": campaign,
+            "since": since,
+            "last_seen": at,
+            "progress": progress
+        }
+
+    def evict_users(self, active_usernames) -> List[str]:
+        """清理已不在配置中的账号（已统计的时间保留）"""
+        now = _utc_naive(datetime.now(timezone.utc))
+        stale = [login for login in self._open if login not in active_usernames]
+        for login in stale:
+            self._accrue(login, self._open.pop(login), now)
+        return stale
+
+    async def flush(self, now: Optional[datetime] = None):
+        """把计时中的区间计入到现在，并把小时汇总累加写入数据库"""
+        async with self._lock:
+            now = _utc_naive(now or datetime.now(timezone.utc))
+            for login, interval in self._open.items():
+                self._accrue(login, interval, now)
+            buckets, self._buckets = self._buckets, {}
+            prune = now - self._last_prune > timedelta(hours=1)
+            if not buckets and not prune:
+                return
+            try:
+                async with AsyncSessionLocal() as db:
+                    for (hour, login, game, campaign), values in buckets.items():
+                        increments = {
+                            column: getattr(FarmingStat, column) + value
+                            for column, value in values.items() if value
+                        }
+                        if not increments:
+                            continue
+                        # 先累加到已有的行，没有再插入
+                        result = await db.execute(
+                            update(FarmingStat)
+                            .where(
+                                FarmingStat.hour == hour,
+                                FarmingStat.login == login,
+                                FarmingStat.game == game,
+                                FarmingStat.campaign == campaign
+                            )
+                            .values(**increments)
+                        )
+                        if result.rowcount == 0:
+                            await db.execute(insert(FarmingStat).values(
+                                hour=hour, login=login, game=game, campaign=campaign, **values
+                            ))
+                    if prune:
+                        cutoff = now - timedelta(days=settings.analytics_retention_days)
+                        await db.execute(delete(FarmingStat).where(FarmingStat.hour < cutoff))
+                    await db.commit()
+            except BaseException:
+                # 写入失败时合并回内存，下次重试
+                for key, values in buckets.items():
+                    bucket = self._bucket(*key)
+                    for column, value in values.items():
+                        bucket[column] += value
+                raise
+            if prune:
+                self._last_prune = now
+
+    async def _query(self, hours: float, columns: Tuple[str, ...], login: Optional[str] = None,
+                     game: Optional[str] = None) -> List[Dict]:
+        """按columns分组汇总最近hours小时的统计（先写入内存中的汇总）"""
+        await self.flush()
+        since = _hour_of(_utc_naive(datetime.now(timezone.utc)) - timedelta(hours=hours))
+        group = [getattr(FarmingStat, column) for column in columns]
+        stmt = (
+            select(*group, *[func.sum(getattr(FarmingStat, column)).label(column) for column in VALUE_COLUMNS])
+            .where(FarmingStat.hour >= since)
+            .group_by(*group)
+        )
+        if login is not None:
+            stmt = stmt.where(FarmingStat.login == login)
+        if game is not None:
+            stmt = stmt.where(func.lower(FarmingStat.game) == game.lower())
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(stmt)).mappings().all()
+        return [self._metrics(dict(row)) for row in rows]
+
+    @staticmethod
+    def _metrics(row: Dict) -> Dict:
+        """补充总时长、各状态占比和效率（每小时计入的观看分钟数）"""
+        if isinstance(row.get("hour"), datetime):
+            row["hour"] = row["hour"].replace(tzinfo=timezone.utc).isoformat()
+        for column in VALUE_COLUMNS:
+            row[column] = round(row.get(column) or 0.0, 1)
+        tracked = sum(row[column] for column in SECONDS_COLUMNS)
+        row["tracked_seconds"] = round(tracked, 1)
+        row["minutes_per_hour"] = round(row["credited_minutes"] / (tracked / 3600), 2) if tracked else None
+        row["watching_share"] = round(row["watching_seconds"] / tracked, 3) if tracked else None
+        row["seeking_share"] = round(row["seeking_seconds"] / tracked, 3) if tracked else None
+        return row
+
+    async def summary(self, hours: float, group_by: str, login: Optional[str] = None,
+                      game: Optional[str] = None) -> List[Dict]:
+        """分组汇总，按总时长降序"""
+        result = await self._query(hours, GROUP_COLUMNS[group_by], login, game)
+        result.sort(key=lambda item: item["tracked_seconds"], reverse=True)
+        return result
+
+    async def hourly(self, hours: float, login: Optional[str] = None, game: Optional[str] = None) -> List[Dict]:
+        """按小时汇总的时间序列"""
+        result = await self._query(hours, ("hour",), login, game)
+        result.sort(key=lambda item: item["hour"])
+        return result
+
+    async def leaderboard(self, hours: float, group_by: str, metric: str, min_hours: float,
+                          limit: int) -> List[Dict]:
+        """
+        排行榜：按metric降序（seeking_share按升序，找时间浪费最少的）
+        统计时长不足min_hours小时的分组不参与排名
+        """
+        rows = [
+            row for row in await self._query(hours, GROUP_COLUMNS[group_by])
+            if row["tracked_seconds"] >= min_hours * 3600 and row.get(metric) is not None
+        ]
+        rows.sort(key=lambda item: item[metric], reverse=metric != "seeking_share")
+        for rank, row in enumerate(rows[:limit], start=1):
+            row["rank"] = rank
+        return rows[:limit]
+
+    async def favourite_games(self, hours: float) -> Dict:
+        """
+        常用游戏（FavouriteGames）设置分析
+        - wasted：在该游戏上Seeking/Error的时间超过analytics_waste_minutes，但没有计入任何观看进度
+        - never_seen：统计范围内从未检查或观看过该游戏（可能没有进行中的活动）
+        未列入常用游戏却占用了时间的游戏列在other_games中
+        OnlyFavouriteGames是全局配置项，远程节点的账号取该节点的全局配置
+        """
+        from app.services.config_service import config_service
+        from app.services.remote_fleet import remote_fleet
+
+        only_favourite = bool(config_service.get_config().get("OnlyFavouriteGames", False))
+        node_only_favourite: Dict[str, bool] = {}
+
+        by_account: Dict[str, Dict[str, Dict]] = {}
+        for row in await self._query(hours, ("login", "game")):
+            if row["game"]:
+                by_account.setdefault(row["login"], {})[row["game"].strip().lower()] = row
+
+        waste_seconds = settings.analytics_waste_minutes * 60
+        accounts = []
+        games: Dict[str, Dict] = {}
+        for user in config_service.get_users():
+            login = user.get("Login")
+            if not login:
+                continue
+            stats = dict(by_account.get(login, {}))
+            node = user.get("Node")
+            if node and node not in node_only_favourite:
+                node_config = (remote_fleet.get_node(node) or {}).get("config") or {}
+                node_only_favourite[node] = bool(node_config.get("OnlyFavouriteGames", False))
+            favourites = []
+            for rank, game in enumerate(user.get("FavouriteGames") or [], start=1):
+                row = stats.pop(game.strip().lower(), None)
+                wasted_seconds = row["seeking_seconds"] + row["error_seconds"] if row else 0.0
+                if row is None:
+                    flag = "never_seen"
+                elif row["credited_minutes"] == 0 and wasted_seconds >= waste_seconds:
+                    flag = "wasted"
+                else:
+                    flag = None
+                entry = {"game": game.strip(), "rank": rank, "flag": flag,
+                         "wasted_seconds": round(wasted_seconds, 1) if flag == "wasted" else 0.0}
+                if row:
+                    entry.update({key: row[key] for key in (*VALUE_COLUMNS, "tracked_seconds", "minutes_per_hour")})
+                favourites.append(entry)
+
+                total = games.setdefault(game.strip().lower(), {
+                    "game": game.strip(), "accounts": 0, "wasted_accounts": 0, "never_seen_accounts": 0,
+                    "tracked_seconds": 0.0, "seeking_seconds": 0.0, "credited_minutes": 0.0
+                })
+                total["accounts"] += 1
+                total["wasted_accounts"] += flag == "wasted"
+                total["never_seen_accounts"] += flag == "never_seen"
+                if row:
+                    for key in ("tracked_seconds", "seeking_seconds", "credited_minutes"):
+                        total[key] = round(total[key] + row[key], 1)
+
+            accounts.append({
+                "login": login,
+                "enabled": user.get("Enabled", True),
+                "only_favourite_games": node_only_favourite[node] if node else only_favourite,
+                "wasted_seconds": round(sum(item["wasted_seconds"] for item in favourites), 1),
+                "favourite_games": favourites,
+                "other_games": sorted(stats.values(), key=lambda item: item["tracked_seconds"], reverse=True)
+            })
+
+        accounts.sort(key=lambda item: item["wasted_seconds"], reverse=True)
+        return {
+            "hours": hours,
+            "waste_minutes": settings.analytics_waste_minutes,
+            "only_favourite_games": only_favourite,
+            "accounts": accounts,
+            "games": sorted(games.values(), key=lambda item: (item["wasted_accounts"], item["seeking_seconds"]),
+                            reverse=True)
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.analytics_flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[Analytics] 写入挂宝时间统计失败: {e}")
+
+    def start(self):
+        """启动后台写入任务"""
+        if self._task is None:
+            print(f"[Analytics] 启动挂宝时间统计，写入周期: {settings.analytics_flush_interval}秒")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入剩余统计"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"[Analytics] 写入挂宝时间统计失败: {e}")
+
+
+farming_analytics = FarmingAnalytics()
@@ -0,0 +1,124 @@
+"""全体账号统计服务 - 随状态变化增量维护"""
+from typing import Dict, Optional, Set
+
+from app.services.bot_monitor import bot_monitor
+from app.services.config_service import config_service
+
+STATUS_KEYS = ("Idle", "Seeking", "Watching", "Error", "Unknown")
+
+
+class FleetStats:
+    """
+    全体账号聚合统计
+
+    每个已启用账号的贡献（状态、进度、Campaign、游戏）单独记录，
+    状态变化时先减去旧贡献再加上新贡献，Campaign和游戏使用引用计数。
+    查询统计为O(1)，与账号数量无关。
+    """
+
+    def __init__(self):
+        self.total_users = 0
+        self.enabled_users = 0
+        self.status_counts: Dict[str, int] = {key: 0 for key in STATUS_KEYS}
+        self.total_progress = 0
+        self.total_required = 0
+        # 引用计数 {campaign: 账号数}、{game: 账号数}
+        self._campaigns: Dict[str, int] = {}
+        self._games: Dict[str, int] = {}
+        # 已计入统计的账号贡献 {username: contribution}
+        self._contributions: Dict[str, Dict] = {}
+        self._enabled: Set[str] = set()
+        self._config_generation = -1
+        bot_monitor.add_listener(self.on_status_change)
+
+    @staticmethod
+    def _contribution(summary: Optional[Dict]) -> Dict:
+        """从状态摘要计算账号的统计贡献"""
+        summary = summary or {}
+        status = summary.get("status") or "Unknown"
+        progress = summary.get("progress") or {}
+        campaign_info = summary.get("campaign") or {}
+        return {
+            "status": status if status in STATUS_KEYS else "Unknown",
+            "current": progress.get("current", 0),
+            "required": progress.get("required", 0),
+            "campaign": campaign_info.get("campaign"),
+            "game": campaign_info.get("game")
+        }
+
+    @staticmethod
+    def _incr(counter: Dict[str, int], key: Optional[str], delta: int):
+        """引用计数增减，计数归零时移除"""
+        if not key:
+            return
+        count = counter.get(key, 0) + delta
+        if count > 0:
+            counter[key] = count
+        else:
+            counter.pop(key, None)
+
+    def _apply(self, contribution: Dict, sign: int):
+        """加上（sign=1）或减去（sign=-1）一个账号的贡献"""
+        self.status_counts[contribution["status"]] += sign
+        self.total_progress += sign * contribution["current"]
+        self.total_required += sign * contribution["required"]
+        self._incr(self._campaigns, contribution["campaign"], sign)
+        self._incr(self._games, contribution["game"], sign)
+
+    def _add(self, username: str, summary: Optional[Dict]):
+        contribution = self._contribution(summary)
+        self._contributions[username] = contribution
+        self._apply(contribution, 1)
+
+    def _remove(self, username: str):
+        contribution = self._contributions.pop(username, None)
+        if contribution:
+            self._apply(contribution, -1)
+
+    def on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        """状态变化监听：只更新该账号的贡献"""
+        if username not in self._enabled:
+            return
+        self._remove(username)
+        self._add(username, new)
+
+    def sync_config(self):
+        """配置变化时同步启用账号集合（配置未变化时为O(1)）"""
+        config_service.get_config()
+        if config_service.generation == self._config_generation:
+            return
+
+        users = config_service.get_users()
+        self._config_generation = config_service.generation
+        enabled = {u.get("Login") for u in users if u.get("Enabled", True) and u.get("Login")}
+
+        for username in self._enabled - enabled:
+            self._remove(username)
+        for username in enabled - self._enabled:
+            self._add(username, bot_monitor.get_cached_summary(username))
+
+        self._enabled = enabled
+        self.total_users = len(users)
+        self.enabled_users = len(enabled)
+
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        self.sync_config()
+        total_progress = self.total_progress
+        total_required = self.total_required
+        return {
+            "total_users": self.total_users,
+            "enabled_users": self.enabled_users,
+            "disabled_users": self.total_users - self.enabled_users,
+            "status_counts": dict(self.status_counts),
+            "total_progress": total_progress,
+            "total_required": total_required,
+            "progress_percentage": (total_progress / total_required * 100) if total_required > 0 else 0,
+            "active_campaigns_count": len(self._campaigns),
+            "active_games_count": len(self._games),
+            "active_campaigns": list(self._campaigns),
+            "active_games": list(self._games)
+        }
+
+
+fleet_stats = FleetStats()
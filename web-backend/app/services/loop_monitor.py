@@ -0,0 +1,164 @@
+"""事件循环延迟监控 - 采样事件循环延迟，并记录阻塞事件循环的调用栈"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+loop_lag = registry.histogram(
+    "twitch_web_event_loop_lag_seconds",
+    "事件循环调度延迟",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+
+class LoopMonitor:
+    """
+    事件循环延迟监控（可选的调试模式）
+
+    - 采样任务：每隔interval睡眠一次，实际唤醒时间与预期的差值即为事件循环延迟
+    - 看门狗线程：事件循环超过threshold未响应时，抓取事件循环线程当前的调用栈
+      （即正在阻塞事件循环的同步代码），事件循环恢复后补充实际阻塞时长
+    """
+
+    def __init__(self):
+        self.interval = settings.loop_monitor_interval
+        self.threshold = settings.loop_monitor_threshold
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event: Optional[threading.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        # 采样任务最后一次运行的时间（monotonic）
+        self._heartbeat = 0.0
+        # 看门狗已抓取、等待补充阻塞时长的事件
+        self._pending: Optional[Dict] = None
+        self.events: deque = deque(maxlen=settings.loop_monitor_max_events)
+        self.samples = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.total_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _capture_stack(self) -> Dict:
+        """抓取事件循环线程的调用栈和当前任务（在看门狗线程中调用）"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        task_name = None
+        coroutine = None
+        try:
+            task = asyncio.current_task(self._loop)
+            if task is not None:
+                task_name = task.get_name()
+                coroutine = repr(task.get_coro())
+        except Exception:
+            pass
+        return {
+            "detected_at": time.time(),
+            "task": task_name,
+            "coroutine": coroutine,
+            "stack": [line.rstrip() for line in stack[-30:]],
+            "blocked_seconds": None
+        }
+
+    def _watchdog_loop(self, stop_event: threading.Event):
+        """看门狗线程：检测事件循环停顿"""
+        check_interval = max(self.threshold / 2, 0.01)
+        while not stop_event.wait(check_interval):
+            stalled = time.monotonic() - self._heartbeat
+            if stalled > self.threshold + self.interval and self._pending is None:
+                self._pending = self._capture_stack()
+
+    async def _sample(self):
+        """采样任务：测量事件循环延迟"""
+        while True:
+            expected = time.monotonic() + self.interval
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(now - expected, 0.0)
+
+            self.samples += 1
+            self.last_lag = lag
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            loop_lag.observe(lag)
+
+            pending = self._pending
+            if pending is not None:
+                self._pending = None
+                pending["blocked_seconds"] = round(lag + self.interval, 4)
+                self.events.append(pending)
+                location = pending["stack"][-1].strip() if pending["stack"] else "未知位置"
+                message = (
+                    f"[LoopMonitor] ⚠️ 事件循环阻塞 {pending['blocked_seconds']:.3f}s，"
+                    f"任务={pending['task']}，位置: {location}"
+                )
+                print(message)
+                logger.warning(message + "\n" + "\n".join(pending["stack"]))
+
+    def start(self):
+        """启动监控"""
+        if self._task is not None:
+            return
+        print(f"[LoopMonitor] 启动事件循环延迟监控，阈值: {self.threshold}s")
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop_event = threading.Event()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(
+            target=self._watchdog_loop,
+            args=(self._stop_event,),
+            name="loop-watchdog",
+            daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        """停止监控"""
+        if self._task is None:
+            return
+        print("[LoopMonitor] 停止事件循环延迟监控")
+        self._task.cancel()
+        self._task = None
+        self._stop_event.set()
+        self._watchdog = None
+        self._pending = None
+
+    def get_report(self) -> Dict:
+        """监控报告"""
+        events: List[Dict] = list(self.events)
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "samples": self.samples,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "avg_lag_ms": round(self.total_lag / self.samples * 1000, 2) if self.samples else 0,
+            "blocking_events": list(reversed(events))
+        }
+
+    def reset(self):
+        """清空统计和阻塞事件"""
+        self.events.clear()
+        self.samples = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.total_lag = 0.0
+
+
+loop_monitor = LoopMonitor()
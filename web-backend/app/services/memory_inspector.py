@@ -0,0 +1,233 @@
+"""内存诊断 - 统计各缓存结构的大小，对比tracemalloc快照"""
+import sys
+import tracemalloc
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+
+
+def approx_size(obj: Any, seen: Optional[set] = None) -> int:
+    """递归估算对象占用的字节数（容器及其内容，同一对象只计算一次）"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approx_size(key, seen) + approx_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        for item in obj:
+            size += approx_size(item, seen)
+    return size
+
+
+class MemoryInspector:
+    """
+    内存诊断
+
+    - 结构报告：各服务缓存的条目数和估算字节数，以及每个账号在监控中占用的大小
+    - tracemalloc：开启后每次拍摄快照，与上一次快照比较，返回增长最多的分配位置
+    """
+
+    def __init__(self):
+        self.top_n = settings.memory_report_top_n
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_count = 0
+
+    @staticmethod
+    def _structures() -> Dict[str, Any]:
+        """需要统计的结构 {名称: 对象}"""
+        from app.services.account_watchdog import account_watchdog
+        from app.services.bot_monitor import bot_monitor
+        from app.services.config_service import config_service
+        from app.services.farming_analytics import farming_analytics
+        from app.services.notifier import notifier
+        from app.services.progress_tracker import progress_tracker
+        from app.services.remote_fleet import remote_fleet
+        from app.services.status_broadcaster import status_broadcaster
+        from app.services.user_index import user_index
+        from app.utils.response_cache import response_cache
+
+        return {
+            "account_watchdog.state": account_watchdog._state,
+            "account_watchdog.events": account_watchdog.events,
+            "bot_monitor.status_cache": bot_monitor._status_cache,
+            "bot_monitor.file_positions": bot_monitor._file_positions,
+            "bot_monitor.message_history": bot_monitor._message_history,
+            "bot_monitor.summaries": bot_monitor._summaries,
+            "bot_monitor.versions": bot_monitor._versions,
+            "config_service.cache": config_service._cache or {},
+            "farming_analytics.open": farming_analytics._open,
+            "farming_analytics.buckets": farming_analytics._buckets,
+            "notifier.incoming": notifier._incoming,
+            "progress_tracker.state": progress_tracker._state,
+            "progress_tracker.pending": progress_tracker._pending,
+            "remote_fleet.nodes": remote_fleet._nodes,
+            "remote_fleet.owners": remote_fleet._owners,
+            "status_broadcaster.snapshot": status_broadcaster._snapshot,
+            "status_broadcaster.delta_log": status_broadcaster._delta_log,
+            "user_index.rows": user_index._rows,
+            "response_cache.entries": response_cache._entries
+        }
+
+    @staticmethod
+    def _per_user() -> List[Dict]:
+        """每个账号在监控缓存中占用的大小"""
+        from app.services.bot_monitor import bot_monitor
+
+        users = []
+        for username in bot_monitor.tracked_usernames():
+            history = bot_monitor._message_history.get(username, [])
+            sizes = {
+                "message_history": approx_size(history),
+                "status_cache": approx_size(bot_monitor._status_cache.get(username)),
+                "summary": approx_size(bot_monitor._summaries.get(username))
+            }
+            users.append({
+                "username": username,
+                "messages": len(history),
+                "bytes": sum(sizes.values()),
+                "breakdown": sizes
+            })
+        users.sort(key=lambda item: item["bytes"], reverse=True)
+        return users
+
+    @staticmethod
+    def _rss_bytes() -> Optional[int]:
+        """当前进程常驻内存（仅Linux）"""
+        try:
+            with open("/proc/self/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def get_report(self, per_user: bool = True) -> Dict:
+        """
+        结构大小报告
+
+        遍历所有缓存对象估算大小，耗时与缓存的日志行数成正比，只用于诊断。
+        """
+        from app.services.bot_monitor import bot_monitor
+        from app.services.config_service import config_service
+
+        structures = {}
+        for name, obj in self._structures().items():
+            structures[name] = {"entries": len(obj), "bytes": approx_size(obj)}
+
+        configured = {user.get("Login") for user in config_service.get_users() if user.get("Login")}
+        stale = [username for username in bot_monitor.tracked_usernames() if username not in configured]
+
+        report = {
+            "rss_bytes": self._rss_bytes(),
+            "structures": structures,
+            "total_bytes": sum(item["bytes"] for item in structures.values()),
+            "tracked_users": len(bot_monitor.tracked_usernames()),
+            "configured_users": len(configured),
+            "stale_users": stale,
+            "tracemalloc": self.get_tracemalloc_status()
+        }
+        if per_user:
+            report["users"] = self._per_user()[:self.top_n]
+        return report
+
+    @staticmethod
+    def evict_users(active_usernames) -> List[str]:
+        """清理不在active_usernames中的账号在各服务中的状态，返回被清理的账号"""
+        from app.services.account_watchdog import account_watchdog
+        from app.services.bot_monitor import bot_monitor
+        from app.services.farming_analytics import farming_analytics
+        from app.services.progress_tracker import progress_tracker
+
+        evicted = set()
+        for service in (bot_monitor, progress_tracker, farming_analytics, account_watchdog):
+            evicted.update(service.evict_users(active_usernames))
+        return sorted(evicted)
+
+    def evict_stale(self) -> List[str]:
+        """清理已不在config.json中的账号的监控状态"""
+        from app.services.config_service import config_service
+
+        configured = {user.get("Login") for user in config_service.get_users() if user.get("Login")}
+        return self.evict_users(configured)
+
+    def get_tracemalloc_status(self) -> Dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "snapshots": self._snapshot_count
+        }
+
+    def start_tracing(self, frames: int = 1) -> Dict:
+        """开启tracemalloc（开启后内存分配会变慢，诊断结束后应关闭）"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._snapshot = None
+            self._snapshot_count = 0
+            print(f"[Memory] 开启tracemalloc，栈深度: {frames}")
+        return self.get_tracemalloc_status()
+
+    def stop_tracing(self) -> Dict:
+        """关闭tracemalloc并丢弃快照"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            print("[Memory] 关闭tracemalloc")
+        self._snapshot = None
+        self._snapshot_count = 0
+        return self.get_tracemalloc_status()
+
+    def take_snapshot(self, top: Optional[int] = None, group_by: str = "lineno") -> Dict:
+        """
+        拍摄快照，与上一次快照比较返回增长最多的前N项；
+        第一次拍摄时返回当前占用最多的前N项
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc未开启")
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise ValueError(f"不支持的分组方式: {group_by}")
+        top = top or self.top_n
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ))
+        previous = self._snapshot
+        self._snapshot = snapshot
+        self._snapshot_count += 1
+
+        if previous is None:
+            stats = [
+                {
+                    "location": stat.traceback.format()[-2:] if group_by == "traceback" else str(stat.traceback[0]),
+                    "size_bytes": stat.size,
+                    "count": stat.count
+                }
+                for stat in snapshot.statistics(group_by)[:top]
+            ]
+            return {"mode": "top", "snapshot": self._snapshot_count, "stats": stats}
+
+        stats = [
+            {
+                "location": stat.traceback.format()[-2:] if group_by == "traceback" else str(stat.traceback[0]),
+                "size_bytes": stat.size,
+                "size_diff_bytes": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff
+            }
+            for stat in snapshot.compare_to(previous, group_by)[:top]
+        ]
+        return {"mode": "diff", "snapshot": self._snapshot_count, "stats": stats}
+
+
+memory_inspector = MemoryInspector()
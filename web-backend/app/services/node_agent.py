@@ -0,0 +1,300 @@
+"""节点代理 - 把本机账号的状态和配置变化通过一个WebSocket上报到中心后端"""
+import asyncio
+import json
+import random
+import socket
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.services.bot_monitor import bot_monitor
+from app.services.config_service import config_service
+from app.services.remote_fleet import USER_FIELDS
+
+# 上报给中心的全局配置中省略的字段（账号单独上报，WebhookURL可能含密钥）
+OMITTED_CONFIG_FIELDS = ("Users", "WebhookURL")
+
+
+class NodeAgent:
+    """
+    节点代理
+
+    监听BotStatusMonitor的状态变化和ConfigService的配置变化，每AGENT_BATCH_INTERVAL秒合并为一条增量
+    （只包含变化的账号），带递增序号发送到中心。未确认的增量保存在缓冲中，断线重连后按中心回复的
+    序号补发；缓冲超过AGENT_BUFFER_SIZE条、节点重启或中心丢失状态时改发完整快照。
+    中心可以下发命令：启用/禁用账号、修改优先游戏、删除账号、重启drop容器。
+    """
+
+    def __init__(self):
+        self.node = settings.node_name or socket.gethostname()
+        # 进程会话ID：节点重启后中心丢弃旧序号，等待新快照
+        self.session = uuid.uuid4().hex[:12]
+        self._seq = 0
+        # 未确认的增量 [(seq, text)]
+        self._unacked: deque = deque()
+        self._need_snapshot = True
+        # 待发送的变化
+        self._pending_status: Dict[str, Optional[Dict]] = {}
+        self._pending_users: Dict[str, Optional[Dict]] = {}
+        self._pending_config: Optional[Dict] = None
+        # 最近一次上报的账号和全局配置（用于计算配置增量）
+        self._users: Dict[str, Dict] = {}
+        self._config: Dict[str, Any] = {}
+        self._ws = None
+        self._task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._listening = False
+        self._command_tasks = set()
+        self.connected_at: Optional[str] = None
+        self.reconnects = 0
+        self.acked_seq = 0
+        self.last_error: Optional[str] = None
+
+    # ---------- 收集变化 ----------
+
+    def _on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        if username in self._users:
+            self._pending_status[username] = new
+
+    def _on_config_change(self, config: Dict):
+        """计算账号和全局配置的变化"""
+        users = {
+            user["Login"]: {field: user.get(field) for field in USER_FIELDS}
+            for user in config.get("Users", []) if user.get("Login")
+        }
+        for login, user in users.items():
+            if self._users.get(login) != user:
+                self._pending_users[login] = user
+                summary = bot_monitor.get_cached_summary(login)
+                if login not in self._users and summary is not None:
+                    self._pending_status[login] = summary
+        for login in set(self._users) - set(users):
+            self._pending_users[login] = None
+            self._pending_status.pop(login, None)
+        self._users = users
+
+        global_config = {key: value for key, value in config.items() if key not in OMITTED_CONFIG_FIELDS}
+        if global_config != self._config:
+            self._pending_config = global_config
+            self._config = global_config
+
+    def _flush(self) -> Optional[str]:
+        """把待发送的变化合并为一条增量（放入未确认缓冲），没有变化时返回None"""
+        if not (self._pending_status or self._pending_users or self._pending_config is not None):
+            return None
+        if self._need_snapshot:
+            # 下次连接会发送完整快照，不再缓冲增量
+            self._pending_status, self._pending_users, self._pending_config = {}, {}, None
+            return None
+        self._seq += 1
+        message = {"type": "delta", "seq": self._seq}
+        if self._pending_users:
+            message["users"] = self._pending_users
+        if self._pending_status:
+            message["status"] = self._pending_status
+        if self._pending_config is not None:
+            message["config"] = self._pending_config
+        self._pending_status, self._pending_users, self._pending_config = {}, {}, None
+
+        text = json.dumps(message, ensure_ascii=False)
+        self._unacked.append((self._seq, text))
+        if len(self._unacked) > settings.agent_buffer_size:
+            print(f"[Agent] 未确认的增量超过{settings.agent_buffer_size}条，重连后发送完整快照")
+            self._unacked.clear()
+            self._need_snapshot = True
+            return None
+        return text
+
+    def _snapshot(self) -> str:
+        """当前所有账号、状态和全局配置的快照"""
+        self._pending_status, self._pending_users, self._pending_config = {}, {}, None
+        self._unacked.clear()
+        self._need_snapshot = False
+        self._seq += 1
+        status = {}
+        for login in self._users:
+            summary = bot_monitor.get_cached_summary(login)
+            if summary is not None:
+                status[login] = summary
+        return json.dumps({
+            "type": "snapshot",
+            "seq": self._seq,
+            "users": list(self._users.values()),
+            "status": status,
+            "config": self._config
+        }, ensure_ascii=False)
+
+    # ---------- 连接 ----------
+
+    async def _handshake(self, ws):
+        """发送hello，按中心回复的序号补发未确认的增量或发送快照"""
+        await ws.send(json.dumps({
+            "type": "hello",
+            "node": self.node,
+            "session": self.session,
+            "seq": self._seq
+        }))
+        welcome = json.loads(await asyncio.wait_for(ws.recv(), timeout=30))
+        resume_from = welcome.get("resume_from")
+
+        # 把尚未合并的变化加入缓冲，之后一起补发
+        self._flush()
+        oldest = self._unacked[0][0] if self._unacked else self._seq + 1
+        if self._need_snapshot or not isinstance(resume_from, int) or resume_from < oldest - 1 or resume_from > self._seq:
+            await ws.send(self._snapshot())
+            print(f"[Agent] 已连接中心，发送完整快照（{len(self._users)} 个账号）")
+            return
+        replay = [text for seq, text in self._unacked if seq > resume_from]
+        for text in replay:
+            await ws.send(text)
+        print(f"[Agent] 已连接中心，补发 {len(replay)} 条增量（从序号 {resume_from} 恢复）")
+
+    async def _reader(self, ws):
+        """处理中心的确认、重新同步请求和命令"""
+        async for text in ws:
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            kind = message.get("type")
+            if kind == "ack":
+                self.acked_seq = message.get("seq", self.acked_seq)
+                while self._unacked and self._unacked[0][0] <= self.acked_seq:
+                    self._unacked.popleft()
+            elif kind == "resync":
+                await ws.send(self._snapshot())
+            elif kind == "command":
+                task = asyncio.create_task(self._run_command(ws, message))
+                self._command_tasks.add(task)
+                task.add_done_callback(self._command_tasks.discard)
+            elif kind == "error":
+                print(f"[Agent] 中心返回错误: {message.get('message')}")
+
+    async def _writer(self, ws):
+        """按批发送增量"""
+        while True:
+            await asyncio.sleep(settings.agent_batch_interval)
+            text = self._flush()
+            if text is not None:
+                await ws.send(text)
+
+    async def _run_command(self, ws, message: Dict):
+        """执行中心下发的命令并回复结果"""
+        from app.services.restart_orchestrator import restart_orchestrator
+
+        action = message.get("action")
+        args = message.get("args") or {}
+        ok, detail = False, None
+        try:
+            if action == "set_enabled":
+                ok = config_service.update_user_enabled(args["id"], bool(args["enabled"]))
+            elif action == "set_favourite_games":
+                ok = config_service.update_user_favourite_games(args["id"], list(args["favourite_games"]))
+            elif action == "delete_user":
+                ok = config_service.delete_user(args["id"])
+            elif action == "restart":
+                result, report = await restart_orchestrator.start(args.get("reason") or "central")
+                ok = result.get("status") == "success"
+                detail = f"{result.get('message')}（报告 {report['id']}）"
+            else:
+                detail = f"未知的命令: {action}"
+        except Exception as e:
+            detail = str(e)
+        print(f"[Agent] 执行中心命令 {action}: {'成功' if ok else '失败'}{f'（{detail}）' if detail else ''}")
+        try:
+            await ws.send(json.dumps({"type": "command_result", "id": message.get("id"), "ok": ok, "message": detail},
+                                     ensure_ascii=False))
+        except Exception:
+            pass
+
+    async def _run(self):
+        """连接中心，断开后按指数退避重连"""
+        import websockets
+
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(
+                    settings.central_url,
+                    extra_headers={"Authorization": f"Bearer {settings.central_token or ''}", "X-Node-Name": self.node},
+                    ping_interval=settings.ws_heartbeat_interval,
+                    ping_timeout=settings.ws_heartbeat_timeout,
+                    max_size=None
+                ) as ws:
+                    await self._handshake(ws)
+                    self._ws = ws
+                    self.connected_at = datetime.now(timezone.utc).isoformat()
+                    self.last_error = None
+                    backoff = 1.0
+                    tasks = [asyncio.create_task(self._reader(ws)), asyncio.create_task(self._writer(ws))]
+                    try:
+                        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            task.result()
+                    finally:
+                        for task in tasks:
+                            task.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if error != self.last_error:
+                    print(f"[Agent] ⚠️ 与中心的连接中断（将自动重连）: {error}")
+                self.last_error = error
+            if self._ws is not None:
+                self._ws = None
+                self.connected_at = None
+                self.reconnects += 1
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2, settings.agent_reconnect_max)
+
+    async def _poll(self):
+        """独立运行时定期读取日志（嵌入Web后端时由状态广播器读取）"""
+        while True:
+            users = [user.get("Login") for user in config_service.get_local_users() if user.get("Login")]
+            bot_monitor.get_all_users_status(users)
+            bot_monitor.evict_users(users)
+            await asyncio.sleep(settings.agent_poll_interval)
+
+    def get_status(self) -> Dict:
+        return {
+            "enabled": bool(settings.central_url),
+            "node": self.node,
+            "central_url": settings.central_url,
+            "session": self.session,
+            "connected": self._ws is not None,
+            "connected_at": self.connected_at,
+            "seq": self._seq,
+            "acked_seq": self.acked_seq,
+            "unacked": len(self._unacked),
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "account_count": len(self._users)
+        }
+
+    def start(self, poll: bool = False):
+        """启动代理（poll=True时自己定期读取日志）"""
+        if self._task is not None:
+            return
+        if not self._listening:
+            bot_monitor.add_listener(self._on_status_change)
+            config_service.add_listener(self._on_config_change)
+            self._listening = True
+        self._on_config_change(config_service.get_config())
+        print(f"[Agent] 启动节点代理 {self.node}，中心: {settings.central_url}")
+        self._task = asyncio.create_task(self._run())
+        if poll:
+            self._poll_task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        tasks = [task for task in (self._task, self._poll_task) if task is not None]
+        self._task = self._poll_task = None
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+node_agent = NodeAgent()
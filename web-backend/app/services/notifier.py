@@ -0,0 +1,528 @@
+"""Webhook通知 - 监控事件写入发件箱，合并为摘要后异步发送，失败按指数退避重试"""
+import asyncio
+import json
+import os
+import random
+import socket
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional
+
+import httpx
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.notification import NotificationOutbox
+from app.services.account_watchdog import account_watchdog, ERROR_LOOP
+from app.services.bot_monitor import bot_monitor
+from app.services.restart_orchestrator import restart_orchestrator
+
+# 事件类型
+DROP_CLAIMED = "drop_claimed"
+ACCOUNT_ERROR = "account_error"
+ACCOUNT_STALLED = "account_stalled"
+RESTART_DONE = "restart_done"
+TEST = "test"
+EVENT_TYPES = (DROP_CLAIMED, ACCOUNT_ERROR, ACCOUNT_STALLED, RESTART_DONE)
+
+# Discord嵌入消息颜色
+COLORS = {DROP_CLAIMED: 0x2ECC71, ACCOUNT_ERROR: 0xE74C3C, ACCOUNT_STALLED: 0xF39C12, RESTART_DONE: 0x3498DB}
+DISCORD_CONTENT_LIMIT = 2000
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """SQLite读出的时间不带时区，写入时统一为UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class WebhookNotifier:
+    """
+    Webhook通知管道
+
+    - 事件来源：BotStatusMonitor（掉宝观看完成）、AccountWatchdog（错误循环、停滞）、RestartOrchestrator（重启结束）
+    - notify()只把事件放入内存队列，后台任务批量写入notification_outbox表（每个webhook地址一行），
+      服务重启后未发送的通知继续发送；同一事件带dedup_key，只入队一次
+    - 每个地址的待发送通知在最早一条等待WEBHOOK_DIGEST_WINDOW秒后合并为一条摘要发送（最多WEBHOOK_DIGEST_MAX条），
+      每个地址同时进行的请求不超过WEBHOOK_ENDPOINT_CONCURRENCY
+    - 网络错误、5xx、408、429按指数退避重试（429优先使用Retry-After），其他4xx或超过最大次数标记为failed
+    - 发送前用条件UPDATE抢占行锁，多个worker共享数据库时同一条通知不会重复发送
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._incoming: Deque[Dict] = deque(maxlen=10000)
+        self._inflight: Dict[str, int] = {}
+        self._deliveries: set = set()
+        # 每个地址最近一次发送的结果
+        self._endpoint_stats: Dict[str, Dict] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_prune = datetime.min.replace(tzinfo=timezone.utc)
+        bot_monitor.add_listener(self._on_status_change)
+        account_watchdog.add_listener(self._on_watchdog_event)
+        restart_orchestrator.add_listener(self._on_restart_finished)
+
+    # ---------- 事件来源 ----------
+
+    def endpoints(self) -> List[str]:
+        """webhook地址：config.json的WebhookURL和WEBHOOK_URLS"""
+        from app.services.config_service import config_service
+
+        urls = [config_service.get_config().get("WebhookURL"), *settings.webhook_urls]
+        result = []
+        for url in urls:
+            if isinstance(url, str) and url.strip().startswith(("http://", "https://")) and url.strip() not in result:
+                result.append(url.strip())
+        return result
+
+    def notify(self, event_type: str, title: str, message: str, login: Optional[str] = None,
+               data: Optional[Dict] = None, dedup_key: Optional[str] = None):
+        """发出通知（不等待写入和发送）"""
+        if event_type != TEST and event_type not in settings.webhook_events:
+            return
+        self._incoming.append({
+            "type": event_type,
+            "title": title,
+            "message": message,
+            "login": login,
+            "data": data or {},
+            "at": datetime.now(timezone.utc).isoformat(),
+            "dedup_key": dedup_key
+        })
+        self.wake()
+
+    def _on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        """进度达到要求的分钟数：掉宝观看完成（bot随后自动领取）"""
+        if not old or not old.get("progress") or not new.get("progress"):
+            return
+        before, after = old["progress"], new["progress"]
+        campaign = new.get("campaign") or {}
+        if (old.get("campaign") or {}) != campaign or before["required"] != after["required"]:
+            return
+        if before["current"] < after["required"] <= after["current"]:
+            game, name = campaign.get("game"), campaign.get("campaign")
+            self.notify(
+                DROP_CLAIMED, "掉宝完成",
+                f"{username} 完成了 {game or '未知游戏'} / {name or '未知活动'}（{after['required']}分钟）",
+                login=username,
+                data={"game": game, "campaign": name, "required": after["required"]},
+                dedup_key=f"{DROP_CLAIMED}:{username}:{name}:{after['required']}:{new.get('last_update')}"
+            )
+
+    def _on_watchdog_event(self, event: Dict):
+        """账号异常：错误循环为account_error，其他为account_stalled"""
+        if event["type"] != "incident_opened":
+            return
+        event_type = ACCOUNT_ERROR if event["kind"] == ERROR_LOOP else ACCOUNT_STALLED
+        titles = {
+            "error_loop": "账号反复出错",
+            "seeking_no_campaign": "账号长时间找不到活动",
+            "log_stalled": "账号日志停止更新"
+        }
+        evidence = event.get("evidence") or {}
+        details = "，".join(f"{key}: {value}" for key, value in evidence.items() if not isinstance(value, list))
+        self.notify(
+            event_type, titles.get(event["kind"], event["kind"]), f"{event['login']}（{details}）",
+            login=event["login"], data={"kind": event["kind"], "evidence": evidence},
+            dedup_key=f"watchdog:{event['incident_id']}"
+        )
+
+    def _on_restart_finished(self, report: Dict):
+        """drop容器重启结束"""
+        target = f"分片 {report['shard']}" if report.get("shard") is not None else "drop容器"
+        if report["status"] == "failed":
+            message = f"重启失败（{report['reason']}）: {(report.get('restart_result') or {}).get('message')}"
+        else:
+            message = f"重启完成（{report['reason']}），{report['resumed_count']}/{report['account_count']} 个账号恢复"
+            if report["max_downtime_seconds"] is not None:
+                message += f"，最长停机 {report['max_downtime_seconds']}秒"
+            if report["alert_accounts"]:
+                message += f"，未恢复: {', '.join(report['alert_accounts'])}"
+        self.notify(
+            RESTART_DONE, f"{target}重启" + ("失败" if report["status"] == "failed" else "完成"), message,
+            data={key: report.get(key) for key in (
+                "id", "reason", "status", "shard", "account_count", "resumed_count", "alert_accounts", "max_downtime_seconds"
+            )},
+            dedup_key=f"{RESTART_DONE}:{report['id']}"
+        )
+
+    # ---------- 发件箱 ----------
+
+    async def _ingest(self):
+        """把内存队列中的事件写入发件箱（每个地址一行，已入队的事件跳过）"""
+        if not self._incoming:
+            return
+        endpoints = self.endpoints()
+        events = []
+        while self._incoming:
+            events.append(self._incoming.popleft())
+        if not endpoints:
+            return
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                "endpoint": endpoint,
+                "event_type": event["type"],
+                "payload": json.dumps({key: value for key, value in event.items() if key != "dedup_key"},
+                                      ensure_ascii=False),
+                "dedup_key": event["dedup_key"],
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now
+            }
+            for event in events for endpoint in endpoints
+        ]
+        try:
+            async with AsyncSessionLocal() as db:
+                keys = {row["dedup_key"] for row in rows if row["dedup_key"]}
+                existing = set()
+                if keys:
+                    existing = set((await db.execute(
+                        select(NotificationOutbox.endpoint, NotificationOutbox.dedup_key)
+                        .where(NotificationOutbox.dedup_key.in_(keys))
+                    )).all())
+                for row in rows:
+                    key = (row["endpoint"], row["dedup_key"])
+                    if row["dedup_key"] and key in existing:
+                        continue
+                    existing.add(key)
+                    db.add(NotificationOutbox(**row))
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    # 其他worker同时写入了同一事件：逐条写入，跳过重复的
+                    await db.rollback()
+                    for row in rows:
+                        db.add(NotificationOutbox(**row))
+                        try:
+                            await db.commit()
+                        except IntegrityError:
+                            await db.rollback()
+        except BaseException:
+            # 写入失败时放回队列，下次重试
+            self._incoming.extendleft(reversed(events))
+            raise
+
+    async def _dispatch(self) -> Optional[float]:
+        """为每个地址抢占到期的通知并开始发送，返回距下一条通知到期的秒数"""
+        now = datetime.now(timezone.utc)
+        window = timedelta(seconds=settings.webhook_digest_window)
+        next_due: Optional[float] = None
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(NotificationOutbox.endpoint,
+                       func.count(NotificationOutbox.id),
+                       func.min(NotificationOutbox.created_at),
+                       func.max(NotificationOutbox.attempts),
+                       func.min(NotificationOutbox.next_attempt_at))
+                .where(NotificationOutbox.status == "pending")
+                .group_by(NotificationOutbox.endpoint)
+            )).all()
+
+        for endpoint, count, oldest, max_attempts, earliest in rows:
+            oldest, earliest = _utc(oldest), _utc(earliest)
+            # 重试的通知不再等待合并；新通知等待合并窗口或数量达到上限
+            ready_at = earliest if max_attempts or count >= settings.webhook_digest_max \
+                else max(earliest, oldest + window)
+            wait = (ready_at - now).total_seconds()
+            if wait > 0:
+                next_due = wait if next_due is None else min(next_due, wait)
+                continue
+            if self._inflight.get(endpoint, 0) >= settings.webhook_endpoint_concurrency:
+                continue
+            batch = await self._claim(endpoint, now)
+            if batch:
+                self._inflight[endpoint] = self._inflight.get(endpoint, 0) + 1
+                task = asyncio.create_task(self._deliver(endpoint, batch))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+        return next_due
+
+    async def _claim(self, endpoint: str, now: datetime) -> List[NotificationOutbox]:
+        """抢占该地址最早的一批到期通知"""
+        free = or_(NotificationOutbox.locked_until.is_(None), NotificationOutbox.locked_until < now)
+        async with AsyncSessionLocal() as db:
+            ids = (await db.scalars(
+                select(NotificationOutbox.id)
+                .where(NotificationOutbox.endpoint == endpoint, NotificationOutbox.status == "pending",
+                       NotificationOutbox.next_attempt_at <= now, free)
+                .order_by(NotificationOutbox.id)
+                .limit(settings.webhook_digest_max)
+            )).all()
+            if not ids:
+                return []
+            await db.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(ids), NotificationOutbox.status == "pending", free)
+                .values(locked_by=self.worker_id,
+                        locked_until=now + timedelta(seconds=settings.webhook_lock_ttl))
+            )
+            await db.commit()
+            batch = (await db.scalars(
+                select(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(ids), NotificationOutbox.locked_by == self.worker_id)
+                .order_by(NotificationOutbox.id)
+            )).all()
+        return list(batch)
+
+    # ---------- 发送 ----------
+
+    @staticmethod
+    def _is_discord(endpoint: str) -> bool:
+        return "discord.com/api/webhooks" in endpoint or "discordapp.com/api/webhooks" in endpoint
+
+    @staticmethod
+    def _line(event: Dict) -> str:
+        return f"{event['title']}: {event['message']}"
+
+    def build_payload(self, endpoint: str, events: List[Dict]) -> Dict:
+        """单条通知或摘要的请求体（Discord webhook格式或通用JSON）"""
+        if self._is_discord(endpoint):
+            if len(events) == 1:
+                event = events[0]
+                return {"embeds": [{
+                    "title": event["title"],
+                    "description": event["message"],
+                    "timestamp": event["at"],
+                    "color": COLORS.get(event["type"], 0x95A5A6)
+                }]}
+            lines = [f"**{len(events)} 条通知**"]
+            for index, event in enumerate(events):
+                line = f"- {self._line(event)}"
+                if sum(len(item) + 1 for item in lines) + len(line) > DISCORD_CONTENT_LIMIT - 30:
+                    lines.append(f"…另有 {len(events) - index} 条")
+                    break
+                lines.append(line)
+            return {"content": "\n".join(lines)}
+        return {
+            "type": "digest" if len(events) > 1 else "notification",
+            "count": len(events),
+            "text": "\n".join(self._line(event) for event in events),
+            "events": events
+        }
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=settings.webhook_timeout)
+        return self._client
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(settings.webhook_backoff_base * 2 ** (attempts - 1), settings.webhook_backoff_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _deliver(self, endpoint: str, batch: List[NotificationOutbox]):
+        """发送一批通知并记录结果"""
+        ids = [row.id for row in batch]
+        events = [json.loads(row.payload) for row in batch]
+        error: Optional[str] = None
+        retry = True
+        retry_after: Optional[float] = None
+        try:
+            response = await self.client.post(endpoint, json=self.build_payload(endpoint, events))
+            if response.status_code >= 300:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                retry = response.status_code >= 500 or response.status_code in (408, 429)
+                try:
+                    retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    retry_after = None
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+        except asyncio.CancelledError:
+            # 关闭时中断发送：释放锁，下次启动重新发送
+            await self._release(ids)
+            raise
+        finally:
+            self._inflight[endpoint] = max(self._inflight.get(endpoint, 1) - 1, 0)
+
+        now = datetime.now(timezone.utc)
+        stats = self._endpoint_stats.setdefault(endpoint, {"sent": 0, "failed_attempts": 0})
+        try:
+            async with AsyncSessionLocal() as db:
+                if error is None:
+                    await db.execute(
+                        update(NotificationOutbox).where(NotificationOutbox.id.in_(ids))
+                        .values(status="sent", sent_at=now, attempts=NotificationOutbox.attempts + 1,
+                                locked_by=None, locked_until=None, last_error=None)
+                    )
+                    stats.update(sent=stats["sent"] + len(ids), last_success_at=now.isoformat())
+                else:
+                    for row in batch:
+                        attempts = row.attempts + 1
+                        failed = not retry or attempts >= settings.webhook_max_attempts
+                        delay = max(self._backoff(attempts), retry_after or 0)
+                        await db.execute(
+                            update(NotificationOutbox).where(NotificationOutbox.id == row.id)
+                            .values(status="failed" if failed else "pending", attempts=attempts,
+                                    next_attempt_at=now + timedelta(seconds=delay),
+                                    locked_by=None, locked_until=None, last_error=error)
+                        )
+                    stats.update(failed_attempts=stats["failed_attempts"] + 1,
+                                 last_error=error, last_error_at=now.isoformat())
+                await db.commit()
+        except Exception as e:
+            print(f"[Notifier] 记录发送结果失败: {e}")
+
+        if error is None:
+            print(f"[Notifier] 已发送 {len(ids)} 条通知到 {self._mask(endpoint)}")
+        else:
+            print(f"[Notifier] 发送通知失败 {self._mask(endpoint)}（{len(ids)} 条）: {error}")
+        self.wake()
+
+    async def _release(self, ids: List[int]):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(NotificationOutbox)
+                    .where(NotificationOutbox.id.in_(ids), NotificationOutbox.locked_by == self.worker_id)
+                    .values(locked_by=None, locked_until=None)
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"[Notifier] 释放通知锁失败: {e}")
+
+    @staticmethod
+    def _mask(endpoint: str) -> str:
+        """日志和接口中隐藏地址中的令牌（只保留前40个字符）"""
+        return endpoint if len(endpoint) <= 40 else endpoint[:40] + "…"
+
+    async def _prune(self):
+        """清理过期的已发送和失败通知"""
+        now = datetime.now(timezone.utc)
+        if now - self._last_prune < timedelta(hours=1):
+            return
+        cutoff = now - timedelta(days=settings.webhook_retention_days)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(NotificationOutbox)
+                .where(NotificationOutbox.status != "pending", NotificationOutbox.created_at < cutoff)
+            )
+            await db.commit()
+        self._last_prune = now
+
+    # ---------- 查询 ----------
+
+    async def get_endpoint_stats(self) -> List[Dict]:
+        """每个地址的发件箱统计"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(NotificationOutbox.endpoint, NotificationOutbox.status, func.count(NotificationOutbox.id))
+                .group_by(NotificationOutbox.endpoint, NotificationOutbox.status)
+            )).all()
+        counts: Dict[str, Dict[str, int]] = {}
+        for endpoint, row_status, count in rows:
+            counts.setdefault(endpoint, {})[row_status] = count
+        configured = self.endpoints()
+        result = []
+        for endpoint in [*configured, *[url for url in counts if url not in configured]]:
+            result.append({
+                "endpoint": self._mask(endpoint),
+                "configured": endpoint in configured,
+                "format": "discord" if self._is_discord(endpoint) else "json",
+                "pending": counts.get(endpoint, {}).get("pending", 0),
+                "sent": counts.get(endpoint, {}).get("sent", 0),
+                "failed": counts.get(endpoint, {}).get("failed", 0),
+                "inflight": self._inflight.get(endpoint, 0),
+                **self._endpoint_stats.get(endpoint, {})
+            })
+        return result
+
+    def serialize(self, row: NotificationOutbox) -> Dict:
+        return {
+            "id": row.id,
+            "endpoint": self._mask(row.endpoint),
+            "event_type": row.event_type,
+            "event": json.loads(row.payload),
+            "status": row.status,
+            "attempts": row.attempts,
+            "next_attempt_at": _utc(row.next_attempt_at).isoformat() if row.next_attempt_at else None,
+            "last_error": row.last_error,
+            "sent_at": _utc(row.sent_at).isoformat() if row.sent_at else None,
+            "created_at": _utc(row.created_at).isoformat() if row.created_at else None
+        }
+
+    async def list_outbox(self, status: Optional[str], limit: int) -> List[Dict]:
+        """最近的通知（最新的在前）"""
+        stmt = select(NotificationOutbox).order_by(NotificationOutbox.id.desc()).limit(limit)
+        if status:
+            stmt = stmt.where(NotificationOutbox.status == status)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(stmt)).all()
+        return [self.serialize(row) for row in rows]
+
+    async def retry(self, notification_id: int) -> Optional[Dict]:
+        """把失败的通知重新放回待发送"""
+        async with AsyncSessionLocal() as db:
+            row = await db.get(NotificationOutbox, notification_id)
+            if row is None:
+                return None
+            if row.status == "failed":
+                row.status = "pending"
+                row.attempts = 0
+                row.next_attempt_at = datetime.now(timezone.utc)
+                row.locked_by = None
+                row.locked_until = None
+                await db.commit()
+                await db.refresh(row)
+            result = self.serialize(row)
+        self.wake()
+        return result
+
+    # ---------- 后台任务 ----------
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            next_due = None
+            try:
+                await self._ingest()
+                next_due = await self._dispatch()
+                await self._prune()
+            except Exception as e:
+                print(f"[Notifier] 处理通知失败: {e}")
+            timeout = settings.webhook_poll_interval if next_due is None \
+                else min(max(next_due, 0.05), settings.webhook_poll_interval)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        """启动后台发送任务"""
+        if self._task is None:
+            print(f"[Notifier] 启动webhook通知，{len(self.endpoints())} 个地址，"
+                  f"合并窗口: {settings.webhook_digest_window}秒")
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务：未写入的事件写入发件箱，进行中的发送中断后下次启动重发"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._deliveries):
+            task.cancel()
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+        try:
+            await self._ingest()
+        except Exception as e:
+            print(f"[Notifier] 写入发件箱失败: {e}")
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+notifier = WebhookNotifier()
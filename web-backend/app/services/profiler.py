@@ -0,0 +1,179 @@
+"""按需性能分析 - 在运行中的进程内进行采样分析或cProfile分析"""
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from app.config import settings
+
+
+class ProfilerBusyError(Exception):
+    """已有分析会话正在运行"""
+    pass
+
+
+class ProfilerService:
+    """
+    按需性能分析（同一时间只允许一个会话，超过时限自动停止）
+
+    - sample模式：后台线程定期抓取所有线程的调用栈（sys._current_frames），
+      汇总为折叠栈格式（flamegraph.pl / speedscope可直接使用），开销低
+    - cprofile模式：在事件循环线程上启用cProfile，导出pstats文件
+      （只分析事件循环线程，线程池中的同步代码不在其中）
+    """
+
+    MODES = ("sample", "cprofile")
+
+    def __init__(self):
+        self.max_duration = settings.profiler_max_duration
+        self.mode: Optional[str] = None
+        self.interval = 0.0
+        self.started_at: Optional[float] = None
+        self.deadline: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # sample模式
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event: Optional[threading.Event] = None
+        self._stacks: Counter = Counter()
+        self.samples = 0
+        # cprofile模式
+        self._profile: Optional[cProfile.Profile] = None
+        self._timeout_handle: Optional[asyncio.TimerHandle] = None
+        # 最近一次会话的结果
+        self._result_stacks: Counter = Counter()
+        self._result_pstats: Optional[bytes] = None
+
+    @property
+    def running(self) -> bool:
+        return self.mode is not None and self.stopped_at is None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample_loop(self, stop_event: threading.Event, interval: float, deadline: float):
+        """采样线程：抓取除自身外所有线程的调用栈"""
+        own_id = threading.get_ident()
+        names = {}
+        while not stop_event.wait(interval):
+            if time.monotonic() >= deadline:
+                self._finish("达到时间上限")
+                break
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(self._frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def start(self, mode: str = "sample", duration: Optional[float] = None, interval: Optional[float] = None) -> Dict:
+        """开始分析会话"""
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的分析模式: {mode}")
+        duration = min(duration or self.max_duration, self.max_duration)
+        if duration <= 0:
+            raise ValueError("分析时长必须大于0")
+        interval = max(interval or settings.profiler_sample_interval, 0.001)
+
+        with self._lock:
+            if self.running:
+                raise ProfilerBusyError("已有性能分析会话正在运行")
+            self.mode = mode
+            self.interval = interval
+            self.started_at = time.time()
+            self.stopped_at = None
+            self.deadline = time.monotonic() + duration
+            self.samples = 0
+            self._stacks = Counter()
+            self._result_stacks = Counter()
+            self._result_pstats = None
+
+            if mode == "sample":
+                self._stop_event = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._sample_loop,
+                    args=(self._stop_event, interval, self.deadline),
+                    name="profiler-sampler",
+                    daemon=True
+                )
+                self._thread.start()
+            else:
+                # cProfile只能在调用线程上启用，此处运行在事件循环线程
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+                loop = asyncio.get_running_loop()
+                self._timeout_handle = loop.call_later(duration, self._finish, "达到时间上限")
+
+        print(f"[Profiler] 开始性能分析: 模式={mode}, 时长上限={duration}s")
+        return self.get_status()
+
+    def _finish(self, reason: str):
+        """结束会话并保存结果（可由采样线程、定时器或stop调用）"""
+        with self._lock:
+            if not self.running:
+                return
+            if self.mode == "sample":
+                self._stop_event.set()
+                self._result_stacks = self._stacks
+                self._thread = None
+            else:
+                # disable需要在启用的线程（事件循环线程）上调用
+                self._profile.disable()
+                if self._timeout_handle is not None:
+                    self._timeout_handle.cancel()
+                    self._timeout_handle = None
+                stats = pstats.Stats(self._profile, stream=io.StringIO())
+                self._result_pstats = marshal.dumps(stats.stats)
+                self._profile = None
+            self.stopped_at = time.time()
+        print(f"[Profiler] 性能分析结束（{reason}）")
+
+    def stop(self) -> Dict:
+        """手动停止当前会话"""
+        self._finish("手动停止")
+        return self.get_status()
+
+    def get_status(self) -> Dict:
+        """会话状态"""
+        end = self.stopped_at or time.time()
+        return {
+            "running": self.running,
+            "mode": self.mode,
+            "interval": self.interval if self.mode == "sample" else None,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "elapsed_seconds": round(end - self.started_at, 2) if self.started_at else 0,
+            "remaining_seconds": round(max(self.deadline - time.monotonic(), 0), 2) if self.running else 0,
+            "samples": self.samples if self.mode == "sample" else None,
+            "has_result": bool(self._result_stacks) or self._result_pstats is not None
+        }
+
+    def get_collapsed(self) -> Optional[str]:
+        """最近一次sample会话的折叠栈文本（每行：栈;帧... 次数）"""
+        if self.running or not self._result_stacks:
+            return None
+        return "\n".join(f"{stack} {count}" for stack, count in self._result_stacks.most_common()) + "\n"
+
+    def get_pstats(self) -> Optional[bytes]:
+        """最近一次cprofile会话的pstats文件内容（可用pstats/snakeviz打开）"""
+        if self.running:
+            return None
+        return self._result_pstats
+
+
+profiler_service = ProfilerService()
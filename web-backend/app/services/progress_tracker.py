@@ -0,0 +1,322 @@
+"""观看进度跟踪 - 记录进度时间序列，计算观看速率、掉宝完成预计时间和停滞账号"""
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.progress_sample import ProgressSample
+from app.services.bot_monitor import bot_monitor
+
+
+class ProgressTracker:
+    """
+    观看进度跟踪
+
+    通过BotStatusMonitor的状态变化监听器接收进度，不重新扫描日志：
+    - 内存中保留每个账号最近progress_rate_window分钟内的进度变化点，用于计算速率和ETA
+    - 进度最后一次变化的时间用于判断停滞（状态为Watching但超过N分钟没有增长）
+    - 降采样后批量写入progress_samples表：每个账号每progress_sample_interval秒最多一行，
+      掉宝切换或状态变化时额外记录一行
+    时间均使用日志中的时间戳。
+    """
+
+    def __init__(self):
+        self.sample_interval = settings.progress_sample_interval
+        self.rate_window = timedelta(minutes=settings.progress_rate_window)
+        self.stall_minutes = settings.progress_stall_minutes
+        self._state: Dict[str, Dict] = {}
+        # 待写入数据库的采样（数据库不可用时最多积压的条数有限）
+        self._pending: Deque[Dict] = deque(maxlen=10000)
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = datetime.min.replace(tzinfo=timezone.utc)
+        bot_monitor.add_listener(self.on_status_change)
+        # 导入前已有的状态（监听器只会收到之后的变化）
+        for username in bot_monitor.tracked_usernames():
+            summary = bot_monitor.get_cached_summary(username)
+            if summary:
+                self.on_status_change(username, None, summary)
+
+    @staticmethod
+    def _parse_time(value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.astimezone()
+
+    @staticmethod
+    def _new_state() -> Dict:
+        return {
+            "status": None,
+            "campaign": None,
+            "game": None,
+            "current": None,
+            "required": None,
+            "key": None,  # (campaign, required)，变化说明切换到了新的掉宝
+            "changed_at": None,  # 进度最后一次变化的时间
+            "samples": deque(),  # [(时间, 进度)]，只记录变化点
+            "saved_at": None,
+            "saved_status": None
+        }
+
+    def on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        """状态变化监听：更新进度变化点，按降采样规则加入待写入队列"""
+        at = self._parse_time(new.get("last_update")) or datetime.now(timezone.utc)
+        state = self._state.get(username)
+        if state is None:
+            state = self._state[username] = self._new_state()
+        state["status"] = new.get("status")
+
+        progress = new.get("progress")
+        if not progress:
+            return
+        campaign_info = new.get("campaign") or {}
+        current, required = progress["current"], progress["required"]
+        key = (campaign_info.get("campaign"), required)
+        samples = state["samples"]
+
+        new_drop = key != state["key"] or (state["current"] is not None and current < state["current"])
+        if new_drop:
+            samples.clear()
+            state["changed_at"] = at
+        elif current != state["current"] or state["changed_at"] is None:
+            state["changed_at"] = at
+        state.update(
+            key=key,
+            current=current,
+            required=required,
+            campaign=campaign_info.get("campaign"),
+            game=campaign_info.get("game")
+        )
+
+        if samples and samples[-1][1] != current and at - samples[-1][0] >= timedelta(minutes=self.stall_minutes):
+            # 停滞后恢复：速率只按恢复后的连续观看计算
+            samples.clear()
+        if not samples or samples[-1][1] != current:
+            samples.append((at, current))
+        while len(samples) > 2 and at - samples[0][0] > self.rate_window:
+            samples.popleft()
+
+        if (
+            new_drop
+            or state["saved_at"] is None
+            or state["status"] != state["saved_status"]
+            or (at - state["saved_at"]).total_seconds() >= self.sample_interval
+        ):
+            state["saved_at"] = at
+            state["saved_status"] = state["status"]
+            self._pending.append({
+                "timestamp": at.astimezone(timezone.utc),
+                "login": username,
+                "status": state["status"],
+                "campaign": state["campaign"],
+                "game": state["game"],
+                "current": current,
+                "required": required
+            })
+
+    @staticmethod
+    def _rate(samples: Iterable[Tuple[datetime, int]]) -> Optional[float]:
+        """观看速率（每分钟增加的已观看分钟数）"""
+        samples = list(samples)
+        if len(samples) < 2:
+            return None
+        (first_at, first), (last_at, last) = samples[0], samples[-1]
+        minutes = (last_at - first_at).total_seconds() / 60
+        if minutes < 1:
+            return None
+        return max(last - first, 0) / minutes
+
+    def get_progress(self, username: str, now: Optional[datetime] = None) -> Optional[Dict]:
+        """账号的观看速率、预计完成时间和停滞状态"""
+        state = self._state.get(username)
+        if not state or state["current"] is None:
+            return None
+        now = now or datetime.now(timezone.utc)
+        remaining = max(state["required"] - state["current"], 0)
+        rate = self._rate(state["samples"])
+
+        stalled_minutes = 0.0
+        if state["status"] == "Watching" and state["changed_at"] is not None:
+            stalled_minutes = max((now - state["changed_at"]).total_seconds() / 60, 0)
+        stalled = stalled_minutes >= self.stall_minutes
+
+        eta_minutes = None
+        eta_at = None
+        if remaining == 0:
+            eta_minutes = 0.0
+        elif rate and not stalled:
+            eta_minutes = remaining / rate
+            eta_at = (state["samples"][-1][0] + timedelta(minutes=eta_minutes)).isoformat()
+
+        return {
+            "current": state["current"],
+            "required": state["required"],
+            "remaining": remaining,
+            "rate_per_minute": round(rate, 3) if rate is not None else None,
+            "eta_minutes": round(eta_minutes, 1) if eta_minutes is not None else None,
+            "eta_at": eta_at,
+            "last_progress_at": state["changed_at"].isoformat() if state["changed_at"] else None,
+            "stalled": stalled,
+            "stalled_minutes": round(stalled_minutes, 1) if stalled else 0.0
+        }
+
+    def stalled_logins(self, now: Optional[datetime] = None) -> Tuple[str, ...]:
+        """停滞的账号（可作为响应缓存版本的一部分）"""
+        now = now or datetime.now(timezone.utc)
+        threshold = timedelta(minutes=self.stall_minutes)
+        return tuple(sorted(
+            login for login, state in self._state.items()
+            if state["status"] == "Watching" and state["changed_at"] is not None
+            and now - state["changed_at"] >= threshold
+        ))
+
+    def get_stalled(self) -> List[Dict]:
+        """停滞账号列表（停滞时间最长的在前）"""
+        now = datetime.now(timezone.utc)
+        result = []
+        for login in self.stalled_logins(now):
+            state = self._state[login]
+            result.append({
+                "login": login,
+                "campaign": state["campaign"],
+                "game": state["game"],
+                **self.get_progress(login, now)
+            })
+        result.sort(key=lambda item: item["stalled_minutes"], reverse=True)
+        return result
+
+    def evict_users(self, active_usernames) -> List[str]:
+        """清理已不在配置中的账号"""
+        stale = [login for login in self._state if login not in active_usernames]
+        for login in stale:
+            del self._state[login]
+        return stale
+
+    async def get_series(self, username: str, hours: float) -> List[Dict]:
+        """账号的进度采样序列（含尚未写入数据库的采样）"""
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(
+                select(ProgressSample)
+                .where(ProgressSample.login == username, ProgressSample.timestamp >= since)
+                .order_by(ProgressSample.timestamp)
+            )).all()
+
+        series = []
+        for row in rows:
+            # SQLite不保存时区，写入时统一为UTC
+            timestamp = row.timestamp if row.timestamp.tzinfo else row.timestamp.replace(tzinfo=timezone.utc)
+            series.append({
+                "timestamp": timestamp.isoformat(),
+                "status": row.status,
+                "campaign": row.campaign,
+                "game": row.game,
+                "current": row.current,
+                "required": row.required
+            })
+        for sample in list(self._pending):
+            if sample["login"] == username and sample["timestamp"] >= since:
+                series.append({
+                    **{key: value for key, value in sample.items() if key != "login"},
+                    "timestamp": sample["timestamp"].isoformat()
+                })
+        return series
+
+    async def _seed(self):
+        """启动时从数据库加载最近的采样，服务重启后速率和停滞判断可以立即恢复"""
+        since = datetime.now(timezone.utc) - self.rate_window
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(
+                select(ProgressSample)
+                .where(ProgressSample.timestamp >= since)
+                .order_by(ProgressSample.timestamp)
+            )).all()
+
+        by_login: Dict[str, List[ProgressSample]] = {}
+        for row in rows:
+            if row.timestamp.tzinfo is None:
+                row.timestamp = row.timestamp.replace(tzinfo=timezone.utc)
+            by_login.setdefault(row.login, []).append(row)
+
+        for login, login_rows in by_login.items():
+            last = login_rows[-1]
+            key = (last.campaign, last.required)
+            drop_rows = [row for row in login_rows if (row.campaign, row.required) == key]
+            state = self._state.get(login)
+            if state is None:
+                state = self._state[login] = self._new_state()
+                state.update(status=last.status, campaign=last.campaign, game=last.game,
+                             current=last.current, required=last.required, key=key,
+                             saved_at=last.timestamp, saved_status=last.status)
+            if state["key"] != key:
+                continue
+            first_at = state["samples"][0][0] if state["samples"] else None
+            older = [(row.timestamp, row.current) for row in drop_rows
+                     if first_at is None or row.timestamp < first_at]
+            state["samples"].extendleft(reversed(older))
+            # 当前进度第一次出现的时间即为进度最后一次变化的时间
+            reached = [row.timestamp for row in drop_rows if row.current == state["current"]]
+            if reached and (state["changed_at"] is None or reached[0] < state["changed_at"]):
+                state["changed_at"] = reached[0]
+
+    async def flush(self):
+        """把待写入的采样批量写入数据库，并定期清理过期数据"""
+        samples = []
+        while self._pending:
+            samples.append(self._pending.popleft())
+        now = datetime.now(timezone.utc)
+        prune = now - self._last_prune > timedelta(hours=1)
+        if not samples and not prune:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add_all([ProgressSample(**sample) for sample in samples])
+                if prune:
+                    cutoff = now - timedelta(days=settings.progress_retention_days)
+                    await db.execute(delete(ProgressSample).where(ProgressSample.timestamp < cutoff))
+                await db.commit()
+        except BaseException:
+            # 写入失败时放回队列，下次重试
+            self._pending.extendleft(reversed(samples))
+            raise
+        if prune:
+            self._last_prune = now
+
+    async def _run(self):
+        try:
+            await self._seed()
+        except Exception as e:
+            print(f"[Progress] 加载历史采样失败: {e}")
+        while True:
+            await asyncio.sleep(settings.progress_flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[Progress] 写入进度采样失败: {e}")
+
+    def start(self):
+        """启动后台写入任务"""
+        if self._task is None:
+            print(f"[Progress] 启动进度采样，降采样周期: {self.sample_interval}秒")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入剩余采样"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"[Progress] 写入进度采样失败: {e}")
+
+
+progress_tracker = ProgressTracker()
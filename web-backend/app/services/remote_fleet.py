@@ -0,0 +1,344 @@
+"""远程节点（中心模式） - 接收各主机节点代理上报的账号状态和配置变化，合并为一个账号列表"""
+import asyncio
+import hmac
+import json
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.config import settings
+
+# 节点上报的账号字段（不含ClientSecret等凭据）
+USER_FIELDS = ("Login", "Id", "Enabled", "FavouriteGames")
+
+
+class NodeOfflineError(Exception):
+    """节点未连接"""
+    pass
+
+
+class RemoteFleet:
+    """
+    远程节点注册表
+
+    每个节点通过一个WebSocket（/ws/agent）连接：先发送完整快照，之后按批发送状态和配置的增量。
+    每条消息带递增序号，中心应用后回复ack，节点收到ack才丢弃缓冲；重连时中心回复该会话最后
+    应用的序号，节点只补发之后的消息，会话变化或缓冲不足时重新发送快照。
+
+    远程账号的状态写入BotStatusMonitor，与本地账号共用监听器（进度、统计、异常检测、通知），
+    账号列表由ConfigService.get_users合并；修改远程账号时以命令形式发送到所属节点执行。
+    """
+
+    def __init__(self):
+        # {node: state}
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        # 合并后的远程账号列表（带Node字段）及账号所属节点，账号变化时重建
+        self._users: Optional[List[Dict]] = None
+        self._owners: Dict[str, str] = {}
+        # 等待结果的命令 {command_id: future}
+        self._pending: Dict[str, asyncio.Future] = {}
+        # 最近的命令记录
+        self._commands: deque = deque(maxlen=100)
+
+    def authenticate(self, node: str, token: str) -> bool:
+        """校验节点令牌（AGENT_TOKENS）"""
+        expected = settings.agent_tokens.get(node)
+        if not expected or not token:
+            return False
+        return hmac.compare_digest(expected.encode("utf-8"), token.encode("utf-8"))
+
+    def has_users(self) -> bool:
+        return any(state["users"] for state in self._nodes.values())
+
+    def _rebuild(self):
+        """重建合并的远程账号列表（多个节点上报同一账号时以先连接的节点为准）"""
+        users, owners = [], {}
+        for node, state in self._nodes.items():
+            for login, user in state["users"].items():
+                if login in owners:
+                    continue
+                owners[login] = node
+                users.append({**user, "Node": node})
+        self._users, self._owners = users, owners
+
+    def get_users(self) -> List[Dict]:
+        """所有远程账号"""
+        if self._users is None:
+            self._rebuild()
+        return self._users
+
+    def node_of(self, login: str) -> Optional[str]:
+        if self._users is None:
+            self._rebuild()
+        return self._owners.get(login)
+
+    def _users_changed(self):
+        from app.services.config_service import config_service
+        from app.services.status_broadcaster import status_broadcaster
+
+        self._users = None
+        config_service.notify_remote_users_changed()
+        status_broadcaster.notify()
+
+    def _state(self, node: str) -> Dict[str, Any]:
+        state = self._nodes.get(node)
+        if state is None:
+            state = self._nodes[node] = {
+                "session": None,
+                "last_seq": None,
+                "websocket": None,
+                "queue": None,
+                "address": None,
+                "connected_at": None,
+                "disconnected_at": None,
+                "last_seen": None,
+                "messages": 0,
+                "snapshots": 0,
+                "users": {},
+                "config": {}
+            }
+        return state
+
+    # ---------- 应用节点消息 ----------
+
+    @staticmethod
+    def _compact(user: Dict) -> Dict:
+        return {field: user.get(field) for field in USER_FIELDS}
+
+    def _apply_status(self, node: str, statuses: Dict[str, Optional[Dict]]):
+        """写入节点账号的状态（与本机账号同名的跳过）"""
+        from app.services.bot_monitor import bot_monitor
+        from app.services.config_service import config_service
+
+        local = {user.get("Login") for user in config_service.get_local_users()}
+        for login, summary in statuses.items():
+            if login in local or self.node_of(login) != node:
+                continue
+            if summary is None:
+                bot_monitor.remove_remote([login])
+            else:
+                bot_monitor.update_remote(login, summary)
+
+    def _apply_snapshot(self, node: str, state: Dict, message: Dict):
+        from app.services.bot_monitor import bot_monitor
+
+        users = {user["Login"]: self._compact(user) for user in message.get("users", []) if user.get("Login")}
+        removed = set(state["users"]) - set(users)
+        state["users"] = users
+        state["config"] = message.get("config") or {}
+        state["snapshots"] += 1
+        bot_monitor.remove_remote(removed)
+        self._users_changed()
+        self._apply_status(node, message.get("status") or {})
+        print(f"[RemoteFleet] 节点 {node} 快照: {len(users)} 个账号（序号 {message.get('seq')}）")
+
+    def _apply_delta(self, node: str, state: Dict, message: Dict):
+        from app.services.bot_monitor import bot_monitor
+
+        users = message.get("users") or {}
+        if users:
+            for login, user in users.items():
+                if user is None:
+                    state["users"].pop(login, None)
+                    bot_monitor.remove_remote([login])
+                else:
+                    state["users"][login] = self._compact(user)
+            self._users_changed()
+        if message.get("config") is not None:
+            state["config"] = message["config"]
+        self._apply_status(node, message.get("status") or {})
+
+    def _handle(self, node: str, state: Dict, message: Dict) -> Optional[Dict]:
+        """处理节点消息，返回需要回复的消息"""
+        kind = message.get("type")
+        if kind in ("snapshot", "delta"):
+            seq = message.get("seq")
+            if not isinstance(seq, int):
+                return {"type": "error", "message": "缺少序号"}
+            if kind == "delta":
+                if state["last_seq"] is not None and seq <= state["last_seq"]:
+                    # 重连后重复发送的消息
+                    return {"type": "ack", "seq": state["last_seq"]}
+                if state["last_seq"] is None or seq != state["last_seq"] + 1:
+                    print(f"[RemoteFleet] 节点 {node} 序号不连续（{state['last_seq']} -> {seq}），请求快照")
+                    return {"type": "resync"}
+                self._apply_delta(node, state, message)
+            else:
+                self._apply_snapshot(node, state, message)
+            state["last_seq"] = seq
+            state["messages"] += 1
+            return {"type": "ack", "seq": seq}
+        if kind == "command_result":
+            self._finish_command(message.get("id"), bool(message.get("ok")), message.get("message"))
+            return None
+        if kind == "ping":
+            return {"type": "pong"}
+        return {"type": "error", "message": f"未知的消息类型: {kind}"}
+
+    # ---------- 连接 ----------
+
+    @staticmethod
+    async def _sender(websocket: WebSocket, queue: asyncio.Queue):
+        while True:
+            message = await queue.get()
+            await websocket.send_text(json.dumps(message, ensure_ascii=False))
+
+    async def serve(self, websocket: WebSocket, node: str):
+        """节点连接的会话（握手、恢复、接收增量），同一节点的新连接替换旧连接"""
+        try:
+            hello = json.loads(await asyncio.wait_for(websocket.receive_text(), timeout=30))
+        except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+            await websocket.close()
+            return
+        if not isinstance(hello, dict) or hello.get("type") != "hello":
+            await websocket.close()
+            return
+
+        state = self._state(node)
+        previous = state["websocket"]
+        if previous is not None:
+            print(f"[RemoteFleet] 节点 {node} 重新连接，关闭旧连接")
+            try:
+                await previous.close()
+            except Exception:
+                pass
+        if state["session"] != hello.get("session"):
+            # 节点进程重启，之前的序号作废
+            state["session"] = hello.get("session")
+            state["last_seq"] = None
+
+        queue: asyncio.Queue = asyncio.Queue()
+        now = datetime.now(timezone.utc).isoformat()
+        state.update(
+            websocket=websocket, queue=queue, connected_at=now, last_seen=now,
+            address=websocket.client.host if websocket.client else None
+        )
+        print(f"[RemoteFleet] 节点 {node} 已连接（{state['address']}），恢复序号: {state['last_seq']}")
+        await websocket.send_text(json.dumps({"type": "welcome", "resume_from": state["last_seq"]}))
+
+        sender = asyncio.create_task(self._sender(websocket, queue))
+        try:
+            while True:
+                text = await websocket.receive_text()
+                state["last_seen"] = datetime.now(timezone.utc).isoformat()
+                try:
+                    message = json.loads(text)
+                except ValueError:
+                    queue.put_nowait({"type": "error", "message": "无效的JSON消息"})
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                reply = self._handle(node, state, message)
+                if reply is not None:
+                    queue.put_nowait(reply)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            if state["websocket"] is websocket:
+                state.update(websocket=None, queue=None, disconnected_at=datetime.now(timezone.utc).isoformat())
+                for record in self._commands:
+                    if record["node"] == node and record["status"] == "sent":
+                        self._finish_command(record["id"], False, "节点连接已断开")
+                print(f"[RemoteFleet] 节点 {node} 已断开")
+
+    # ---------- 命令 ----------
+
+    def send_command(self, node: str, action: str, args: Dict[str, Any]) -> Optional[str]:
+        """
+        向节点发送命令（set_enabled、set_favourite_games、delete_user、restart），返回命令ID；
+        节点未连接时返回None。配置修改的结果随节点上报的配置变化生效。
+        """
+        state = self._nodes.get(node)
+        if state is None or state["queue"] is None:
+            return None
+        command_id = uuid.uuid4().hex[:12]
+        self._pending[command_id] = asyncio.get_running_loop().create_future()
+        self._commands.append({
+            "id": command_id, "node": node, "action": action, "args": args,
+            "sent_at": datetime.now(timezone.utc).isoformat(), "status": "sent", "message": None
+        })
+        state["queue"].put_nowait({"type": "command", "id": command_id, "action": action, "args": args})
+        print(f"[RemoteFleet] 向节点 {node} 发送命令 {action}（{command_id}）")
+        return command_id
+
+    def _finish_command(self, command_id: Optional[str], ok: bool, message: Optional[str]):
+        for record in self._commands:
+            if record["id"] == command_id:
+                record.update(status="done" if ok else "failed", message=message,
+                              finished_at=datetime.now(timezone.utc).isoformat())
+        future = self._pending.pop(command_id, None)
+        if future is not None and not future.done():
+            future.set_result({"ok": ok, "message": message})
+
+    async def call(self, node: str, action: str, args: Dict[str, Any]) -> Dict:
+        """发送命令并等待节点执行结果"""
+        command_id = self.send_command(node, action, args)
+        if command_id is None:
+            raise NodeOfflineError(f"节点 {node} 未连接")
+        future = self._pending.get(command_id)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=settings.agent_command_timeout)
+        except asyncio.TimeoutError:
+            return {"ok": False, "message": f"{settings.agent_command_timeout}秒内未收到节点的执行结果"}
+
+    # ---------- 查询 ----------
+
+    def _node_info(self, node: str, state: Dict) -> Dict:
+        from app.services.bot_monitor import bot_monitor
+
+        statuses: Dict[str, int] = {}
+        for login in state["users"]:
+            summary = bot_monitor.get_cached_summary(login) or {}
+            key = summary.get("status") or "Unknown"
+            statuses[key] = statuses.get(key, 0) + 1
+        return {
+            "node": node,
+            "connected": state["websocket"] is not None,
+            "address": state["address"],
+            "session": state["session"],
+            "last_seq": state["last_seq"],
+            "connected_at": state["connected_at"],
+            "disconnected_at": state["disconnected_at"],
+            "last_seen": state["last_seen"],
+            "messages": state["messages"],
+            "snapshots": state["snapshots"],
+            "account_count": len(state["users"]),
+            "enabled_account_count": sum(1 for user in state["users"].values() if user.get("Enabled", True)),
+            "statuses": statuses
+        }
+
+    def get_nodes(self) -> List[Dict]:
+        """所有节点（包括已断开但尚未移除的节点）"""
+        return [self._node_info(node, state) for node, state in sorted(self._nodes.items())]
+
+    def get_node(self, node: str) -> Optional[Dict]:
+        """节点详情：账号、全局配置和最近的命令"""
+        state = self._nodes.get(node)
+        if state is None:
+            return None
+        return {
+            **self._node_info(node, state),
+            "config": state["config"],
+            "accounts": sorted(state["users"]),
+            "commands": [record for record in reversed(self._commands) if record["node"] == node]
+        }
+
+    def forget(self, node: str) -> bool:
+        """移除已断开的节点及其账号"""
+        from app.services.bot_monitor import bot_monitor
+
+        state = self._nodes.get(node)
+        if state is None or state["websocket"] is not None:
+            return False
+        bot_monitor.remove_remote(state["users"])
+        del self._nodes[node]
+        self._users_changed()
+        print(f"[RemoteFleet] 已移除节点 {node}（{len(state['users'])} 个账号）")
+        return True
+
+
+remote_fleet = RemoteFleet()
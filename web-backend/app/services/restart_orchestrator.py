@@ -0,0 +1,301 @@
+"""重启编排 - 重启drop容器后确认每个账号恢复写日志，并记录停机时长"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+
+class RestartInProgressError(Exception):
+    """已有重启正在进行"""
+    pass
+
+
+class RestartOrchestrator:
+    """
+    健康检查式重启
+
+    1. 记录每个启用账号重启前的状态（BotStatusMonitor）和日志文件位置
+    2. 通过Docker API重启drop容器
+    3. 轮询每个账号的日志文件，出现新日志行即视为恢复，记录停机时长
+    4. 超时仍未恢复的账号标记告警
+
+    分片模式下可以只重启一个分片（只检查该分片的账号），或逐个分片滚动重启。
+    """
+
+    def __init__(self):
+        self.timeout = settings.restart_health_timeout
+        self.poll_interval = settings.restart_health_poll_interval
+        self._reports: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._running: Optional[str] = None
+        # 进行中的滚动重启（逐个分片重启）
+        self._rolling: Optional[asyncio.Task] = None
+        # 重启结束（完成或失败）时的监听器 callback(report)
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    def add_listener(self, callback: Callable[[Dict], None]):
+        """注册重启结束监听器（参数为报告摘要）"""
+        self._listeners.append(callback)
+
+    def _notify(self, report: Dict):
+        summary = self._summarize(report)
+        for callback in self._listeners:
+            try:
+                callback(summary)
+            except Exception as e:
+                print(f"[Restart] 重启监听器异常: {e}")
+
+    @property
+    def running(self) -> bool:
+        return self._running is not None or self._rolling is not None
+
+    def _log_position(self, login: str) -> Optional[Tuple[int, int]]:
+        """日志文件的 (inode, 大小)，文件不存在时返回None"""
+        from app.services.bot_monitor import bot_monitor
+
+        try:
+            stat = os.stat(bot_monitor.log_path(login))
+            return stat.st_ino, stat.st_size
+        except OSError:
+            return None
+
+    def _has_fresh_lines(self, login: str, baseline: Optional[Tuple[int, int]]) -> bool:
+        """重启后是否写入了新的日志行（文件变大、被重建或新出现）"""
+        current = self._log_position(login)
+        if current is None:
+            return False
+        if baseline is None:
+            return current[1] > 0
+        return current[0] != baseline[0] or current[1] > baseline[1]
+
+    def _snapshot(self, shard: Optional[int] = None) -> Dict[str, Dict]:
+        """记录每个启用账号（指定分片时只包括该分片的账号）重启前的状态"""
+        from app.services.config_service import config_service
+        from app.services.bot_monitor import bot_monitor
+
+        accounts = {}
+        for user in config_service.get_local_users():
+            login = user.get("Login")
+            if not login or not user.get("Enabled", True):
+                continue
+            if shard is not None and config_service.get_user_shard(login) != shard:
+                continue
+            status = bot_monitor.summarize(bot_monitor.get_user_status(login))
+            accounts[login] = {
+                "pre_status": status.get("status"),
+                "pre_last_update": status.get("last_update"),
+                "pre_progress": status.get("progress"),
+                "resumed": None,
+                "resumed_at": None,
+                "downtime_seconds": None,
+                "post_status": None
+            }
+        return accounts
+
+    async def start(self, reason: str = "manual", window: Optional[Dict] = None,
+                    shard: Optional[int] = None) -> Tuple[Dict, Dict]:
+        """
+        记录状态并重启容器，之后在后台等待各账号恢复
+        window: 智能重启窗口的决策记录（附在报告中）
+        shard: 分片模式下只重启该分片的容器，为空时重启所有drop容器
+        返回 (容器重启结果, 重启报告)
+        """
+        from app.services.docker_service import docker_service
+
+        if self._lock.locked() or self._running is not None:
+            raise RestartInProgressError("已有重启正在进行")
+        if self._rolling is not None and asyncio.current_task() is not self._rolling:
+            raise RestartInProgressError("正在进行滚动重启")
+
+        async with self._lock:
+            report = {
+                "id": uuid.uuid4().hex[:12],
+                "reason": reason,
+                "status": "restarting",
+                "started_at": datetime.now().isoformat(),
+                "restarted_at": None,
+                "finished_at": None,
+                "timeout": self.timeout,
+                "shard": shard,
+                "accounts": self._snapshot(shard),
+                "alert": False,
+                "alert_accounts": [],
+                "window": window
+            }
+            self._reports[report["id"]] = report
+            while len(self._reports) > settings.restart_report_history:
+                self._reports.popitem(last=False)
+
+            target = f"分片 {shard}" if shard is not None else "drop容器"
+            print(f"[Restart] 开始重启{target}（{reason}），{len(report['accounts'])} 个启用账号，报告: {report['id']}")
+            stopped_at = time.monotonic()
+            try:
+                result = await docker_service.restart_drop_container(shard)
+            except Exception as e:
+                report["status"] = "failed"
+                report["finished_at"] = datetime.now().isoformat()
+                report["alert"] = True
+                report["restart_result"] = {"status": "error", "message": str(e)}
+                self._notify(report)
+                raise
+            report["restart_result"] = result
+
+            if result.get("status") != "success":
+                report["status"] = "failed"
+                report["finished_at"] = datetime.now().isoformat()
+                report["alert"] = True
+                print(f"[Restart] 🚨 容器重启失败: {result.get('message')}")
+                self._notify(report)
+                return result, report
+
+            report["status"] = "waiting"
+            report["restarted_at"] = datetime.now().isoformat()
+            # 容器已重启：此时的日志位置之后的内容都是重启后写入的
+            baselines = {login: self._log_position(login) for login in report["accounts"]}
+
+        self._running = report["id"]
+        task = asyncio.create_task(self._wait_for_recovery(report, baselines, stopped_at))
+        report["_task"] = task
+        return result, report
+
+    async def _wait_for_recovery(self, report: Dict, baselines: Dict, stopped_at: float):
+        """轮询日志文件直到所有账号恢复或超时"""
+        from app.services.bot_monitor import bot_monitor
+
+        accounts = report["accounts"]
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                pending = [login for login, info in accounts.items() if not info["resumed"]]
+                for login in pending:
+                    if self._has_fresh_lines(login, baselines[login]):
+                        info = accounts[login]
+                        info["resumed"] = True
+                        info["resumed_at"] = datetime.now().isoformat()
+                        info["downtime_seconds"] = round(time.monotonic() - stopped_at, 1)
+                        print(f"[Restart] {login} 已恢复，停机 {info['downtime_seconds']}秒")
+                if all(info["resumed"] for info in accounts.values()) or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(self.poll_interval)
+
+            for login, info in accounts.items():
+                if not info["resumed"]:
+                    info["resumed"] = False
+                info["post_status"] = bot_monitor.summarize(bot_monitor.get_user_status(login)).get("status")
+
+            report["alert_accounts"] = sorted(login for login, info in accounts.items() if not info["resumed"])
+            report["alert"] = bool(report["alert_accounts"])
+            report["status"] = "completed"
+            if report["alert"]:
+                print(f"[Restart] 🚨 {len(report['alert_accounts'])} 个账号在{self.timeout}秒内未恢复: "
+                      f"{', '.join(report['alert_accounts'])}")
+            else:
+                downtimes = [info["downtime_seconds"] for info in accounts.values()]
+                if downtimes:
+                    print(f"[Restart] ✅ 所有账号已恢复，最长停机 {max(downtimes)}秒")
+        except asyncio.CancelledError:
+            report["status"] = "cancelled"
+            raise
+        finally:
+            report["finished_at"] = datetime.now().isoformat()
+            report.pop("_task", None)
+            self._running = None
+            if report["status"] == "completed":
+                self._notify(report)
+
+    async def restart_and_wait(self, reason: str, window: Optional[Dict] = None,
+                               shard: Optional[int] = None) -> Dict:
+        """重启并等待恢复检查完成，返回报告（定时任务使用）"""
+        _, report = await self.start(reason, window, shard)
+        task = report.get("_task")
+        if task is not None:
+            await asyncio.shield(task)
+        return self.get_report(report["id"])
+
+    async def smart_restart_and_wait(self, reason: str, window_seconds: float) -> Dict:
+        """在窗口内等待观看损失最小的时刻再重启（最迟到窗口截止时间）"""
+        from app.services.restart_window import restart_window_planner
+
+        if self.running:
+            raise RestartInProgressError("已有重启正在进行")
+        decision = await restart_window_planner.wait_for_best_moment(window_seconds)
+        return await self.restart_and_wait(reason, decision)
+
+    async def rolling_restart_and_wait(self, reason: str, shards: Optional[List[int]] = None,
+                                       window_seconds: float = 0) -> List[Dict]:
+        """
+        滚动重启：逐个重启分片，上一个分片的账号恢复（或超时）后再重启下一个，
+        任一时刻只有一个分片的账号停机。某个分片的容器重启失败时停止。
+        window_seconds大于0时先在窗口内等待观看损失最小的时刻。
+        返回每个分片的重启报告
+        """
+        from app.services.restart_window import restart_window_planner
+
+        if self._running is not None or self._rolling not in (None, asyncio.current_task()):
+            raise RestartInProgressError("已有重启正在进行")
+        self._rolling = asyncio.current_task()
+        try:
+            decision = None
+            if window_seconds > 0:
+                decision = await restart_window_planner.wait_for_best_moment(window_seconds)
+            reports = []
+            for shard in (shards if shards is not None else range(settings.shard_count)):
+                print(f"[Restart] 滚动重启: 分片 {shard}")
+                report = await self.restart_and_wait(reason, decision, shard)
+                reports.append(report)
+                if report is None or report.get("status") == "failed":
+                    print(f"[Restart] 🚨 分片 {shard} 重启失败，停止滚动重启")
+                    break
+            return reports
+        finally:
+            self._rolling = None
+
+    def start_rolling(self, reason: str, shards: Optional[List[int]] = None) -> asyncio.Task:
+        """在后台开始滚动重启（各分片的报告见重启报告列表）"""
+        if self.running:
+            raise RestartInProgressError("已有重启正在进行")
+        task = asyncio.create_task(self.rolling_restart_and_wait(reason, shards))
+        # 任务开始执行前也视为进行中
+        self._rolling = task
+        return task
+
+    @staticmethod
+    def _summarize(report: Dict) -> Dict:
+        accounts = report["accounts"].values()
+        downtimes = [info["downtime_seconds"] for info in accounts if info["downtime_seconds"] is not None]
+        return {
+            **{key: value for key, value in report.items() if not key.startswith("_")},
+            "account_count": len(report["accounts"]),
+            "resumed_count": sum(1 for info in accounts if info["resumed"]),
+            "max_downtime_seconds": max(downtimes) if downtimes else None,
+            "avg_downtime_seconds": round(sum(downtimes) / len(downtimes), 1) if downtimes else None
+        }
+
+    def get_report(self, report_id: str) -> Optional[Dict]:
+        report = self._reports.get(report_id)
+        return self._summarize(report) if report else None
+
+    def list_reports(self) -> list:
+        """最近的重启报告（不含每个账号的明细）"""
+        return [
+            {key: value for key, value in self._summarize(report).items() if key != "accounts"}
+            for report in reversed(self._reports.values())
+        ]
+
+    async def shutdown(self):
+        """取消进行中的滚动重启和恢复检查"""
+        tasks = [report["_task"] for report in self._reports.values() if report.get("_task")]
+        if self._rolling is not None:
+            tasks.append(self._rolling)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+restart_orchestrator = RestartOrchestrator()
@@ -0,0 +1,164 @@
+"""智能重启窗口 - 根据各账号的观看进度，在窗口内选择损失观看分钟数最少的重启时间"""
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+
+class RestartWindowPlanner:
+    """
+    重启时间选择
+
+    重启会中断正在进行的掉宝，按当前掉宝已累积的分钟数估算损失：
+    账号在观看时进度每分钟增加1，掉宝完成后从0开始累积下一个掉宝。
+    在 [现在, 截止时间] 内按固定步长枚举候选时间，选择全体账号损失之和最小的时刻
+    （相同时取最早），到截止时间仍未等到则强制重启。
+    """
+
+    def __init__(self):
+        self.step = settings.restart_window_step
+        self.poll_interval = settings.restart_window_poll_interval
+        self.stale_minutes = settings.restart_window_stale_minutes
+        self.decisions: deque = deque(maxlen=settings.restart_report_history)
+
+    def _watching_accounts(self, now: datetime) -> Dict[str, Dict]:
+        """正在观看且日志仍在更新的启用账号的进度 {login: {current, required, observed_at}}"""
+        from app.services.config_service import config_service
+        from app.services.bot_monitor import bot_monitor
+
+        accounts = {}
+        for user in config_service.get_local_users():
+            login = user.get("Login")
+            if not login or not user.get("Enabled", True):
+                continue
+            # 状态摘要由广播周期读取日志时维护，只有尚未读取过的账号才读取日志文件
+            summary = bot_monitor.get_cached_summary(login)
+            if summary is None:
+                summary = bot_monitor.summarize(bot_monitor.get_user_status(login))
+            progress = summary.get("progress")
+            if summary.get("status") != "Watching" or not progress or not summary.get("last_update"):
+                continue
+            try:
+                observed_at = datetime.fromisoformat(summary["last_update"])
+            except ValueError:
+                continue
+            if observed_at.tzinfo is None:
+                observed_at = observed_at.astimezone()
+            if (now - observed_at).total_seconds() > self.stale_minutes * 60:
+                continue
+            accounts[login] = {
+                "current": progress["current"],
+                "required": progress["required"],
+                "observed_at": observed_at
+            }
+        return accounts
+
+    @staticmethod
+    def account_cost(info: Dict, at: datetime) -> float:
+        """在at时刻重启时该账号损失的观看分钟数"""
+        elapsed = max((at - info["observed_at"]).total_seconds() / 60, 0)
+        remaining = max(info["required"] - info["current"], 0)
+        if elapsed < remaining:
+            return info["current"] + elapsed
+        # 当前掉宝已完成，损失的是下一个掉宝已累积的分钟数
+        return elapsed - remaining
+
+    def estimate(self, accounts: Dict[str, Dict], at: datetime) -> Tuple[float, Dict[str, float]]:
+        per_account = {login: self.account_cost(info, at) for login, info in accounts.items()}
+        return sum(per_account.values()), per_account
+
+    def plan(self, deadline: datetime, now: Optional[datetime] = None) -> Dict:
+        """评估从现在到截止时间的候选重启时间"""
+        now = now or datetime.now(timezone.utc)
+        accounts = self._watching_accounts(now)
+        candidates: List[Tuple[datetime, float]] = []
+        at = now
+        while at < deadline:
+            candidates.append((at, self.estimate(accounts, at)[0]))
+            at += timedelta(seconds=self.step)
+        candidates.append((max(deadline, now), self.estimate(accounts, max(deadline, now))[0]))
+
+        best_at, best_cost = min(candidates, key=lambda c: c[1])
+        _, per_account = self.estimate(accounts, best_at)
+        return {
+            "now": now,
+            "deadline": deadline,
+            "watching_accounts": len(accounts),
+            "now_cost": candidates[0][1],
+            "best_at": best_at,
+            "best_cost": best_cost,
+            "per_account": per_account,
+            "candidates": candidates
+        }
+
+    @staticmethod
+    def _top_accounts(per_account: Dict[str, float], limit: int = 10) -> List[Dict]:
+        ranked = sorted(per_account.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"login": login, "lost_minutes": round(cost, 1)} for login, cost in ranked]
+
+    def preview(self, minutes: float) -> Dict:
+        """预览：如果现在开始一个minutes分钟的窗口，会选择哪个时间"""
+        plan = self.plan(datetime.now(timezone.utc) + timedelta(minutes=minutes))
+        return {
+            "deadline": plan["deadline"].isoformat(),
+            "watching_accounts": plan["watching_accounts"],
+            "restart_now_cost_minutes": round(plan["now_cost"], 1),
+            "best_at": plan["best_at"].isoformat(),
+            "best_cost_minutes": round(plan["best_cost"], 1),
+            "accounts_at_best": self._top_accounts(plan["per_account"]),
+            "curve": [{"at": at.isoformat(), "cost_minutes": round(cost, 1)} for at, cost in plan["candidates"]],
+            "recent_decisions": list(reversed(self.decisions))
+        }
+
+    async def wait_for_best_moment(self, window_seconds: float) -> Dict:
+        """
+        在窗口内等待损失最小的时刻，返回决策记录
+        每隔poll_interval重新评估（账号可能切换掉宝或停止观看），到截止时间必定返回
+        """
+        started = datetime.now(timezone.utc)
+        deadline = started + timedelta(seconds=window_seconds)
+        plan = self.plan(deadline, started)
+        # 窗口开始时立即重启（原来的固定时间重启）的预计损失
+        blind_cost = plan["now_cost"]
+        evaluations = 1
+        print(f"[Restart] 智能重启窗口开始，截止 {deadline.astimezone():%H:%M:%S}，"
+              f"{plan['watching_accounts']} 个账号在观看，立即重启预计损失 {blind_cost:.0f} 分钟")
+
+        while True:
+            now = datetime.now(timezone.utc)
+            if now >= deadline:
+                forced = True
+                break
+            if plan["best_at"] <= now + timedelta(seconds=self.step / 2):
+                forced = False
+                break
+            wait = min(self.poll_interval, (plan["best_at"] - now).total_seconds(),
+                       (deadline - now).total_seconds())
+            await asyncio.sleep(max(wait, 0))
+            plan = self.plan(deadline)
+            evaluations += 1
+
+        now = datetime.now(timezone.utc)
+        cost, per_account = self.estimate(self._watching_accounts(now), now)
+        decision = {
+            "window_start": started.isoformat(),
+            "deadline": deadline.isoformat(),
+            "restart_at": now.isoformat(),
+            "waited_seconds": round((now - started).total_seconds(), 1),
+            "reason": "deadline" if forced else "best",
+            "evaluations": evaluations,
+            "blind_cost_minutes": round(blind_cost, 1),
+            "estimated_cost_minutes": round(cost, 1),
+            "avoided_minutes": round(blind_cost - cost, 1) or 0.0,
+            "accounts": self._top_accounts(per_account)
+        }
+        self.decisions.append(decision)
+        print(f"[Restart] 智能重启窗口决策：{'到达截止时间' if forced else '选择损失最小时刻'}，"
+              f"等待 {decision['waited_seconds']:.0f}秒，预计损失 {cost:.0f} 分钟"
+              f"（窗口开始时重启预计 {blind_cost:.0f} 分钟，避免 {decision['avoided_minutes']} 分钟）")
+        return decision
+
+
+restart_window_planner = RestartWindowPlanner()
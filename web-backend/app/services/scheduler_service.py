@@ -1,92 +1,472 @@
-"""定时任务服务 - 管理Bot容器的定时重启"""
+"""定时任务服务 - 基于cron表达式的持久化任务调度（重启、日志归档、会话清理等）"""
 import asyncio
+import gzip
+import json
+import os
+import random
+import socket
+import time
+import traceback
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.scheduled_job import ScheduledJob
+from app.utils.cron import CronExpression
+
+# 错过触发时间（超过宽限期）时的处理方式
+CATCH_UP_SKIP = "skip"          # 跳过本次，直接安排下一次
+CATCH_UP_RUN_ONCE = "run_once"  # 补执行一次（无论错过了多少次）
+CATCH_UP_POLICIES = (CATCH_UP_SKIP, CATCH_UP_RUN_ONCE)
+
+TaskFunc = Callable[[Dict], Awaitable[Optional[str]]]
+
+
+class JobLockedError(Exception):
+    """任务正在执行（本进程或其他worker）"""
+    pass
 
 
 class SchedulerService:
-    """定时任务服务"""
+    """
+    定时任务服务
+
+    任务保存在scheduled_jobs表中，每个任务指定一个注册的任务类型和cron表达式。
+    多个uvicorn worker共享同一个数据库：触发前用一条条件UPDATE同时抢占锁并推进
+    next_run_at，只有一个worker能成功，因此同一次触发不会重复执行；执行期间定期续期锁，
+    进程崩溃后锁过期即可被其他worker接管。
+    """
 
     def __init__(self):
-        # 每天凌晨4点重启（可配置）
-        self.restart_hour = 4
-        self.restart_minute = 0
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: Dict[str, Dict] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running: Dict[int, asyncio.Task] = {}
+        self._seeded = False
         self._next_restart_time: Optional[datetime] = None
-        self._restart_task: Optional[asyncio.Task] = None
-        print(f"[Scheduler] 初始化定时任务服务，重启时间：每天 {self.restart_hour:02d}:{self.restart_minute:02d}")
 
-    def calculate_next_restart_time(self) -> datetime:
-        """计算下一次重启时间"""
-        now = datetime.now()
-        # 今天的重启时间
-        today_restart = now.replace(
-            hour=self.restart_hour,
-            minute=self.restart_minute,
-            second=0,
-            microsecond=0
-        )
+        self.register_task("restart_drop", self._task_restart_drop,
+                           "重启drop容器并等待各账号恢复（window_minutes>0时在窗口内选择观看损失最小的时刻；"
+                           "分片模式下逐个分片滚动重启，rolling=false时同时重启所有分片）",
+                           {"reason": "scheduled", "window_minutes": settings.restart_window_minutes})
+        self.register_task("archive_logs", self._task_archive_logs, "归档过大的账号日志并清理过期归档",
+                           {"max_bytes": settings.log_archive_max_bytes,
+                            "keep_bytes": settings.log_archive_keep_bytes,
+                            "retention_days": settings.log_archive_retention_days})
+        self.register_task("session_gc", self._task_session_gc, "删除过期的登录会话")
+        print(f"[Scheduler] 初始化定时任务服务（worker: {self.worker_id}）")
 
-        if now < today_restart:
-            # 如果还没到今天的重启时间，就是今天
-            next_restart = today_restart
-        else:
-            # 否则是明天
-            next_restart = today_restart + timedelta(days=1)
+    # ---------- 任务类型注册 ----------
+
+    def register_task(self, name: str, func: TaskFunc, description: str, default_args: Optional[Dict] = None):
+        """注册任务类型：func(args) 返回结果说明，抛出异常表示失败"""
+        self._tasks[name] = {"func": func, "description": description, "default_args": default_args or {}}
+
+    def list_tasks(self) -> List[Dict]:
+        return [
+            {"name": name, "description": entry["description"], "default_args": entry["default_args"]}
+            for name, entry in self._tasks.items()
+        ]
+
+    def validate_job(self, task: str, cron: str, catch_up: str, jitter_seconds: int):
+        """校验任务字段，无效时抛出ValueError（CronError是其子类）"""
+        if task not in self._tasks:
+            raise ValueError(f"未知的任务类型: {task}")
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"catch_up 必须是 {', '.join(CATCH_UP_POLICIES)} 之一")
+        if jitter_seconds < 0:
+            raise ValueError("jitter_seconds 不能为负数")
+        CronExpression(cron)
 
-        self._next_restart_time = next_restart
-        print(f"[Scheduler] 下一次重启时间: {next_restart.strftime('%Y-%m-%d %H:%M:%S')}")
-        return next_restart
+    @staticmethod
+    def compute_next_run(cron: str, jitter_seconds: int, after: datetime) -> datetime:
+        """after之后的下一次触发时间，加上0~jitter_seconds秒的随机延迟"""
+        next_run = CronExpression(cron).next_after(after)
+        if jitter_seconds:
+            next_run += timedelta(seconds=random.randint(0, jitter_seconds))
+        return next_run
+
+    def serialize_job(self, job: ScheduledJob) -> Dict:
+        return {
+            "id": job.id,
+            "name": job.name,
+            "task": job.task,
+            "cron": job.cron,
+            "enabled": job.enabled,
+            "jitter_seconds": job.jitter_seconds,
+            "catch_up": job.catch_up,
+            "args": json.loads(job.args) if job.args else {},
+            "next_run_at": job.next_run_at.isoformat() if job.next_run_at else None,
+            "last_run_at": job.last_run_at.isoformat() if job.last_run_at else None,
+            "last_status": job.last_status,
+            "last_result": job.last_result,
+            "last_error": job.last_error,
+            "last_duration": job.last_duration,
+            "locked_by": job.locked_by,
+            "locked_until": job.locked_until.isoformat() if job.locked_until else None,
+            "running_here": job.id in self._running
+        }
+
+    def _default_jobs(self) -> List[Dict]:
+        return [
+            {"name": "drop-restart", "task": "restart_drop", "cron": settings.scheduler_restart_cron,
+             "jitter_seconds": 0, "catch_up": CATCH_UP_SKIP},
+            {"name": "log-archive", "task": "archive_logs", "cron": "30 3 * * *",
+             "jitter_seconds": 300, "catch_up": CATCH_UP_RUN_ONCE},
+            {"name": "session-gc", "task": "session_gc", "cron": "15 * * * *",
+             "jitter_seconds": 60, "catch_up": CATCH_UP_RUN_ONCE},
+        ]
+
+    async def ensure_default_jobs(self):
+        """首次启动时创建默认任务（已存在同名任务则跳过，多个worker同时创建时由唯一约束去重）"""
+        now = datetime.now()
+        for spec in self._default_jobs():
+            async with AsyncSessionLocal() as db:
+                exists = await db.scalar(select(ScheduledJob.id).where(ScheduledJob.name == spec["name"]))
+                if exists is not None:
+                    continue
+                db.add(ScheduledJob(
+                    **spec,
+                    enabled=True,
+                    next_run_at=self.compute_next_run(spec["cron"], spec["jitter_seconds"], now)
+                ))
+                try:
+                    await db.commit()
+                    print(f"[Scheduler] 创建默认任务 {spec['name']}（{spec['cron']}）")
+                except IntegrityError:
+                    await db.rollback()
+        self._seeded = True
+
+    # ---------- 调度循环 ----------
 
     def get_next_restart_time(self) -> Optional[datetime]:
-        """获取下一次重启时间"""
-        if self._next_restart_time is None:
-            return self.calculate_next_restart_time()
+        """获取下一次定时重启时间（最近一次调度时缓存）"""
         return self._next_restart_time
 
-    async def _wait_and_restart(self):
-        """等待并执行重启"""
-        while True:
-            try:
-                next_restart = self.calculate_next_restart_time()
-                now = datetime.now()
-                wait_seconds = (next_restart - now).total_seconds()
+    def _update_restart_cache(self, jobs: List[ScheduledJob]):
+        times = [job.next_run_at for job in jobs
+                 if job.enabled and job.task == "restart_drop" and job.next_run_at]
+        self._next_restart_time = min(times) if times else None
+
+    async def _tick(self) -> float:
+        """检查到期任务并触发，返回距离下一个任务到期的秒数"""
+        now = datetime.now()
+        async with AsyncSessionLocal() as db:
+            jobs = list((await db.scalars(select(ScheduledJob).where(ScheduledJob.enabled.is_(True)))).all())
+
+        wait = settings.scheduler_tick_interval
+        for job in jobs:
+            if job.id in self._running:
+                continue
+            if job.next_run_at is None:
+                # 刚启用或刚修改的任务：安排下一次触发
+                await self._advance(job, None, now)
+            elif job.next_run_at <= now:
+                await self._fire(job, now)
+            if job.next_run_at and job.next_run_at > now:
+                wait = min(wait, (job.next_run_at - now).total_seconds())
+
+        self._update_restart_cache(jobs)
+        return wait
+
+    async def _advance(self, job: ScheduledJob, expected: Optional[datetime], now: datetime,
+                       lock: bool = False, **values) -> bool:
+        """
+        条件更新：只有next_run_at仍为expected（且lock=True时锁空闲）才推进到下一次触发时间，
+        同时写入values；返回是否更新成功（失败说明其他worker已处理）
+        """
+        new_next = self.compute_next_run(job.cron, job.jitter_seconds, now)
+        conditions = [
+            ScheduledJob.id == job.id,
+            ScheduledJob.next_run_at.is_(None) if expected is None else ScheduledJob.next_run_at == expected
+        ]
+        if lock:
+            conditions.append(or_(ScheduledJob.locked_until.is_(None), ScheduledJob.locked_until < now))
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(ScheduledJob).where(*conditions).values(next_run_at=new_next, **values)
+            )
+            await db.commit()
+        if result.rowcount != 1:
+            job.next_run_at = None
+            return False
+        job.next_run_at = new_next
+        return True
+
+    async def _fire(self, job: ScheduledJob, now: datetime):
+        """触发到期任务，按catch_up策略处理错过的触发"""
+        scheduled_at = job.next_run_at
+        overdue = (now - scheduled_at).total_seconds()
+        if overdue > settings.scheduler_catch_up_grace and job.catch_up == CATCH_UP_SKIP:
+            if await self._advance(job, scheduled_at, now, lock=True,
+                                   last_status="skipped",
+                                   last_error=f"错过触发时间 {scheduled_at.isoformat()}（延迟{overdue:.0f}秒），已跳过"):
+                print(f"[Scheduler] ⏭️ {job.name} 错过触发时间 {scheduled_at:%Y-%m-%d %H:%M:%S}，"
+                      f"跳过，下次: {job.next_run_at:%Y-%m-%d %H:%M:%S}")
+            return
 
-                print(f"[Scheduler] 距离下次重启还有 {wait_seconds:.0f} 秒")
+        # 抢占锁并推进下次触发时间（同一条UPDATE，多个worker中只有一个成功）
+        if await self._advance(job, scheduled_at, now, lock=True, locked_by=self.worker_id,
+                               locked_until=now + timedelta(seconds=settings.scheduler_lock_ttl)):
+            if overdue > settings.scheduler_catch_up_grace:
+                print(f"[Scheduler] {job.name} 错过触发时间 {scheduled_at:%Y-%m-%d %H:%M:%S}，补执行一次")
+            self._start_run(job, "schedule")
 
-                # 等待到重启时间
-                await asyncio.sleep(wait_seconds)
+    def _start_run(self, job: ScheduledJob, trigger: str):
+        entry = self._tasks.get(job.task)
+        args = dict(entry["default_args"]) if entry else {}
+        if job.args:
+            args.update(json.loads(job.args))
+        print(f"[Scheduler] ⏰ 执行任务 {job.name}（{job.task}，{trigger}）")
+        self._running[job.id] = asyncio.create_task(self._execute(job.id, job.name, job.task, args))
 
-                # 执行重启
-                print(f"[Scheduler] ⏰ 定时重启时间到，开始重启Bot容器...")
-                from app.services.docker_service import docker_service
-                result = await docker_service.restart_drop_container()
+    async def _execute(self, job_id: int, name: str, task_name: str, args: Dict):
+        """执行任务并记录结果，期间续期锁"""
+        started_at = datetime.now()
+        started = time.monotonic()
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        status_text, result, error = "success", None, None
+        try:
+            entry = self._tasks.get(task_name)
+            if entry is None:
+                raise RuntimeError(f"未注册的任务类型: {task_name}")
+            result = await entry["func"](args)
+            print(f"[Scheduler] ✅ 任务 {name} 完成: {result}")
+        except asyncio.CancelledError:
+            status_text, error = "cancelled", "服务关闭，任务被取消"
+            raise
+        except Exception as e:
+            status_text, error = "failed", str(e)
+            print(f"[Scheduler] ❌ 任务 {name} 失败: {e}")
+            traceback.print_exc()
+        finally:
+            heartbeat.cancel()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ScheduledJob)
+                        .where(ScheduledJob.id == job_id, ScheduledJob.locked_by == self.worker_id)
+                        .values(last_run_at=started_at, last_status=status_text, last_result=result,
+                                last_error=error, last_duration=round(time.monotonic() - started, 3),
+                                locked_by=None, locked_until=None)
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"[Scheduler] ❌ 记录任务 {name} 结果失败: {e}")
+            self._running.pop(job_id, None)
+            self.wake()
 
-                if result.get("status") == "success":
-                    print(f"[Scheduler] ✅ 定时重启成功")
-                else:
-                    print(f"[Scheduler] ❌ 定时重启失败: {result.get('message')}")
+    async def _heartbeat(self, job_id: int):
+        """执行期间定期续期锁，防止长任务被其他worker重复执行"""
+        ttl = settings.scheduler_lock_ttl
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ScheduledJob)
+                        .where(ScheduledJob.id == job_id, ScheduledJob.locked_by == self.worker_id)
+                        .values(locked_until=datetime.now() + timedelta(seconds=ttl))
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"[Scheduler] 续期任务锁失败: {e}")
+
+    async def run_now(self, job_id: int) -> Optional[ScheduledJob]:
+        """立即执行一次（不影响下次触发时间），任务正在执行时抛出JobLockedError"""
+        now = datetime.now()
+        async with AsyncSessionLocal() as db:
+            job = await db.get(ScheduledJob, job_id)
+            if job is None:
+                return None
+            result = await db.execute(
+                update(ScheduledJob)
+                .where(ScheduledJob.id == job_id,
+                       or_(ScheduledJob.locked_until.is_(None), ScheduledJob.locked_until < now))
+                .values(locked_by=self.worker_id,
+                        locked_until=now + timedelta(seconds=settings.scheduler_lock_ttl))
+            )
+            await db.commit()
+        if result.rowcount != 1 or job_id in self._running:
+            raise JobLockedError(f"任务 {job.name} 正在执行")
+        self._start_run(job, "manual")
+        return job
 
+    def wake(self):
+        """任务变更后立即重新调度"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _scheduler_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if not self._seeded:
+                    await self.ensure_default_jobs()
+                wait = await self._tick()
             except Exception as e:
-                print(f"[Scheduler] ❌ 定时重启异常: {str(e)}")
-                import traceback
+                print(f"[Scheduler] ❌ 调度异常: {e}")
                 traceback.print_exc()
-                # 发生错误后等待1小时再试
-                await asyncio.sleep(3600)
+                wait = settings.scheduler_tick_interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0))
+            except asyncio.TimeoutError:
+                pass
 
     def start(self):
-        """启动定时任务"""
-        if self._restart_task is None:
-            print("[Scheduler] 启动定时重启任务...")
-            self._restart_task = asyncio.create_task(self._wait_and_restart())
+        """启动调度循环"""
+        if self._loop_task is None:
+            print("[Scheduler] 启动定时任务调度...")
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._scheduler_loop())
         else:
             print("[Scheduler] 定时任务已在运行中")
 
-    def stop(self):
-        """停止定时任务"""
-        if self._restart_task:
-            print("[Scheduler] 停止定时重启任务...")
-            self._restart_task.cancel()
-            self._restart_task = None
+    async def stop(self):
+        """停止调度循环并取消本进程正在执行的任务"""
+        if self._loop_task:
+            print("[Scheduler] 停止定时任务调度...")
+            self._loop_task.cancel()
+            self._loop_task = None
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ---------- 内置任务 ----------
+
+    async def _task_restart_drop(self, args: Dict) -> str:
+        from app.services.config_service import config_service
+        from app.services.restart_orchestrator import restart_orchestrator
+
+        reason = args.get("reason", "scheduled")
+        window_minutes = float(args.get("window_minutes") or 0)
+        if config_service.sharded and args.get("rolling", True):
+            return await self._rolling_restart(reason, window_minutes)
+        if window_minutes > 0:
+            report = await restart_orchestrator.smart_restart_and_wait(reason, window_minutes * 60)
+        else:
+            report = await restart_orchestrator.restart_and_wait(reason)
+        if report is None or report.get("status") == "failed":
+            message = (report or {}).get("restart_result", {}).get("message")
+            raise RuntimeError(f"重启失败: {message}")
+        window = report.get("window")
+        window_note = f"，智能窗口避免约 {window['avoided_minutes']} 观看分钟" if window else ""
+        if report.get("alert"):
+            return (f"重启完成，但有账号未恢复: {', '.join(report['alert_accounts'])}"
+                    f"{window_note}（报告 {report['id']}）")
+        return f"重启成功，最长停机 {report.get('max_downtime_seconds')}秒{window_note}（报告 {report['id']}）"
+
+    async def _rolling_restart(self, reason: str, window_minutes: float) -> str:
+        """分片模式：逐个分片重启"""
+        from app.services.restart_orchestrator import restart_orchestrator
+
+        reports = await restart_orchestrator.rolling_restart_and_wait(reason, window_seconds=window_minutes * 60)
+        failed = [report for report in reports if report is None or report.get("status") == "failed"]
+        if failed:
+            message = (failed[0] or {}).get("restart_result", {}).get("message")
+            raise RuntimeError(f"滚动重启在第 {len(reports)} 个分片失败: {message}")
+        alert_accounts = [login for report in reports for login in report.get("alert_accounts", [])]
+        report_ids = ", ".join(report["id"] for report in reports)
+        if alert_accounts:
+            return f"滚动重启 {len(reports)} 个分片完成，但有账号未恢复: {', '.join(alert_accounts)}（报告 {report_ids}）"
+        downtimes = [report["max_downtime_seconds"] for report in reports if report.get("max_downtime_seconds") is not None]
+        return (f"滚动重启 {len(reports)} 个分片成功，最长停机 {max(downtimes) if downtimes else None}秒"
+                f"（报告 {report_ids}）")
+
+    async def _task_archive_logs(self, args: Dict) -> str:
+        return await asyncio.to_thread(
+            self._archive_logs,
+            int(args.get("max_bytes", settings.log_archive_max_bytes)),
+            int(args.get("keep_bytes", settings.log_archive_keep_bytes)),
+            float(args.get("retention_days", settings.log_archive_retention_days))
+        )
+
+    @staticmethod
+    def _archive_logs(max_bytes: int, keep_bytes: int, retention_days: float) -> str:
+        """
+        把超过max_bytes的日志前半部分压缩到 logs/archive/，原文件只保留末尾约keep_bytes的完整行
+
+        采用copytruncate方式（原地改写而不是重命名），bot持有的文件句柄仍然有效；
+        BotStatusMonitor检测到文件变小后会从头重新读取。
+        """
+        from app.services.bot_monitor import bot_monitor
+
+        # 分片模式下每个分片的日志目录各自归档到其下的archive/
+        logs_dirs = bot_monitor.log_directories()
+        archived = 0
+        for log_file in [path for logs_dir in logs_dirs for path in sorted(logs_dir.glob("*.txt"))]:
+            archive_dir = log_file.parent / "archive"
+            try:
+                size = log_file.stat().st_size
+            except OSError:
+                continue
+            if size <= max_bytes:
+                continue
+            archive_dir.mkdir(exist_ok=True)
+            target = archive_dir / f"{log_file.stem}-{datetime.now():%Y%m%d-%H%M%S}.txt.gz"
+            with open(log_file, "r+b") as f:
+                # 在保留部分的第一个换行处切分
+                f.seek(max(size - keep_bytes, 0))
+                head = f.readline()
+                cut = f.tell() if head.endswith(b"\n") else size
+                f.seek(0)
+                with gzip.open(target, "wb") as gz:
+                    remaining = cut
+                    while remaining > 0:
+                        chunk = f.read(min(remaining, 1024 * 1024))
+                        if not chunk:
+                            break
+                        gz.write(chunk)
+                        remaining -= len(chunk)
+                # 读取剩余内容时包含归档期间新追加的行
+                f.seek(cut)
+                tail = f.read()
+                f.seek(0)
+                f.write(tail)
+                # 移动期间bot追加的内容（在已读取的末尾之后）也移到前面，直到文件不再增长后立即截断，
+                # 截断只去掉已经移走的部分
+                read_end, write_end = cut + len(tail), len(tail)
+                while True:
+                    f.flush()
+                    current_size = os.fstat(f.fileno()).st_size
+                    if current_size <= read_end:
+                        break
+                    f.seek(read_end)
+                    extra = f.read(current_size - read_end)
+                    f.seek(write_end)
+                    f.write(extra)
+                    read_end += len(extra)
+                    write_end += len(extra)
+                f.truncate(write_end)
+            archived += 1
+            print(f"[Scheduler] 归档日志 {log_file.name}: {cut} 字节 -> {target.name}")
+
+        removed = 0
+        cutoff = time.time() - retention_days * 86400
+        for logs_dir in logs_dirs:
+            for path in (logs_dir / "archive").glob("*.gz"):
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except OSError:
+                    pass
+        return f"归档 {archived} 个日志文件，删除 {removed} 个过期归档"
+
+    async def _task_session_gc(self, args: Dict) -> str:
+        from app.models.admin import Session as SessionModel
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(SessionModel).where(SessionModel.expires_at < datetime.utcnow()))
+            await db.commit()
+        return f"清理 {result.rowcount} 个过期会话"
 
 
 scheduler_service = SchedulerService()
@@ -0,0 +1,251 @@
+"""状态广播服务 - 所有WebSocket连接共享同一个状态计算周期"""
+import asyncio
+import json
+from collections import deque
+from typing import Dict, Optional
+from app.config import settings
+from app.services.connection_manager import FLEET_TOPIC, USER_TOPIC_PREFIX, manager, user_topic
+
+
+class StatusBroadcaster:
+    """
+    状态广播器
+
+    每个周期只计算一次全体用户状态，与上一次快照比较后，
+    仅把发生变化的账号通过ConnectionManager推送给客户端（附带递增序号）。
+    除了每WS_BROADCAST_INTERVAL秒的定期周期，config.json变化、日志文件写入（watchdog文件事件）
+    和其他途径读取到的状态变化会立即触发一次周期（两次周期至少间隔WS_BROADCAST_MIN_INTERVAL秒）。
+    每个主题的消息只序列化一次，所有订阅者共享同一份数据。
+    计算成本与打开的浏览器标签数量无关。
+    """
+
+    def __init__(self):
+        self.interval = settings.ws_broadcast_interval
+        # 上一次推送的快照 {username: summary}
+        self._snapshot: Dict[str, Dict] = {}
+        self._seq = 0
+        # 最近的增量日志 [(seq, changes)]，用于断线重连后补发
+        self._delta_log: deque = deque(maxlen=settings.ws_delta_log_size)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # 周期内读取日志产生的状态变化不再触发新的周期
+        self._ticking = False
+        self._listening = False
+        self._observer = None
+        # 上次清理监控缓存时的配置代数
+        self._config_generation = -1
+        # 慢连接重新同步时由连接管理器调用
+        manager.snapshot_provider = self.get_snapshot_text
+        print(f"[Broadcaster] 初始化完成，广播周期: {self.interval}秒")
+
+    @property
+    def seq(self) -> int:
+        """当前序号"""
+        return self._seq
+
+    @staticmethod
+    def _summarize(status_info: Dict) -> Dict:
+        """提取推送给客户端的状态字段"""
+        return {
+            "status": status_info.get("status"),
+            "campaign": status_info.get("campaign"),
+            "broadcaster": status_info.get("broadcaster"),
+            "progress": status_info.get("progress")
+        }
+
+    def compute_fleet_status(self) -> Dict[str, Dict]:
+        """计算全体用户的状态（每个周期只调用一次）"""
+        from app.services.config_service import config_service
+        from app.services.bot_monitor import bot_monitor
+
+        fleet = {}
+        for user_data in config_service.get_users():
+            username = user_data.get("Login")
+            if not username:
+                continue
+            fleet[username] = self._summarize(bot_monitor.get_user_status(username))
+
+        # 配置变化后清理已删除账号在监控中的缓存状态，避免内存持续增长
+        if config_service.generation != self._config_generation:
+            self._config_generation = config_service.generation
+            from app.services.memory_inspector import memory_inspector
+            memory_inspector.evict_users(fleet)
+        return fleet
+
+    @staticmethod
+    def diff(old: Dict[str, Dict], new: Dict[str, Dict]) -> Dict[str, Optional[Dict]]:
+        """比较两次快照，返回变化的账号（被移除的账号值为None）"""
+        changes: Dict[str, Optional[Dict]] = {}
+        for username, summary in new.items():
+            if old.get(username) != summary:
+                changes[username] = summary
+        for username in old:
+            if username not in new:
+                changes[username] = None
+        return changes
+
+    @staticmethod
+    def _filter_for_topic(topic: str, data: Dict[str, Optional[Dict]]) -> Dict[str, Optional[Dict]]:
+        """按主题筛选账号数据"""
+        if topic == FLEET_TOPIC:
+            return data
+        username = topic[len(USER_TOPIC_PREFIX):]
+        if username in data:
+            return {username: data[username]}
+        return {}
+
+    def get_snapshot_message(self, topic: str) -> Dict:
+        """主题的完整快照消息（新订阅使用）"""
+        return {
+            "type": "status_update",
+            "topic": topic,
+            "seq": self._seq,
+            "data": self._filter_for_topic(topic, self._snapshot)
+        }
+
+    def get_resume_message(self, topic: str, last_seq: Optional[int]) -> Optional[Dict]:
+        """
+        断线重连：返回客户端错过的增量（合并为一条消息）
+        客户端落后太多（超出增量日志范围）或序号无效时返回完整快照，已是最新时返回None
+        """
+        if last_seq is None:
+            return self.get_snapshot_message(topic)
+        if last_seq == self._seq:
+            return None
+
+        oldest_seq = self._delta_log[0][0] if self._delta_log else self._seq + 1
+        if last_seq > self._seq or last_seq < oldest_seq - 1:
+            return self.get_snapshot_message(topic)
+
+        missed: Dict[str, Optional[Dict]] = {}
+        for seq, changes in self._delta_log:
+            if seq > last_seq:
+                missed.update(self._filter_for_topic(topic, changes))
+        return {
+            "type": "status_delta",
+            "topic": topic,
+            "seq": self._seq,
+            "data": missed,
+            "replay": True
+        }
+
+    def get_snapshot_text(self, topic: str) -> str:
+        """已序列化的主题快照"""
+        return json.dumps(self.get_snapshot_message(topic), ensure_ascii=False)
+
+    async def tick(self):
+        """执行一次广播周期：计算、比较、只推送变化"""
+        self._ticking = True
+        try:
+            fleet = self.compute_fleet_status()
+        finally:
+            self._ticking = False
+        changes = self.diff(self._snapshot, fleet)
+        if not changes:
+            return
+
+        self._snapshot = fleet
+        self._seq += 1
+        self._delta_log.append((self._seq, changes))
+
+        # 每个有订阅者的主题只序列化一次
+        topics = [FLEET_TOPIC] + [user_topic(username) for username in changes]
+        for topic in topics:
+            if not manager.has_subscribers(topic):
+                continue
+            text = json.dumps({
+                "type": "status_delta",
+                "topic": topic,
+                "seq": self._seq,
+                "data": self._filter_for_topic(topic, changes)
+            }, ensure_ascii=False)
+            manager.publish(topic, text)
+
+    def notify(self):
+        """通知广播器立即执行一次周期（例如配置或日志发生变化时）"""
+        if self._wakeup is not None and not self._ticking:
+            self._wakeup.set()
+
+    def _on_config_change(self, config: Dict):
+        self.notify()
+
+    def _on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        self.notify()
+
+    def _start_log_observer(self, loop: asyncio.AbstractEventLoop):
+        """使用watchdog监听日志目录，日志写入后立即触发周期（不可用时只按周期读取）"""
+        from app.services.bot_monitor import bot_monitor
+
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("[Broadcaster] 未安装watchdog，日志变化按广播周期读取")
+            return
+
+        notify = self.notify
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory and str(getattr(event, "src_path", "")).endswith(".txt"):
+                    loop.call_soon_threadsafe(notify)
+
+        try:
+            observer = Observer()
+            for logs_dir in bot_monitor.log_directories():
+                if logs_dir.is_dir():
+                    observer.schedule(_Handler(), str(logs_dir), recursive=False)
+            observer.daemon = True
+            observer.start()
+            self._observer = observer
+        except Exception as e:
+            print(f"[Broadcaster] 启动日志目录监听失败，日志变化按广播周期读取: {e}")
+
+    async def _run(self):
+        """广播循环"""
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"[Broadcaster] ❌ 广播周期异常: {str(e)}")
+                import traceback
+                traceback.print_exc()
+
+            # 至少间隔最短周期，期间的变化合并到下一个周期
+            min_interval = min(settings.ws_broadcast_min_interval, self.interval)
+            await asyncio.sleep(min_interval)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval - min_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        """启动广播任务"""
+        if self._task is None:
+            from app.services.bot_monitor import bot_monitor
+            from app.services.config_service import config_service
+
+            print("[Broadcaster] 启动状态广播任务...")
+            if not self._listening:
+                config_service.add_listener(self._on_config_change)
+                bot_monitor.add_listener(self._on_status_change)
+                self._listening = True
+            self._wakeup = asyncio.Event()
+            self._start_log_observer(asyncio.get_running_loop())
+            self._task = asyncio.create_task(self._run())
+        else:
+            print("[Broadcaster] 广播任务已在运行中")
+
+    def stop(self):
+        """停止广播任务"""
+        if self._task:
+            print("[Broadcaster] 停止状态广播任务...")
+            self._task.cancel()
+            self._task = None
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+
+status_broadcaster = StatusBroadcaster()
@@ -0,0 +1,166 @@
+"""管理员用户列表索引 - 内存中维护，支持分页、排序和筛选"""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from app.services.bot_monitor import bot_monitor
+from app.services.config_service import config_service
+
+SORT_KEYS = ("login", "status", "progress", "last_update")
+
+
+class UserIndex:
+    """
+    用户列表索引
+
+    账号行（config.json字段 + 状态摘要）随配置代数和状态变化增量更新，
+    每种排序的有序键列表按索引版本缓存，分页使用键集游标（排序键 + Login）。
+    """
+
+    def __init__(self):
+        # {login: row}
+        self._rows: Dict[str, Dict] = {}
+        self._config_generation = -1
+        # 索引版本：行发生变化时递增，排序缓存随之失效
+        self.version = 0
+        # {sort: (version, [(key, login)])}
+        self._sorted_cache: Dict[str, Tuple[int, List[Tuple[tuple, str]]]] = {}
+        bot_monitor.add_listener(self.on_status_change)
+
+    def on_status_change(self, username: str, old: Optional[Dict], new: Dict):
+        """状态变化监听：更新该账号行的状态摘要"""
+        row = self._rows.get(username)
+        if row is not None:
+            row["status"] = new
+            self.version += 1
+
+    def sync_config(self):
+        """配置变化时重建账号行（配置未变化时为O(1)）"""
+        config_service.get_config()
+        if config_service.generation == self._config_generation:
+            return
+        self._config_generation = config_service.generation
+
+        rows = {}
+        # 中心模式下包括远程节点的账号
+        for user in config_service.get_users():
+            login = user.get("Login")
+            if not login:
+                continue
+            status = bot_monitor.get_cached_summary(login)
+            if status is None:
+                # 首次出现的账号读取一次日志，之后由状态监听维护
+                status = bot_monitor.summarize(bot_monitor.get_user_status(login))
+            rows[login] = {
+                "Login": login,
+                "Id": user.get("Id"),
+                "Enabled": user.get("Enabled", True),
+                "FavouriteGames": user.get("FavouriteGames", []),
+                "Node": user.get("Node"),
+                "status": status
+            }
+        self._rows = rows
+        self.version += 1
+
+    @staticmethod
+    def _sort_key(row: Dict, sort: str) -> tuple:
+        """排序键：(是否为空, 值)，升序时空值排在最后"""
+        status = row["status"] or {}
+        if sort == "status":
+            value = status.get("status")
+            return (value is None, value or "")
+        if sort == "progress":
+            progress = status.get("progress")
+            return (progress is None, progress.get("percentage", 0) if progress else 0)
+        if sort == "last_update":
+            value = status.get("last_update")
+            return (value is None, value or "")
+        return (False, row["Login"].lower())
+
+    def _sorted(self, sort: str) -> List[Tuple[tuple, str]]:
+        """按排序键升序排列的 [(key, login)]，按版本缓存"""
+        cached = self._sorted_cache.get(sort)
+        if cached and cached[0] == self.version:
+            return cached[1]
+        entries = sorted((self._sort_key(row, sort), login) for login, row in self._rows.items())
+        self._sorted_cache[sort] = (self.version, entries)
+        return entries
+
+    @staticmethod
+    def _matches(row: Dict, enabled: Optional[bool], status: Optional[str],
+                 game: Optional[str], campaign: Optional[str]) -> bool:
+        """筛选条件"""
+        if enabled is not None and row["Enabled"] != enabled:
+            return False
+        summary = row["status"] or {}
+        if status is not None and summary.get("status") != status:
+            return False
+        campaign_info = summary.get("campaign") or {}
+        if game is not None and campaign_info.get("game") != game:
+            return False
+        if campaign is not None and campaign_info.get("campaign") != campaign:
+            return False
+        return True
+
+    @staticmethod
+    def encode_cursor(entry: Tuple[tuple, str]) -> str:
+        key, login = entry
+        raw = json.dumps([list(key), login], ensure_ascii=False).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[tuple, str]:
+        """解析游标，格式错误时抛出ValueError"""
+        try:
+            key, login = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return (tuple(key), str(login))
+        except Exception:
+            raise ValueError("无效的游标")
+
+    def query(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        sort: str = "login",
+        order: str = "asc",
+        enabled: Optional[bool] = None,
+        status: Optional[str] = None,
+        game: Optional[str] = None,
+        campaign: Optional[str] = None
+    ) -> Dict:
+        """
+        查询用户列表
+        返回 {"users": [row], "total": 符合筛选的总数, "next_cursor": 下一页游标或None}
+        """
+        self.sync_config()
+        entries = self._sorted(sort)
+
+        try:
+            if order == "desc":
+                end = bisect_left(entries, self.decode_cursor(cursor)) if cursor else len(entries)
+                candidates = reversed(entries[:end])
+            else:
+                start = bisect_right(entries, self.decode_cursor(cursor)) if cursor else 0
+                candidates = entries[start:]
+        except TypeError:
+            # 游标与当前排序方式不匹配
+            raise ValueError("无效的游标")
+
+        page = []
+        next_cursor = None
+        for entry in candidates:
+            row = self._rows[entry[1]]
+            if not self._matches(row, enabled, status, game, campaign):
+                continue
+            if limit is not None and len(page) >= limit:
+                next_cursor = self.encode_cursor(page_last)
+                break
+            page.append(row)
+            page_last = entry
+
+        total = sum(1 for row in self._rows.values() if self._matches(row, enabled, status, game, campaign))
+        return {"users": page, "total": total, "next_cursor": next_cursor}
+
+
+user_index = UserIndex()
@@ -0,0 +1,141 @@
+"""Cron表达式解析 - 标准5字段格式（分 时 日 月 周）"""
+from datetime import datetime, timedelta
+from typing import List, Set, Tuple
+
+# (名称, 最小值, 最大值)
+_FIELDS: List[Tuple[str, int, int]] = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 6),
+]
+
+_MONTH_NAMES = {name: i for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+_WEEKDAY_NAMES = {name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+
+
+class CronError(ValueError):
+    """无效的Cron表达式"""
+    pass
+
+
+def _parse_value(token: str, field: str) -> int:
+    names = _MONTH_NAMES if field == "month" else _WEEKDAY_NAMES if field == "weekday" else {}
+    if token.lower() in names:
+        return names[token.lower()]
+    try:
+        value = int(token)
+    except ValueError:
+        raise CronError(f"{field}字段无效: {token}")
+    # 周日可写作0或7
+    return 0 if field == "weekday" and value == 7 else value
+
+
+def _parse_field(expr: str, field: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in expr.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            try:
+                step = int(step_str)
+            except ValueError:
+                raise CronError(f"{field}字段步长无效: {step_str}")
+            if step <= 0:
+                raise CronError(f"{field}字段步长必须大于0")
+
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_str, end_str = part.split("-", 1)
+            start, end = _parse_value(start_str, field), _parse_value(end_str, field)
+            if field == "weekday" and end == 0 and (start > 0 or end_str.strip() == "7"):
+                # 以周日（7/sun）结尾的范围：周日按7参与步长计算，命中时记为0
+                if not low <= start <= high:
+                    raise CronError(f"{field}字段超出范围: {part}")
+                values.update(range(start, 7, step))
+                if (7 - start) % step == 0:
+                    values.add(0)
+                continue
+        else:
+            start = _parse_value(part, field)
+            # "5/15" 表示从5开始每15
+            end = high if step > 1 else start
+
+        if not (low <= start <= high and low <= end <= high) or start > end:
+            raise CronError(f"{field}字段超出范围: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """
+    Cron表达式
+
+    支持 * , - / 以及月份、星期名称缩写和 @daily 等别名；
+    日和星期都有限制时按标准cron语义取并集。
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = _ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise CronError(f"Cron表达式需要5个字段: {expression}")
+        parsed = [_parse_field(expr, name, low, high) for expr, (name, low, high) in zip(fields, _FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self._day_any = fields[2] == "*"
+        self._weekday_any = fields[4] == "*"
+
+    def __str__(self) -> str:
+        return self.expression
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        # datetime.weekday(): 周一为0；cron: 周日为0
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._day_any and self._weekday_any:
+            return True
+        if self._day_any:
+            return weekday_ok
+        if self._weekday_any:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def matches(self, dt: datetime) -> bool:
+        return (
+            dt.minute in self.minutes
+            and dt.hour in self.hours
+            and dt.month in self.months
+            and self._day_matches(dt)
+        )
+
+    def next_after(self, after: datetime) -> datetime:
+        """严格晚于after的下一个触发时间（精确到分钟）"""
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * 5)
+        while dt <= limit:
+            if dt.month not in self.months:
+                # 跳到下个月1日0点
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise CronError(f"Cron表达式在5年内没有触发时间: {self.expression}")
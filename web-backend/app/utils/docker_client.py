@@ -0,0 +1,265 @@
+"""Docker Engine API客户端 - 通过unix socket直接调用，不再启动docker-compose子进程"""
+import asyncio
+import json
+import struct
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+# docker compose为容器打的标签
+COMPOSE_SERVICE_LABEL = "com.docker.compose.service"
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+
+# exec输出的流类型（非TTY模式下的多路复用帧头）
+STDIN = 0
+STDOUT = 1
+STDERR = 2
+
+
+class DockerAPIError(Exception):
+    """Docker Engine API返回错误"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Docker API错误 {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+class ExecStream:
+    """
+    exec的附加流（hijack后的原始连接）
+
+    非TTY模式下输出为多路复用帧：8字节头（流类型, 0, 0, 0, 大端长度）+ 数据；
+    TTY模式下为原始字节流。
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, tty: bool):
+        self._reader = reader
+        self._writer = writer
+        self.tty = tty
+        self._buffer = b""
+
+    async def write(self, data: bytes):
+        """写入exec进程的stdin"""
+        self._writer.write(data)
+        await self._writer.drain()
+
+    def close_stdin(self):
+        """关闭stdin（半关闭连接，输出仍可读取）"""
+        if self._writer.can_write_eof():
+            self._writer.write_eof()
+
+    async def read_frame(self) -> Optional[Tuple[int, bytes]]:
+        """读取一帧输出，返回 (流类型, 数据)；流结束时返回None"""
+        if self.tty:
+            data = await self._reader.read(4096)
+            return (STDOUT, data) if data else None
+        try:
+            header = await self._reader.readexactly(8)
+            stream_type, length = struct.unpack(">BxxxL", header)
+            data = await self._reader.readexactly(length) if length else b""
+        except asyncio.IncompleteReadError:
+            return None
+        return stream_type, data
+
+    async def readline(self) -> Optional[str]:
+        """读取一行输出（stdout和stderr合并）；流结束时返回None"""
+        while b"\n" not in self._buffer:
+            frame = await self.read_frame()
+            if frame is None:
+                if not self._buffer:
+                    return None
+                line, self._buffer = self._buffer, b""
+                return line.decode("utf-8", errors="ignore")
+            self._buffer += frame[1]
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode("utf-8", errors="ignore").rstrip("\r")
+
+    async def lines(self) -> AsyncIterator[str]:
+        """逐行迭代输出直到流结束"""
+        while True:
+            line = await self.readline()
+            if line is None:
+                return
+            yield line
+
+    async def close(self):
+        """关闭连接"""
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+
+
+class DockerClient:
+    """
+    异步Docker Engine API客户端
+
+    普通请求复用同一个httpx客户端（unix socket上的持久连接）；
+    exec附加流需要hijack连接，单独打开一条原始连接。
+    """
+
+    def __init__(self, socket_path: str, api_version: str = "v1.41", timeout: float = 10.0):
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=self.socket_path),
+                base_url=f"http://docker/{self.api_version}",
+                timeout=self.timeout
+            )
+        return self._client
+
+    async def close(self):
+        """关闭持久连接"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        response = await self.client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("message", response.text)
+            except ValueError:
+                message = response.text
+            raise DockerAPIError(response.status_code, message)
+        return response
+
+    async def ping(self) -> bool:
+        """检查Docker守护进程是否可用"""
+        response = await self._request("GET", "/_ping")
+        return response.text == "OK"
+
+    async def list_containers(self, labels: Optional[Dict[str, str]] = None, all: bool = False) -> List[Dict]:
+        """列出容器，可按标签过滤"""
+        params = {"all": "true" if all else "false"}
+        if labels:
+            params["filters"] = json.dumps({"label": [f"{key}={value}" for key, value in labels.items()]})
+        response = await self._request("GET", "/containers/json", params=params)
+        return response.json()
+
+    async def find_compose_container(self, service: str, project: Optional[str] = None) -> Optional[Dict]:
+        """按docker compose标签查找服务的容器（优先返回运行中的容器）"""
+        labels = {COMPOSE_SERVICE_LABEL: service}
+        if project:
+            labels[COMPOSE_PROJECT_LABEL] = project
+        containers = await self.list_containers(labels, all=True)
+        if not containers:
+            return None
+        containers.sort(key=lambda c: c.get("State") != "running")
+        return containers[0]
+
+    async def inspect_container(self, container_id: str) -> Dict:
+        """获取容器详细信息"""
+        response = await self._request("GET", f"/containers/{quote(container_id)}/json")
+        return response.json()
+
+    async def restart_container(self, container_id: str, timeout: int = 10):
+        """重启容器（timeout秒后强制停止）"""
+        await self._request(
+            "POST",
+            f"/containers/{quote(container_id)}/restart",
+            params={"t": timeout},
+            timeout=timeout + self.timeout
+        )
+
+    async def stats(self, container_id: str) -> Dict:
+        """获取一次容器资源统计"""
+        response = await self._request(
+            "GET",
+            f"/containers/{quote(container_id)}/stats",
+            params={"stream": "false"},
+            timeout=self.timeout + 5
+        )
+        return response.json()
+
+    async def stats_stream(self, container_id: str) -> AsyncIterator[Dict]:
+        """订阅容器资源统计流（Docker约每秒推送一条）"""
+        async with self.client.stream(
+            "GET",
+            f"/containers/{quote(container_id)}/stats",
+            params={"stream": "true"},
+            timeout=httpx.Timeout(self.timeout, read=None)
+        ) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise DockerAPIError(response.status_code, response.text)
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    async def exec_create(self, container_id: str, cmd: List[str], stdin: bool = False,
+                          tty: bool = False, env: Optional[List[str]] = None,
+                          workdir: Optional[str] = None) -> str:
+        """在容器中创建exec实例，返回exec ID"""
+        body = {
+            "Cmd": cmd,
+            "AttachStdin": stdin,
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "Tty": tty
+        }
+        if env:
+            body["Env"] = env
+        if workdir:
+            body["WorkingDir"] = workdir
+        response = await self._request("POST", f"/containers/{quote(container_id)}/exec", json=body)
+        return response.json()["Id"]
+
+    async def exec_start(self, exec_id: str, tty: bool = False) -> ExecStream:
+        """启动exec实例并附加到其输入输出流"""
+        body = json.dumps({"Detach": False, "Tty": tty}).encode("utf-8")
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(self.socket_path),
+            timeout=self.timeout
+        )
+        request = (
+            f"POST /{self.api_version}/exec/{quote(exec_id)}/start HTTP/1.1\r\n"
+            "Host: docker\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: Upgrade\r\n"
+            "Upgrade: tcp\r\n"
+            "\r\n"
+        ).encode("ascii") + body
+        try:
+            writer.write(request)
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=self.timeout)
+            status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+            status_code = int(status_line.split(" ")[1])
+            if status_code not in (101, 200):
+                headers = self._parse_headers(head)
+                length = int(headers.get("content-length", "0"))
+                payload = await reader.readexactly(length) if length else b""
+                try:
+                    message = json.loads(payload).get("message", "")
+                except ValueError:
+                    message = payload.decode("utf-8", errors="ignore")
+                raise DockerAPIError(status_code, message or status_line)
+        except BaseException:
+            writer.close()
+            raise
+        return ExecStream(reader, writer, tty)
+
+    async def exec_inspect(self, exec_id: str) -> Dict:
+        """获取exec实例状态（Running、ExitCode）"""
+        response = await self._request("GET", f"/exec/{quote(exec_id)}/json")
+        return response.json()
+
+    @staticmethod
+    def _parse_headers(head: bytes) -> Dict[str, str]:
+        headers = {}
+        for line in head.decode("latin-1").split("\r\n")[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        return headers
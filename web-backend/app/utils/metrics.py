@@ -0,0 +1,241 @@
+"""Prometheus指标工具 - 轻量实现，输出Prometheus文本格式
+
+所有指标只在事件循环线程中更新，更新操作是简单的字典/数值运算，不加锁。
+瞬时值（账号状态、连接数等）通过采集回调在抓取时计算，不占用热路径。
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}"
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labelvalues: str):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """瞬时值；可设置采集回调在抓取时计算"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 collector: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.collector = collector
+
+    def set(self, value: float, *labelvalues: str):
+        self._values[labelvalues] = value
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        values = self._values
+        if self.collector is not None:
+            try:
+                values = self.collector()
+            except Exception as e:
+                print(f"[Metrics] 采集指标失败 {self.name}: {e}")
+                values = {}
+        for labelvalues, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """直方图（固定分桶）"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {labelvalues: [各桶计数..., +Inf桶计数, sum]}
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        data = self._values.get(labelvalues)
+        if data is None:
+            data = [0] * (len(self.buckets) + 1) + [0.0]
+            self._values[labelvalues] = data
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        """计时上下文：with histogram.time(label): ..."""
+        return _Timer(self, labelvalues)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, data in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labelvalues: LabelValues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+        return False
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              collector: Optional[Callable[[], Dict[LabelValues, float]]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collector))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ---- 后端热路径指标 ----
+http_request_duration = registry.histogram(
+    "twitch_web_http_request_duration_seconds",
+    "HTTP请求处理耗时（按路由模板）",
+    ("method", "route", "status")
+)
+log_bytes_read = registry.counter(
+    "twitch_web_log_bytes_read_total",
+    "从bot日志文件读取的字节数"
+)
+log_lines_parsed = registry.counter(
+    "twitch_web_log_lines_parsed_total",
+    "解析的bot日志行数"
+)
+log_parse_seconds = registry.counter(
+    "twitch_web_log_parse_seconds_total",
+    "解析bot日志所用的时间（秒）"
+)
+config_read_duration = registry.histogram(
+    "twitch_web_config_read_duration_seconds",
+    "读取config.json耗时"
+)
+config_write_duration = registry.histogram(
+    "twitch_web_config_write_duration_seconds",
+    "写入config.json耗时（含重试）"
+)
+ws_send_duration = registry.histogram(
+    "twitch_web_ws_send_duration_seconds",
+    "WebSocket单条消息发送耗时"
+)
+
+
+class MetricsMiddleware:
+    """ASGI中间件：按路由模板记录HTTP请求耗时"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 路由匹配后FastAPI会把route写入scope，使用路由模板避免标签基数爆炸
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                scope.get("method", ""),
+                path,
+                str(status_code[0])
+            )
@@ -0,0 +1,78 @@
+"""响应缓存工具 - 按数据版本缓存已序列化的JSON，支持ETag条件请求"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+
+class ResponseCache:
+    """
+    已序列化响应缓存
+
+    缓存键为 (接口, 主体, 查询参数)，版本为相关数据的代数（监控代数、配置代数等）。
+    ETag由键和版本计算，客户端带匹配的If-None-Match时直接返回304，无需重新构建响应。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # {key: (version, etag, body)}
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, str, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        # 进程随机数：版本号只在本进程内有意义，避免多进程/重启后误判304
+        self._nonce = os.urandom(8).hex()
+
+    def make_etag(self, key: Hashable, version: Hashable) -> str:
+        digest = hashlib.sha1(repr((self._nonce, key, version)).encode("utf-8")).hexdigest()[:20]
+        return f'"{digest}"'
+
+    def get_body(self, key: Hashable, version: Hashable, build: Callable[[], Any]) -> Tuple[str, bytes]:
+        """获取已序列化的响应体，版本变化时重新构建"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+        self.misses += 1
+        body = json.dumps(
+            jsonable_encoder(build()),
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+        etag = self.make_etag(key, version)
+        self._entries[key] = (version, etag, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return etag, body
+
+    def respond(self, request: Request, key: Hashable, version: Hashable, build: Callable[[], Any]) -> Response:
+        """返回缓存的JSON响应；If-None-Match匹配时返回304"""
+        etag = self.make_etag(key, version)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        etag, body = self.get_body(key, version, build)
+        headers["ETag"] = etag
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1 @@
+"""后端测试"""
@@ -0,0 +1,45 @@
+"""测试公共配置"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# 以web-backend为根目录导入app包
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 测试使用临时目录中的数据库、配置文件和日志目录（须在导入app之前设置）
+_tmp = tempfile.mkdtemp(prefix="twitch-drops-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["CONFIG_FILE_PATH"] = f"{_tmp}/config.json"
+os.environ["LOGS_DIRECTORY"] = f"{_tmp}/logs"
+
+
+@pytest.fixture(scope="session")
+def database():
+    """建表（导入模型以注册到Base）"""
+    from app.database import Base, engine
+    from app.models import (  # noqa: F401
+        admin, container_stats, farming_stat, notification, progress_sample, scheduled_job
+    )
+
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def run_async():
+    """在新的事件循环中运行协程函数，结束后释放异步连接池（连接绑定在事件循环上）"""
+    from app.database import async_engine
+
+    def run(fn):
+        async def main():
+            try:
+                return await fn()
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1 @@
+"""测试用的模拟服务"""
@@ -0,0 +1,415 @@
+"""本地模拟Docker Engine API（unix socket） - 在没有Docker的开发环境中调试DockerClient，也用于测试
+
+只实现后端用到的接口：_ping、容器列表（标签过滤）、inspect、restart、stats、exec创建/启动/查询。
+exec启动会hijack连接，按非TTY的多路复用帧格式输出。--add-account命令会模拟bot的授权提示；
+`kill -信号 PID` 命令向模拟的进程发送信号（TERM退出码143，KILL退出码137）。
+hang_on_stdin_close / ignore_term 用于模拟关闭stdin后不退出、忽略TERM的bot进程；
+authorize_after 秒后模拟用户完成授权：调用on_account_added（例如写入config.json）后bot立即退出。
+
+用法:
+    python -m tests.fakes.fake_docker /tmp/docker.sock
+    # .env 中设置 DOCKER_SOCKET_PATH=/tmp/docker.sock
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+REASONS = {101: "UPGRADED", 200: "OK", 201: "Created", 204: "No Content", 404: "Not Found", 409: "Conflict"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeDockerServer:
+    """模拟的Docker守护进程"""
+
+    def __init__(self, socket_path: str, restart_delay: float = 0.2, stats_interval: float = 1.0,
+                 hang_on_stdin_close: bool = False, ignore_term: bool = False,
+                 authorize_after: Optional[float] = None, on_account_added: Optional[Callable[[], None]] = None):
+        self.socket_path = socket_path
+        self.restart_delay = restart_delay
+        self.stats_interval = stats_interval
+        self.hang_on_stdin_close = hang_on_stdin_close
+        self.ignore_term = ignore_term
+        self.authorize_after = authorize_after
+        self.on_account_added = on_account_added
+        self._pids = itertools.count(100)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._ids = itertools.count(1)
+        self.containers: Dict[str, Dict] = {}
+        self.execs: Dict[str, Dict] = {}
+        # 收到的请求 [(method, path)]，便于调试
+        self.requests: List[Tuple[str, str]] = []
+        self.add_container("drop", project="twitch")
+        self.add_container("web", project="twitch")
+
+    def add_container(self, service: str, project: str = "twitch") -> Dict:
+        container_id = f"{next(self._ids):064x}"
+        container = {
+            "Id": container_id,
+            "Names": [f"/{project}-{service}-1"],
+            "Labels": {
+                "com.docker.compose.service": service,
+                "com.docker.compose.project": project
+            },
+            "State": "running",
+            "Status": "Up",
+            "RestartCount": 0,
+            "StartedAt": _now(),
+            # 累计的资源计数器（stats接口使用）
+            "CpuUsage": 0,
+            "SystemUsage": 0,
+            "RxBytes": 0,
+            "TxBytes": 0
+        }
+        self.containers[container_id] = container
+        return container
+
+    def _find_container(self, ref: str) -> Optional[Dict]:
+        for container_id, container in self.containers.items():
+            if container_id.startswith(ref) or f"/{ref}" in container["Names"]:
+                return container
+        return None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    # ---- HTTP ----
+
+    @staticmethod
+    def _response(writer: asyncio.StreamWriter, status: int, body=None):
+        if body is None:
+            payload = b""
+        elif isinstance(body, (bytes, str)):
+            payload = body.encode("utf-8") if isinstance(body, str) else body
+        else:
+            payload = json.dumps(body).encode("utf-8")
+        content_type = "application/json" if body is not None and not isinstance(body, (bytes, str)) else "text/plain"
+        writer.write((
+            f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "\r\n"
+        ).encode("ascii") + payload)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+
+                url = urlsplit(target)
+                path = re.sub(r"^/v[\d.]+", "", unquote(url.path))
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                self.requests.append((method, path))
+
+                match = re.fullmatch(r"/containers/([^/]+)/stats", path)
+                if method == "GET" and match and query.get("stream", "true") != "false":
+                    # 流式统计：chunked响应，直到客户端断开
+                    await self._stats_stream(match.group(1), writer)
+                    return
+
+                match = re.fullmatch(r"/exec/([^/]+)/start", path)
+                if method == "POST" and match:
+                    # hijack：该连接此后只用于exec的输入输出
+                    await self._exec_start(match.group(1), reader, writer)
+                    return
+
+                status, payload = await self._route(method, path, query, body)
+                self._response(writer, status, payload)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, query: Dict[str, str], body: Dict):
+        if method in ("GET", "HEAD") and path == "/_ping":
+            return 200, "OK"
+
+        if method == "GET" and path == "/containers/json":
+            containers = list(self.containers.values())
+            if query.get("all") != "true":
+                containers = [c for c in containers if c["State"] == "running"]
+            filters = json.loads(query.get("filters", "{}"))
+            for label in filters.get("label", []):
+                key, _, value = label.partition("=")
+                containers = [c for c in containers if c["Labels"].get(key) == value]
+            return 200, [
+                {key: c[key] for key in ("Id", "Names", "Labels", "State", "Status")}
+                for c in containers
+            ]
+
+        match = re.fullmatch(r"/containers/([^/]+)/stats", path)
+        if method == "GET" and match:
+            container = self._find_container(match.group(1))
+            if container is None:
+                return 404, {"message": f"No such container: {match.group(1)}"}
+            return 200, self._next_stats(container)
+
+        match = re.fullmatch(r"/containers/([^/]+)/(json|restart|exec)", path)
+        if match:
+            container = self._find_container(match.group(1))
+            if container is None:
+                return 404, {"message": f"No such container: {match.group(1)}"}
+            action = match.group(2)
+            if method == "GET" and action == "json":
+                return 200, {
+                    "Id": container["Id"],
+                    "Name": container["Names"][0],
+                    "RestartCount": container["RestartCount"],
+                    "State": {
+                        "Status": container["State"],
+                        "Running": container["State"] == "running",
+                        "StartedAt": container["StartedAt"]
+                    },
+                    "Config": {"Labels": container["Labels"]}
+                }
+            if method == "POST" and action == "restart":
+                container["State"] = "restarting"
+                await asyncio.sleep(self.restart_delay)
+                container["State"] = "running"
+                container["RestartCount"] += 1
+                container["StartedAt"] = _now()
+                return 204, None
+            if method == "POST" and action == "exec":
+                if container["State"] != "running":
+                    return 409, {"message": f"Container {container['Id']} is not running"}
+                exec_id = f"{next(self._ids):064x}"
+                self.execs[exec_id] = {
+                    "ID": exec_id,
+                    "ContainerID": container["Id"],
+                    "Cmd": body.get("Cmd", []),
+                    "Running": False,
+                    "ExitCode": None,
+                    # 宿主机PID（与Docker一致）和容器内PID
+                    "Pid": 0,
+                    "ContainerPid": next(self._pids),
+                    "Signal": None
+                }
+                return 201, {"Id": exec_id}
+
+        match = re.fullmatch(r"/exec/([^/]+)/json", path)
+        if method == "GET" and match:
+            exec_info = self.execs.get(match.group(1))
+            if exec_info is None:
+                return 404, {"message": f"No such exec instance: {match.group(1)}"}
+            return 200, {
+                "ID": exec_info["ID"],
+                "ContainerID": exec_info["ContainerID"],
+                "Running": exec_info["Running"],
+                "ExitCode": exec_info["ExitCode"],
+                "Pid": exec_info["Pid"]
+            }
+
+        return 404, {"message": f"page not found: {method} {path}"}
+
+    # ---- stats ----
+
+    def _next_stats(self, container: Dict) -> Dict:
+        """生成下一条统计（计数器按采样间隔递增，约占0.5个核心、200MB内存）"""
+        precpu = {
+            "cpu_usage": {"total_usage": container["CpuUsage"]},
+            "system_cpu_usage": container["SystemUsage"],
+            "online_cpus": 4
+        }
+        interval_ns = int(self.stats_interval * 1e9)
+        accounts = max(len(self.execs), 1)
+        container["CpuUsage"] += int(interval_ns * (0.4 + 0.02 * accounts + random.random() * 0.2))
+        container["SystemUsage"] += interval_ns * 4
+        container["RxBytes"] += random.randint(20000, 60000)
+        container["TxBytes"] += random.randint(2000, 8000)
+        return {
+            "read": _now(),
+            "cpu_stats": {
+                "cpu_usage": {"total_usage": container["CpuUsage"]},
+                "system_cpu_usage": container["SystemUsage"],
+                "online_cpus": 4
+            },
+            "precpu_stats": precpu,
+            "memory_stats": {
+                "usage": 220 * 1024 * 1024 + random.randint(0, 20 * 1024 * 1024),
+                "limit": 2 * 1024 * 1024 * 1024,
+                "stats": {"inactive_file": 16 * 1024 * 1024}
+            },
+            "networks": {
+                "eth0": {"rx_bytes": container["RxBytes"], "tx_bytes": container["TxBytes"]}
+            }
+        }
+
+    async def _stats_stream(self, ref: str, writer: asyncio.StreamWriter):
+        container = self._find_container(ref)
+        if container is None:
+            self._response(writer, 404, {"message": f"No such container: {ref}"})
+            await writer.drain()
+            return
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/json\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"\r\n"
+        )
+        try:
+            while True:
+                data = (json.dumps(self._next_stats(container)) + "\n").encode("utf-8")
+                writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                await writer.drain()
+                await asyncio.sleep(self.stats_interval)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    # ---- exec ----
+
+    @staticmethod
+    def _frame(writer: asyncio.StreamWriter, text: str, stream_type: int = 1):
+        data = text.encode("utf-8")
+        writer.write(struct.pack(">BxxxL", stream_type, len(data)) + data)
+
+    async def _exec_start(self, exec_id: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        exec_info = self.execs.get(exec_id)
+        if exec_info is None:
+            self._response(writer, 404, {"message": f"No such exec instance: {exec_id}"})
+            await writer.drain()
+            return
+
+        writer.write(
+            b"HTTP/1.1 101 UPGRADED\r\n"
+            b"Content-Type: application/vnd.docker.raw-stream\r\n"
+            b"Connection: Upgrade\r\n"
+            b"Upgrade: tcp\r\n"
+            b"\r\n"
+        )
+        exec_info["Running"] = True
+        exec_info["Pid"] = 40000 + exec_info["ContainerPid"]
+        exec_info["Signal"] = asyncio.get_running_loop().create_future()
+        try:
+            if "--add-account" in exec_info["Cmd"]:
+                if exec_info["Cmd"][0] == "sh":
+                    # 包装命令先输出容器内PID
+                    self._frame(writer, f"__PID__={exec_info['ContainerPid']}\n")
+                exit_code = await self._fake_add_account(exec_info, reader, writer)
+            elif exec_info["Cmd"][:1] == ["kill"]:
+                exit_code = self._fake_kill(exec_info["Cmd"], writer)
+            else:
+                # 其他命令：输出命令行，然后回显stdin直到EOF
+                self._frame(writer, " ".join(exec_info["Cmd"]) + "\n")
+                await writer.drain()
+                while True:
+                    data = await reader.read(4096)
+                    if not data:
+                        break
+                    self._frame(writer, data.decode("utf-8", errors="ignore"))
+                    await writer.drain()
+                exit_code = 0
+            await writer.drain()
+        except ConnectionError:
+            exit_code = await self._wait_after_disconnect(exec_info)
+        exec_info["Running"] = False
+        exec_info["ExitCode"] = exit_code
+
+    async def _wait_after_disconnect(self, exec_info: Dict) -> int:
+        """附加连接断开（stdin关闭）后的进程：默认随之退出，hang_on_stdin_close时等待信号"""
+        if not self.hang_on_stdin_close or "--add-account" not in exec_info["Cmd"]:
+            return 137
+        return await self._wait_signal(exec_info)
+
+    async def _wait_signal(self, exec_info: Dict) -> int:
+        """等待kill信号，返回对应的退出码（ignore_term时忽略TERM）"""
+        while True:
+            signal = await asyncio.shield(exec_info["Signal"])
+            if signal == "KILL":
+                return 137
+            if not self.ignore_term:
+                return 143
+            exec_info["Signal"] = asyncio.get_running_loop().create_future()
+
+    def _fake_kill(self, cmd: List[str], writer: asyncio.StreamWriter) -> int:
+        """模拟 kill -信号 PID"""
+        signal = cmd[1].lstrip("-").upper() if len(cmd) > 2 else "TERM"
+        pid = cmd[-1]
+        for exec_info in self.execs.values():
+            if str(exec_info["ContainerPid"]) == pid and exec_info["Running"]:
+                if not exec_info["Signal"].done():
+                    exec_info["Signal"].set_result(signal)
+                return 0
+        self._frame(writer, f"kill: ({pid}) - No such process\n", 2)
+        return 1
+
+    async def _fake_add_account(self, exec_info: Dict, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> int:
+        """模拟bot的 --add-account 流程"""
+        self._frame(writer, "Adding a new account. Do you want to continue? (Y/n)\n")
+        await writer.drain()
+        answer = await reader.readline()
+        if answer.strip().upper() not in (b"", b"Y"):
+            self._frame(writer, "Aborted.\n", 2)
+            return 1
+        code = f"{int(time.time()) % 100000000:08d}"
+        self._frame(writer, "Please go to:\n")
+        self._frame(writer, f"https://www.twitch.tv/activate?device-code={code} and enter the code: {code}\n")
+        self._frame(writer, "Waiting for authorization...\n")
+        await writer.drain()
+        if self.authorize_after is not None:
+            await asyncio.sleep(self.authorize_after)
+            if self.on_account_added is not None:
+                self.on_account_added()
+            self._frame(writer, "Account added.\n")
+            return 0
+        # 等待客户端关闭stdin（模拟用户完成授权前bot一直等待）或收到信号
+        eof = asyncio.ensure_future(reader.read())
+        signal = asyncio.ensure_future(self._wait_signal(exec_info))
+        done, _ = await asyncio.wait({eof, signal}, return_when=asyncio.FIRST_COMPLETED)
+        if signal in done:
+            eof.cancel()
+            return signal.result()
+        signal.cancel()
+        if self.hang_on_stdin_close:
+            return await self._wait_signal(exec_info)
+        self._frame(writer, "Account added.\n")
+        return 0
+
+
+async def _main(socket_path: str):
+    server = FakeDockerServer(socket_path)
+    await server.start()
+    print(f"[FakeDocker] 监听 {socket_path}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "/tmp/docker.sock"))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,141 @@
+"""本地模拟webhook接收端（HTTP） - 在开发环境中调试通知发送、摘要合并和失败重试，也用于测试
+
+收到的请求体打印到标准输出，并保存在内存中（GET /received 查看）。
+可以模拟接收端故障：--fail N 让前N个请求返回500，--rate-limit N 让前N个请求返回429（带Retry-After），
+--delay 秒 让每个请求延迟响应（观察每个地址的并发限制）。
+
+用法:
+    python -m tests.fakes.fake_webhook --port 9009 --fail 2
+    # .env 中设置 WEBHOOK_URLS=["http://127.0.0.1:9009/hook"]
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+REASONS = {200: "OK", 204: "No Content", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class FakeWebhookServer:
+    """模拟的webhook接收端"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9009, fail: int = 0, rate_limit: int = 0,
+                 delay: float = 0.0, retry_after: int = 1):
+        self.host = host
+        self.port = port
+        self.fail = fail
+        self.rate_limit = rate_limit
+        self.delay = delay
+        self.retry_after = retry_after
+        self._server: Optional[asyncio.AbstractServer] = None
+        # 成功接收的请求 [{"at", "path", "body"}]
+        self.received: List[Dict] = []
+        # 所有请求的响应状态码（按到达顺序）
+        self.statuses: List[int] = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @staticmethod
+    def _response(writer: asyncio.StreamWriter, status: int, body=None, headers: Optional[Dict] = None):
+        payload = b"" if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        extra = "".join(f"{key}: {value}\r\n" for key, value in (headers or {}).items())
+        writer.write((
+            f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"{extra}"
+            "\r\n"
+        ).encode("ascii") + payload)
+
+    def _next_status(self) -> int:
+        index = len(self.statuses)
+        if index < self.rate_limit:
+            return 429
+        if index < self.rate_limit + self.fail:
+            return 500
+        return 204
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                raw = await reader.readexactly(length) if length else b""
+
+                if method == "GET" and path == "/received":
+                    self._response(writer, 200, {"received": self.received, "statuses": self.statuses,
+                                                 "max_concurrent": self.max_concurrent})
+                    await writer.drain()
+                    continue
+                if method != "POST":
+                    self._response(writer, 404, {"message": "not found"})
+                    await writer.drain()
+                    continue
+
+                self.concurrent += 1
+                self.max_concurrent = max(self.max_concurrent, self.concurrent)
+                try:
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    status = self._next_status()
+                    self.statuses.append(status)
+                finally:
+                    self.concurrent -= 1
+                if status == 429:
+                    self._response(writer, 429, {"message": "rate limited", "retry_after": self.retry_after},
+                                   {"Retry-After": str(self.retry_after)})
+                elif status >= 500:
+                    self._response(writer, status, {"message": "simulated failure"})
+                else:
+                    body = json.loads(raw) if raw else None
+                    self.received.append({"at": datetime.now(timezone.utc).isoformat(), "path": path, "body": body})
+                    print(f"[FakeWebhook] {path}: {json.dumps(body, ensure_ascii=False)}")
+                    self._response(writer, status)
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+async def _main(args: argparse.Namespace):
+    server = FakeWebhookServer(args.host, args.port, args.fail, args.rate_limit, args.delay, args.retry_after)
+    await server.start()
+    print(f"[FakeWebhook] 监听 http://{args.host}:{args.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟webhook接收端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9009)
+    parser.add_argument("--fail", type=int, default=0, help="前N个请求返回500")
+    parser.add_argument("--rate-limit", type=int, default=0, help="前N个请求返回429")
+    parser.add_argument("--retry-after", type=int, default=1, help="429响应的Retry-After（秒）")
+    parser.add_argument("--delay", type=float, default=0.0, help="每个请求延迟响应的秒数")
+    try:
+        asyncio.run(_main(parser.parse_args(sys.argv[1:])))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,98 @@
+"""添加账号任务测试（使用模拟Docker守护进程）"""
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.services import add_account_jobs as jobs_module
+from app.services.add_account_jobs import AddAccountJobManager, CANCELLED, COMPLETED, WAITING_AUTH
+from app.services.config_service import config_service
+from app.services.docker_service import docker_service
+from app.utils.docker_client import DockerClient
+from tests.fakes.fake_docker import FakeDockerServer
+
+
+@pytest.fixture
+def patched(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "add_account_kill_grace", 0.3)
+    monkeypatch.setattr(config_service, "get_config", lambda: {"Users": []})
+    monkeypatch.setattr(docker_service, "client", DockerClient(str(tmp_path / "docker.sock"), timeout=5))
+    return str(tmp_path / "docker.sock")
+
+
+async def _run_job(socket_path: str, **server_options):
+    server = FakeDockerServer(socket_path, **server_options)
+    await server.start()
+    manager = AddAccountJobManager()
+    try:
+        job = await manager.start_job(wait=5)
+        assert job.status == WAITING_AUTH
+        assert job.pid is not None
+        # PID标记行不进入输出
+        assert not any(line.startswith(jobs_module.PID_MARKER) for line in job.output)
+        manager.cancel_job(job.id)
+        await job.task
+        bot_exec = server.execs[job.exec_id]
+        kills = [info["Cmd"] for info in server.execs.values() if info["Cmd"][:1] == ["kill"]]
+        return job, bot_exec, kills
+    finally:
+        await docker_service.client.close()
+        await server.stop()
+
+
+def test_cancel_exits_with_stdin(patched):
+    job, bot_exec, kills = asyncio.run(_run_job(patched))
+    assert job.status == CANCELLED
+    assert not bot_exec["Running"]
+    assert kills == []
+
+
+def test_cancel_terminates_hanging_bot(patched):
+    job, bot_exec, kills = asyncio.run(_run_job(patched, hang_on_stdin_close=True))
+    assert not bot_exec["Running"]
+    assert job.exit_code == 143
+    assert kills == [["kill", "-TERM", str(job.pid)]]
+
+
+def test_cancel_kills_bot_ignoring_term(patched):
+    job, bot_exec, kills = asyncio.run(_run_job(patched, hang_on_stdin_close=True, ignore_term=True))
+    assert not bot_exec["Running"]
+    assert job.exit_code == 137
+    assert kills == [["kill", "-TERM", str(job.pid)], ["kill", "-KILL", str(job.pid)]]
+
+
+def test_bot_exit_after_writing_config_completes(monkeypatch, tmp_path):
+    """bot写入新账号后立即退出：不等待配置监视，任务也应完成"""
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"Users": [{"Login": "old_user", "Id": "1"}]}))
+    monkeypatch.setattr(settings, "add_account_kill_grace", 0.3)
+    monkeypatch.setattr(settings, "shard_count", 0)
+    monkeypatch.setattr(config_service, "config_path", config_path)
+    monkeypatch.setattr(config_service, "_cache", None)
+    monkeypatch.setattr(config_service, "_last_modified", 0)
+    monkeypatch.setattr(config_service, "_listeners", [])
+    socket_path = str(tmp_path / "docker.sock")
+    monkeypatch.setattr(docker_service, "client", DockerClient(socket_path, timeout=5))
+
+    def add_user():
+        config = json.loads(config_path.read_text())
+        config["Users"].append({"Login": "new_user", "Id": "2"})
+        config_path.write_text(json.dumps(config))
+
+    async def run():
+        server = FakeDockerServer(socket_path, authorize_after=0.2, on_account_added=add_user)
+        await server.start()
+        manager = AddAccountJobManager()
+        try:
+            job = await manager.start_job(wait=5)
+            await job.task
+            return job
+        finally:
+            await docker_service.client.close()
+            await server.stop()
+
+    job = asyncio.run(run())
+    assert job.status == COMPLETED
+    assert job.added_login == "new_user"
+    assert job.exit_code == 0
@@ -0,0 +1,49 @@
+"""日志归档测试"""
+import gzip
+
+from app.services import scheduler_service as scheduler_module
+from app.services.bot_monitor import bot_monitor
+from app.services.scheduler_service import SchedulerService
+
+
+def test_lines_appended_while_archiving_are_kept(monkeypatch, tmp_path):
+    log = tmp_path / "u1.txt"
+    log.write_bytes(b"".join(f"line {i:04d}\n".encode() for i in range(200)))
+    monkeypatch.setattr(bot_monitor, "log_directories", lambda: [tmp_path])
+
+    # bot在移动保留部分之后、截断之前追加了新行
+    appended = []
+
+    class AppendingFile:
+        def __init__(self, f):
+            self._f = f
+
+        def __getattr__(self, name):
+            return getattr(self._f, name)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return self._f.__exit__(*exc)
+
+        def write(self, data):
+            written = self._f.write(data)
+            if len(appended) < 2:
+                line = f"late {len(appended)}\n".encode()
+                with open(log, "ab") as other:
+                    other.write(line)
+                appended.append(line)
+            return written
+
+    monkeypatch.setattr(scheduler_module, "open", lambda *args: AppendingFile(open(*args)), raising=False)
+    SchedulerService._archive_logs(max_bytes=1000, keep_bytes=500, retention_days=7)
+    monkeypatch.delattr(scheduler_module, "open")
+
+    archives = list((tmp_path / "archive").glob("*.gz"))
+    assert len(archives) == 1
+    archived = gzip.decompress(archives[0].read_bytes())
+    kept = log.read_bytes()
+    expected = b"".join(f"line {i:04d}\n".encode() for i in range(200)) + b"".join(appended)
+    assert archived + kept == expected
+    assert kept.startswith(b"line ") and len(kept) < 600
@@ -0,0 +1,77 @@
+"""分片模式配置同步测试"""
+import json
+import os
+
+import pytest
+
+from app.config import settings
+from app.services.config_service import ConfigService
+
+
+def _user(login: str, secret: str = "s1", enabled: bool = True) -> dict:
+    return {"Login": login, "Id": login, "ClientSecret": secret, "UniqueId": f"{login}-uid",
+            "Enabled": enabled, "FavouriteGames": []}
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "config_file_path", str(tmp_path / "config.json"))
+    monkeypatch.setattr(settings, "shards_directory", str(tmp_path / "shards"))
+    monkeypatch.setattr(settings, "shard_count", 2)
+    monkeypatch.setattr(settings, "shard_max_accounts", 0)
+    (tmp_path / "config.json").write_text(json.dumps({"Users": [_user("a"), _user("b")], "LogLevel": 1}))
+    service = ConfigService()
+    service.get_config()
+    return service
+
+
+def _bot_writes(service: ConfigService, shard: int, update):
+    """模拟分片中的bot改写自己的配置文件"""
+    path = service.shard_config_path(shard)
+    data = json.loads(path.read_text())
+    update(data)
+    path.write_text(json.dumps(data))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_shard_credentials_are_merged_back(service):
+    shard = service.get_user_shard("a")
+
+    def refresh(data):
+        for user in data["Users"]:
+            if user["Login"] == "a":
+                user.update(ClientSecret="s2", UniqueId="new-uid", Enabled=False)
+    _bot_writes(service, shard, refresh)
+
+    # 主配置的修改触发重新生成分片配置：先合并分片的修改，再写出
+    assert service.update_user_favourite_games("b", ["Game"])
+    master = {user["Login"]: user for user in service.get_local_users()}
+    assert master["a"]["ClientSecret"] == "s2" and master["a"]["UniqueId"] == "new-uid"
+    # Enabled由主配置管理
+    assert master["a"]["Enabled"] is True
+    assert master["b"]["FavouriteGames"] == ["Game"]
+    shard_users = {user["Login"]: user for user in json.loads(service.shard_config_path(shard).read_text())["Users"]}
+    assert shard_users["a"]["ClientSecret"] == "s2"
+    assert shard_users["a"]["Enabled"] is True
+
+
+def test_new_shard_account_is_imported(service):
+    _bot_writes(service, 1, lambda data: data["Users"].append(_user("c")))
+    service._check_for_changes()
+    assert [user["Login"] for user in service.get_local_users()] == ["a", "b", "c"]
+    assert service.get_user_shard("c") == 1
+
+
+def test_stale_copy_after_move_is_not_merged(service):
+    shard = service.get_user_shard("a")
+    other = 1 - shard
+    assert service.move_user_to_shard("a", other)
+
+    # 原分片的bot在重启前写出了旧副本
+    def stale(data):
+        data["Users"].append(_user("a", secret="old"))
+    _bot_writes(service, shard, stale)
+    service._check_for_changes()
+    master = {user["Login"]: user for user in service.get_local_users()}
+    assert master["a"]["ClientSecret"] == "s1"
@@ -0,0 +1,32 @@
+"""Cron表达式解析测试"""
+from datetime import datetime
+
+import pytest
+
+from app.utils.cron import CronError, CronExpression
+
+
+@pytest.mark.parametrize("weekday, expected", [
+    ("5-7", {5, 6, 0}),
+    ("fri-sun", {5, 6, 0}),
+    ("0-7", {0, 1, 2, 3, 4, 5, 6}),
+    ("1-7/2", {1, 3, 5, 0}),
+    ("2-7/2", {2, 4, 6}),
+    ("1-5", {1, 2, 3, 4, 5}),
+    ("7", {0}),
+    ("sat,sun", {6, 0}),
+])
+def test_weekday_ranges(weekday, expected):
+    assert CronExpression(f"0 4 * * {weekday}").weekdays == expected
+
+
+def test_weekend_range_includes_sunday():
+    cron = CronExpression("0 4 * * 5-7")
+    # 2026-10-17是周六，下一次应是周日而不是下周五
+    assert cron.next_after(datetime(2026, 10, 17, 5, 0)) == datetime(2026, 10, 18, 4, 0)
+
+
+@pytest.mark.parametrize("expression", ["0 4 * * 8", "0 4 * * 3-1", "0 24 * * *", "0 4 * *", "*/0 * * * *"])
+def test_invalid_expressions(expression):
+    with pytest.raises(CronError):
+        CronExpression(expression)
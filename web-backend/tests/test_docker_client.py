@@ -0,0 +1,150 @@
+"""DockerClient测试（unix socket上的模拟Docker守护进程）"""
+import asyncio
+import struct
+
+import pytest
+
+from app.utils.docker_client import STDERR, STDOUT, DockerAPIError, DockerClient, ExecStream
+from tests.fakes.fake_docker import FakeDockerServer
+
+
+def _frame(stream_type: int, data: bytes) -> bytes:
+    return struct.pack(">BxxxL", stream_type, len(data)) + data
+
+
+class _NullWriter:
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def _stream(payload: bytes, tty: bool = False) -> ExecStream:
+    reader = asyncio.StreamReader()
+    reader.feed_data(payload)
+    reader.feed_eof()
+    return ExecStream(reader, _NullWriter(), tty)
+
+
+def test_demux_frames():
+    async def run():
+        stream = _stream(
+            _frame(STDOUT, b"hel") + _frame(STDERR, b"lo\nwor") + _frame(STDOUT, b"")
+            + _frame(STDOUT, b"ld\r\nlast")
+        )
+        assert await stream.read_frame() == (STDOUT, b"hel")
+        assert [line async for line in stream.lines()] == ["lo", "world", "last"]
+
+        stream = _stream(_frame(STDOUT, b"a\nb\n"))
+        assert [line async for line in stream.lines()] == ["a", "b"]
+
+        # 帧被截断时视为流结束
+        stream = _stream(_frame(STDOUT, b"complete\n")[:-3])
+        assert await stream.readline() is None
+
+        stream = _stream(b"raw tty\noutput", tty=True)
+        assert [line async for line in stream.lines()] == ["raw tty", "output"]
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def docker(tmp_path):
+    """返回运行模拟守护进程并调用fn(server, client)的函数"""
+    socket_path = str(tmp_path / "docker.sock")
+
+    def run(fn, **server_options):
+        async def main():
+            server = FakeDockerServer(socket_path, **server_options)
+            await server.start()
+            client = DockerClient(socket_path, timeout=5)
+            try:
+                return await fn(server, client)
+            finally:
+                await client.close()
+                await server.stop()
+        return asyncio.run(main())
+
+    return run
+
+
+def test_ping(docker):
+    async def fn(server, client):
+        assert await client.ping()
+    docker(fn)
+
+
+def test_find_compose_container(docker):
+    async def fn(server, client):
+        stopped = server.add_container("drop", project="other")
+        stopped["State"] = "exited"
+        other = server.add_container("drop", project="other")
+        default = next(c for c in server.containers.values()
+                       if c["Labels"]["com.docker.compose.project"] == "twitch"
+                       and c["Labels"]["com.docker.compose.service"] == "drop")
+
+        found = await client.find_compose_container("drop", "twitch")
+        assert found["Id"] == default["Id"]
+        # 同一项目有多个容器时优先返回运行中的
+        default["State"] = "exited"
+        found = await client.find_compose_container("drop", "other")
+        assert found["Id"] == other["Id"]
+        assert await client.find_compose_container("missing") is None
+        assert len(await client.list_containers({"com.docker.compose.service": "drop"})) == 1
+        assert len(await client.list_containers({"com.docker.compose.service": "drop"}, all=True)) == 3
+    docker(fn)
+
+
+def test_restart_and_inspect(docker):
+    async def fn(server, client):
+        container = await client.find_compose_container("drop", "twitch")
+        before = await client.inspect_container(container["Id"])
+        await client.restart_container(container["Id"], timeout=1)
+        after = await client.inspect_container(container["Id"])
+        assert after["RestartCount"] == before["RestartCount"] + 1
+        assert after["State"]["Running"]
+        with pytest.raises(DockerAPIError) as error:
+            await client.inspect_container("missing")
+        assert error.value.status_code == 404
+    docker(fn, restart_delay=0.01)
+
+
+def test_stats(docker):
+    async def fn(server, client):
+        container = await client.find_compose_container("drop", "twitch")
+        stats = await client.stats(container["Id"])
+        assert stats["memory_stats"]["usage"] > 0
+        assert stats["cpu_stats"]["cpu_usage"]["total_usage"] > stats["precpu_stats"]["cpu_usage"]["total_usage"]
+
+        samples = []
+        async for sample in client.stats_stream(container["Id"]):
+            samples.append(sample)
+            if len(samples) == 3:
+                break
+        totals = [sample["cpu_stats"]["cpu_usage"]["total_usage"] for sample in samples]
+        assert totals == sorted(totals) and len(set(totals)) == 3
+    docker(fn, stats_interval=0.01)
+
+
+def test_exec_roundtrip(docker):
+    async def fn(server, client):
+        container = await client.find_compose_container("drop", "twitch")
+        exec_id = await client.exec_create(container["Id"], ["cat", "-"], stdin=True)
+        stream = await client.exec_start(exec_id)
+        assert await stream.readline() == "cat -"
+        await stream.write(b"hello\n")
+        assert await stream.readline() == "hello"
+        stream.close_stdin()
+        assert await stream.readline() is None
+        await stream.close()
+        for _ in range(50):
+            info = await client.exec_inspect(exec_id)
+            if not info["Running"]:
+                break
+            await asyncio.sleep(0.02)
+        assert info["ExitCode"] == 0
+
+        with pytest.raises(DockerAPIError):
+            await client.exec_start("missing")
+    docker(fn)
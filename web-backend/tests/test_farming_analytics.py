@@ -0,0 +1,57 @@
+"""挂宝时间归属测试"""
+from datetime import datetime, timedelta
+
+from app.services.bot_monitor import bot_monitor
+from app.services.farming_analytics import FarmingAnalytics
+
+WATCHING_LINE = "Current drop campaign: Winter Drops (Game A), watching streamer | 1"
+CHECKING_LINE = "Checking Game B (Spring Drops - #2/5)..."
+
+
+def _summary(status: str, at: datetime, progress=None) -> dict:
+    return {
+        "status": status,
+        "last_update": at.isoformat(),
+        "campaign": {"game": "Game A", "campaign": "Winter Drops"},
+        "progress": progress
+    }
+
+
+def test_summary_keeps_watched_campaign():
+    """状态摘要中的Campaign仍是正在观看的Campaign（之后出现Checking行也不变）"""
+    assert bot_monitor._extract_campaign_info([WATCHING_LINE, CHECKING_LINE]) == {
+        "game": "Game A", "campaign": "Winter Drops"
+    }
+
+
+def test_seeking_time_goes_to_checked_campaign(monkeypatch):
+    history = {"u1": [WATCHING_LINE]}
+    monkeypatch.setattr(bot_monitor, "get_recent_messages", lambda login, limit=20: history.get(login, [])[-limit:])
+    analytics = FarmingAnalytics()
+    start = datetime(2026, 10, 19, 10, 0).astimezone()
+
+    analytics.on_status_change("u1", None, _summary("Watching", start, {"current": 10, "required": 60}))
+    history["u1"].append(CHECKING_LINE)
+    analytics.on_status_change("u1", None, _summary("Seeking", start + timedelta(minutes=5)))
+    analytics.on_status_change("u1", None, _summary("Seeking", start + timedelta(minutes=8)))
+    # 重新开始观看：之后的Seeking没有新的Checking行，归属回观看的Campaign
+    history["u1"].append(WATCHING_LINE)
+    analytics.on_status_change("u1", None, _summary("Watching", start + timedelta(minutes=10), {"current": 12, "required": 60}))
+
+    totals = {}
+    for (_, login, game, campaign), values in analytics._buckets.items():
+        for column in ("watching_seconds", "seeking_seconds"):
+            totals[(game, campaign, column)] = totals.get((game, campaign, column), 0) + values[column]
+    assert totals[("Game A", "Winter Drops", "watching_seconds")] == 300
+    assert totals[("Game B", "Spring Drops", "seeking_seconds")] == 300
+    assert totals.get(("Game A", "Winter Drops", "seeking_seconds"), 0) == 0
+
+
+def test_favourite_games_reads_global_only_favourite(monkeypatch, database, run_async):
+    from app.services.config_service import config_service
+
+    monkeypatch.setattr(config_service, "get_config", lambda: {"OnlyFavouriteGames": True, "Users": []})
+    monkeypatch.setattr(config_service, "get_users", lambda: [{"Login": "u1", "FavouriteGames": ["Game A"]}])
+    report = run_async(lambda: FarmingAnalytics().favourite_games(24))
+    assert report["only_favourite_games"] is True
+    assert [account["only_favourite_games"] for account in report["accounts"]] == [True]
@@ -0,0 +1,25 @@
+"""内存诊断测试"""
+from datetime import datetime
+
+from app.services.account_watchdog import account_watchdog
+from app.services.bot_monitor import bot_monitor
+from app.services.config_service import config_service
+from app.services.farming_analytics import farming_analytics
+from app.services.memory_inspector import memory_inspector
+from app.services.progress_tracker import progress_tracker
+
+
+def test_evict_stale_cleans_every_service(monkeypatch):
+    monkeypatch.setattr(config_service, "get_users", lambda: [{"Login": "kept"}])
+    for login in ("kept", "ghost"):
+        bot_monitor._summaries[login] = {"status": "Idle"}
+        progress_tracker._state[login] = {}
+        account_watchdog._state[login] = {}
+        farming_analytics.on_status_change(login, None, {
+            "status": "Idle", "last_update": datetime.now().astimezone().isoformat()
+        })
+
+    assert memory_inspector.evict_stale() == ["ghost"]
+    for state in (bot_monitor._summaries, progress_tracker._state, account_watchdog._state, farming_analytics._open):
+        assert "ghost" not in state
+        assert "kept" in state
@@ -0,0 +1,113 @@
+"""Webhook通知管道测试（本地模拟接收端）"""
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.notification import NotificationOutbox
+from app.services.config_service import config_service
+from app.services.notifier import TEST, notifier
+from tests.fakes.fake_webhook import FakeWebhookServer
+
+PORT = 9391
+
+
+@pytest.fixture
+def webhook(monkeypatch, database, run_async):
+    """返回运行模拟接收端和通知管道并调用fn(server)的函数"""
+    monkeypatch.setattr(config_service, "get_config", lambda: {})
+    monkeypatch.setattr(settings, "webhook_urls", [f"http://127.0.0.1:{PORT}/hook"])
+    monkeypatch.setattr(settings, "webhook_digest_window", 0.3)
+    monkeypatch.setattr(settings, "webhook_poll_interval", 0.05)
+    monkeypatch.setattr(settings, "webhook_backoff_base", 0.2)
+    monkeypatch.setattr(settings, "webhook_endpoint_concurrency", 1)
+
+    def run(fn, **server_options):
+        async def main():
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(NotificationOutbox))
+                await db.commit()
+            server = FakeWebhookServer(port=PORT, **server_options)
+            await server.start()
+            notifier._inflight.clear()
+            notifier._endpoint_stats.clear()
+            notifier.start()
+            try:
+                return await fn(server)
+            finally:
+                await notifier.stop()
+                await server.stop()
+        return run_async(main)
+
+    return run
+
+
+async def _wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        await asyncio.sleep(0.02)
+
+
+async def _outbox():
+    async with AsyncSessionLocal() as db:
+        return (await db.scalars(select(NotificationOutbox).order_by(NotificationOutbox.id))).all()
+
+
+def _notify(count: int):
+    for index in range(count):
+        notifier.notify(TEST, "测试", f"第{index}条", dedup_key=f"test:{index}:{time.monotonic()}")
+
+
+def test_digest_merges_notifications(webhook):
+    async def fn(server):
+        _notify(3)
+        await _wait_for(lambda: server.received)
+        await asyncio.sleep(0.3)
+        assert len(server.received) == 1
+        body = server.received[0]["body"]
+        assert body["type"] == "digest" and body["count"] == 3
+        assert [event["message"] for event in body["events"]] == ["第0条", "第1条", "第2条"]
+        rows = await _outbox()
+        assert [(row.status, row.attempts) for row in rows] == [("sent", 1)] * 3
+    webhook(fn)
+
+
+def test_failed_delivery_backs_off_and_retries(webhook):
+    async def fn(server):
+        _notify(1)
+        started = time.monotonic()
+        await _wait_for(lambda: server.received)
+        # 合并窗口0.3秒 + 第一次重试的退避（0.2秒 ±20%）
+        assert time.monotonic() - started >= 0.3 + 0.16
+        assert server.statuses == [500, 204]
+        rows = await _outbox()
+        assert [(row.status, row.attempts) for row in rows] == [("sent", 2)]
+    webhook(fn, fail=1)
+
+
+def test_rate_limit_honours_retry_after(webhook):
+    async def fn(server):
+        _notify(1)
+        await _wait_for(lambda: server.statuses)
+        rejected_at = time.monotonic()
+        await _wait_for(lambda: server.received)
+        # Retry-After（1秒）大于退避时间，以Retry-After为准
+        assert time.monotonic() - rejected_at >= 0.9
+        assert server.statuses == [429, 204]
+    webhook(fn, rate_limit=1, retry_after=1)
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_endpoint_concurrency_limit(webhook, monkeypatch, concurrency):
+    monkeypatch.setattr(settings, "webhook_endpoint_concurrency", concurrency)
+    monkeypatch.setattr(settings, "webhook_digest_max", 1)
+
+    async def fn(server):
+        _notify(4)
+        await _wait_for(lambda: len(server.received) == 4)
+        assert server.max_concurrent == concurrency
+    webhook(fn, delay=0.2)
@@ -0,0 +1,30 @@
+"""重启窗口测试：账号进度取自状态缓存"""
+from datetime import datetime, timezone
+
+from app.services.bot_monitor import bot_monitor
+from app.services.config_service import config_service
+from app.services.restart_window import RestartWindowPlanner
+
+
+def test_watching_accounts_use_cached_summary(monkeypatch):
+    now = datetime.now(timezone.utc)
+    watching = {
+        "status": "Watching",
+        "last_update": now.isoformat(),
+        "progress": {"current": 10, "required": 60}
+    }
+    monkeypatch.setattr(config_service, "get_local_users",
+                        lambda: [{"Login": "cached"}, {"Login": "unread"}])
+    monkeypatch.setattr(bot_monitor, "_summaries", {"cached": dict(watching)})
+    reads = []
+
+    def get_user_status(login):
+        reads.append(login)
+        return dict(watching)
+
+    monkeypatch.setattr(bot_monitor, "get_user_status", get_user_status)
+
+    accounts = RestartWindowPlanner()._watching_accounts(now)
+    assert sorted(accounts) == ["cached", "unread"]
+    # 只有没有缓存状态的账号读取日志
+    assert reads == ["unread"]
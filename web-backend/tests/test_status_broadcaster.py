@@ -0,0 +1,69 @@
+"""状态广播测试：变化事件立即触发广播周期"""
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.services.bot_monitor import bot_monitor
+from app.services.config_service import config_service
+from app.services.status_broadcaster import StatusBroadcaster
+
+
+@pytest.fixture
+def broadcaster(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "ws_broadcast_min_interval", 0.05)
+    monkeypatch.setattr(bot_monitor, "log_directories", lambda: [tmp_path])
+    broadcaster = StatusBroadcaster()
+    broadcaster.interval = 30
+    broadcaster.ticks = 0
+
+    def compute():
+        broadcaster.ticks += 1
+        # 周期内读取日志时产生的状态变化不应再触发周期
+        broadcaster._on_status_change("u1", None, {})
+        return {}
+
+    monkeypatch.setattr(broadcaster, "compute_fleet_status", compute)
+    yield broadcaster
+    config_service.remove_listener(broadcaster._on_config_change)
+    if broadcaster._on_status_change in bot_monitor._listeners:
+        bot_monitor._listeners.remove(broadcaster._on_status_change)
+
+
+async def _wait_ticks(broadcaster, count: int, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while broadcaster.ticks < count:
+        assert time.monotonic() < deadline, f"只执行了 {broadcaster.ticks} 个周期"
+        await asyncio.sleep(0.01)
+
+
+def test_change_events_trigger_tick(broadcaster, tmp_path):
+    async def run():
+        broadcaster.start()
+        try:
+            await _wait_ticks(broadcaster, 1)
+            await asyncio.sleep(0.2)
+            assert broadcaster.ticks == 1
+
+            # 配置变化
+            assert broadcaster._on_config_change in config_service._listeners
+            for callback in list(config_service._listeners):
+                if callback == broadcaster._on_config_change:
+                    callback({})
+            await _wait_ticks(broadcaster, 2)
+
+            # 其他途径读取到的状态变化
+            for callback in list(bot_monitor._listeners):
+                if callback == broadcaster._on_status_change:
+                    callback("u1", None, {"status": "Watching"})
+            await _wait_ticks(broadcaster, 3)
+
+            # 日志文件写入（watchdog文件事件）
+            if broadcaster._observer is not None:
+                (tmp_path / "u1.txt").write_text("line\n")
+                await _wait_ticks(broadcaster, 4)
+        finally:
+            broadcaster.stop()
+
+    asyncio.run(run())